@@ -0,0 +1,104 @@
+"""
+Description: Index of the metadata of the actions of a contract (containers, execution commands and limits, carbon
+emission and energy consumption limits, datetime constraints and dependencies), built with one pass over the graph.
+Each map goes from the rdf:value of an action to the rows that the SPARQL query of the matching ContractParser getter
+returns for it, as tuples of nodes in the order of its SELECT clause, so the getters convert rows from either source
+in the same way.
+
+Contributors:
+
+"""
+from rdflib import Namespace, URIRef
+from rdflib.namespace import RDF
+
+ODRL = Namespace("http://www.w3.org/ns/odrl/2/")
+UPCAST = Namespace("https://www.upcast-project.eu/upcast-vocab/1.0/")
+
+POLICY_TYPES = (ODRL.Agreement, ODRL.Policy, ODRL.Set, ODRL.Offer)
+
+# Maps of ActionMetadataIndex, which are also the names of the queries of ContractParser.ACTION_QUERIES.
+ACTION_METADATA = ("containers", "execution_commands", "execution_limits", "carbon_emission_limits",
+                   "energy_consumption_limits", "datetime_constraints", "dependencies")
+
+
+class ActionMetadataIndex:
+    def __init__(self, graph):
+        """
+        Initializes an ActionMetadataIndex instance by reading the action metadata of a graph.
+
+        :param graph: An rdflib graph containing a contract.
+        """
+        self.graph = graph
+        for name in ACTION_METADATA:
+            setattr(self, name, dict())
+        # The action values of each action node, as matched by the queries, which bind them to IRIs.
+        self._values = dict()
+        for action, value in graph.subject_objects(RDF.value):
+            if isinstance(value, URIRef):
+                self._values.setdefault(action, []).append(str(value))
+        for action, values in self._values.items():
+            self._index_refinements(action, values)
+            self._index_constraints(action, values)
+        for policy_type in POLICY_TYPES:
+            for policy in graph.subjects(RDF.type, policy_type):
+                self._index_rules(policy)
+
+    def rows(self, name, action_value):
+        """
+        :param name: The name of a map, one of ACTION_METADATA.
+        :param action_value: The name of an action, as a string or IRI.
+        :return: The rows of the action in the map, an empty list if there are none.
+        """
+        return getattr(self, name).get(str(URIRef(action_value)), [])
+
+    def _add(self, name, values, row):
+        rows = getattr(self, name)
+        for value in values:
+            rows.setdefault(value, []).append(row)
+
+    def _operands(self, node):
+        for left_operand in self.graph.objects(node, ODRL.leftOperand):
+            for operator in self.graph.objects(node, ODRL.operator):
+                for right_operand in self.graph.objects(node, ODRL.rightOperand):
+                    yield left_operand, operator, right_operand
+
+    def _index_refinements(self, action, values):
+        for refinement in self.graph.objects(action, ODRL.refinement):
+            for left_operand, operator, right_operand in self._operands(refinement):
+                if left_operand == UPCAST.implementedBy and operator == ODRL.eq:
+                    self._add("containers", values, (right_operand,))
+                elif left_operand == UPCAST.executionCommand and operator == ODRL.eq:
+                    self._add("execution_commands", values, (right_operand,))
+                if left_operand == ODRL["count"]:
+                    self._add("execution_limits", values, (operator, right_operand))
+
+    def _index_constraints(self, action, values):
+        for constraint in self.graph.objects(action, ODRL.constraint):
+            for left_operand, operator, right_operand in self._operands(constraint):
+                if operator != ODRL.lteq:
+                    continue
+                if left_operand == UPCAST.operationCarbonEmission:
+                    name = "carbon_emission_limits"
+                elif left_operand == UPCAST.operationEnergyConsumption:
+                    name = "energy_consumption_limits"
+                else:
+                    continue
+                for unit in self.graph.objects(constraint, ODRL.unit):
+                    self._add(name, values, (right_operand, unit))
+
+    def _index_rules(self, policy):
+        for rule, rule_node in self.graph.predicate_objects(policy):
+            for action in self.graph.objects(rule_node, ODRL.action):
+                values = self._values.get(action)
+                if values is None:
+                    continue
+                for constraint in self.graph.objects(rule_node, ODRL.constraint):
+                    for left_operand, operator, right_operand in self._operands(constraint):
+                        if left_operand == ODRL.dateTime:
+                            self._add("datetime_constraints", values, (rule, operator, right_operand))
+                if rule == ODRL.permission:
+                    # The permission, and not its action, has the duties.
+                    for duty in self.graph.objects(rule_node, ODRL.duty):
+                        for dependency in self.graph.objects(duty, ODRL.action):
+                            for dependency_value in self.graph.objects(dependency, RDF.value):
+                                self._add("dependencies", values, (dependency_value,))
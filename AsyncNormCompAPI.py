@@ -0,0 +1,88 @@
+"""
+Description: asyncio versions of the NormCompAPI functions, for callers such as asyncio web services. Loading, parsing,
+normalising and comparing policies run in an executor, so they never block the event loop, and the policies of a
+request are loaded and normalised concurrently.
+
+By default, the default executor of the event loop (a thread pool) is used. A ProcessPoolExecutor can be given to
+parse and normalise policies in parallel.
+
+Contributors:
+
+"""
+import asyncio
+
+import Utils
+from NormCompAPI import (_compare_normal_policies, _load_policy, _load_values, _normalise_for_comparison,
+                         _normalise_policy)
+
+
+async def _run(executor, function, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+
+async def compare(policy_1, policy_2, mode="grid", executor=None):
+    """
+    Computes the overlap between two policies, and two-way containment, as NormCompAPI.compare.
+    Both policies are loaded, and then normalised, concurrently, with one value map.
+    :param policy_1: an rdflib graph object, or an RDF file, containing a single ODRL policy
+    :param policy_2: an rdflib graph object, or an RDF file, containing a single ODRL policy
+    :param mode: 'grid' or 'box', as in PolicyComparer.compare
+    :param executor: the executor that runs the work, by default the one of the event loop
+    :return: a tuple (overlap, True if policy_1 is contained in policy_2, True if policy_2 is contained in policy_1)
+    """
+    if mode not in ("grid", "box"):
+        raise ValueError(f"Unknown comparison mode {mode}.")
+    (values_1, loaded_1), (values_2, loaded_2) = await asyncio.gather(_run(executor, _load_policy, policy_1),
+                                                                      _run(executor, _load_policy, policy_2))
+    value_map = Utils.merge_key_multisets(dict(values_1), values_2)
+    normal_policy_1, normal_policy_2 = await asyncio.gather(
+        _run(executor, _normalise_for_comparison, loaded_1, value_map, mode),
+        _run(executor, _normalise_for_comparison, loaded_2, value_map, mode))
+    return await _run(executor, _compare_normal_policies, normal_policy_1, normal_policy_2, mode)
+
+
+async def contains(policy_1, policy_2, executor=None):
+    """
+    Check if the first policy contains the second
+    :return: True if policy_1 contains policy_2, else False
+    """
+    overlap, contained_1, contained_2 = await compare(policy_1, policy_2, executor=executor)
+    return contained_2
+
+
+async def equals(policy_1, policy_2, executor=None):
+    """
+    Check if the two policies are identical. Both directions are checked with a single comparison, so each policy is
+    loaded and normalised once.
+    :return: True if policy_1 is semantically equivalent to policy_2, else False
+    """
+    overlap, contained_1, contained_2 = await compare(policy_1, policy_2, executor=executor)
+    return contained_1 and contained_2
+
+
+async def normalise_policies(graphs, only_first=False, executor=None, as_graphs=True):
+    """
+    Normalise a list of ODRL policies with respect to each other, as NormCompAPI.normalise_policies.
+    All policies are loaded, and then normalised, concurrently.
+    :param graphs: a list of rdflib graph objects containing ODRL policies OR a list of RDF files containing ODRL policies
+    :param only_first: if True, only the first policy is normalised; the others only contribute their constant values
+    :param executor: the executor that runs the work, by default the one of the event loop
+    :param as_graphs: if False, the normalised policies are returned as Policy objects instead of rdflib graphs
+    :return: the same as NormCompAPI.normalise_policies
+    """
+    if len(graphs) == 0:
+        return None if only_first else []
+    loaded, other_values = await asyncio.gather(
+        asyncio.gather(*(_run(executor, _load_policy, graph) for graph in (graphs[:1] if only_first else graphs))),
+        asyncio.gather(*(_run(executor, _load_values, graph) for graph in (graphs[1:] if only_first else []))))
+    value_map = dict()
+    for values_per_constraints in [values for values, policy in loaded] + list(other_values):
+        value_map = Utils.merge_key_multisets(value_map, values_per_constraints)
+    policies = [policy for values_per_constraints, policy in loaded]
+    normal_policies = await asyncio.gather(*(_run(executor, _normalise_policy, policy, value_map)
+                                             for policy in policies))
+    if as_graphs:
+        # Building graphs is slow too, and runs in this process, as graphs are expensive to send between processes.
+        normal_policies = await asyncio.gather(*(_run(None, normal_policy.to_rdflib_graph)
+                                                 for normal_policy in normal_policies))
+    return normal_policies[0] if only_first else list(normal_policies)
@@ -0,0 +1,323 @@
+"""
+Description: Stateful comparison of two policies that change over time. A session keeps the normalised and split rules
+of both policies, and the effective permissions, overlap and containment computed from them. Rules are added and
+removed as deltas, which update these results incrementally. Intervals are only split again when a delta changes the
+constants of a left operand, and then only for the rules whose intervals on that left operand contain a changed
+constant.
+
+Contributors:
+
+"""
+import collections
+import itertools
+import math
+
+from Constraint import ArithmeticConstraint, LogicalConstraint, SplitPoints
+from JsonPolicyParser import JsonPolicyParser
+from Policy import Permission, Prohibition
+from PolicyCache import PolicyCache
+import Instrumentation
+
+
+class _Entry:
+    def __init__(self, side, rule):
+        """
+        A rule of one of the policies of a session, with its normalised rules and their cells.
+
+        :param side: 1 or 2.
+        :param rule: A Permission or Prohibition, which does not need to be normalised.
+        :raises ValueError: If the rule is not a Permission or Prohibition.
+        """
+        if isinstance(rule, Permission):
+            self.kind = "permission"
+        elif isinstance(rule, Prohibition):
+            self.kind = "prohibition"
+        else:
+            raise ValueError(f"Only permissions and prohibitions can be compared, not {type(rule).__name__}.")
+        self.side = side
+        self.rule = rule
+        self.normal_rules = rule.normalise()
+        self.constants = _rule_constants(rule)
+        # The conjunctive clauses that split_intervals splits, used to find the rules whose cells change.
+        self.clauses = [clause for normal_rule in self.normal_rules for clause in _split_clauses(normal_rule)]
+        self.cells = []
+
+
+def _rule_constants(rule):
+    # Like Rule.get_values_from_constraints, with each value once.
+    ans = collections.defaultdict(set)
+    constraints = list(rule.constraint)
+    for refinables in (rule.target, rule.action, rule.assignee, rule.assigner):
+        for refinable in refinables:
+            constraints.extend(refinable.refinement)
+    for constraint in constraints:
+        for key, values in constraint.get_values_per_left_operand().items():
+            ans[key].update(values)
+    return ans
+
+
+def _split_clauses(rule):
+    # Same clauses as Permission.split_intervals and Prohibition.split_intervals.
+    if len(rule.constraint) == 0:
+        return [[]]
+    clauses = []
+    for constraint in rule.constraint:
+        if isinstance(constraint, ArithmeticConstraint):
+            clauses.append([constraint])
+        elif isinstance(constraint, LogicalConstraint) and constraint.operator == "and":
+            clauses.append(constraint.constraints)
+    return clauses
+
+
+class ComparisonSession:
+    def __init__(self, policy1=None, policy2=None):
+        """
+        Initializes a ComparisonSession instance with the permissions and prohibitions of two policies. Intervals are
+        split along the constants of the rules of the session, so that they can be updated when rules are added and
+        removed.
+
+        :param policy1: The first policy, which does not need to be normalised, or None to start empty.
+        :param policy2: The second policy, or None to start empty.
+        """
+        self._entries = dict()
+        self._handles = itertools.count()
+        # For each policy and left operand, the number of rules that use each constant, and the split points of both
+        # policies.
+        self._constants = {1: dict(), 2: dict()}
+        self.split_points = SplitPoints()
+        # Number of rules of each policy that produce each cell, by canonical key.
+        self._counts = {side: {"permission": collections.Counter(), "prohibition": collections.Counter()}
+                        for side in (1, 2)}
+        # The first permission of each policy that produced each cell.
+        self._permissions = {1: dict(), 2: dict()}
+        # Effective permissions of each policy, the overlap, and the number of effective permissions of each policy
+        # that are missing from the other.
+        self._effective = {1: dict(), 2: dict()}
+        self._overlap = set()
+        self._missing = {1: 0, 2: 0}
+        entries = []
+        changed = set()
+        for side, policy in ((1, policy1), (2, policy2)):
+            if policy is not None:
+                for handle, entry in self._new_entries(side, policy.permission + policy.prohibition):
+                    entries.append(entry)
+                    changed |= self._update_constants(side, entry.constants, 1)
+        self._resplit(changed, entries)
+
+    @staticmethod
+    def from_files(filepath1, filepath2):
+        """
+        Starts a session with the policies in two files, using the policy cache if it is enabled.
+
+        :return: A ComparisonSession, whose first comparison is the same as PolicyComparer.compare when the constants of
+        the files are those of their permissions and prohibitions.
+        """
+        cache = PolicyCache.default()
+        policies = []
+        for filepath in (filepath1, filepath2):
+            if cache is not None:
+                values_per_constraints, policy, normal_policy = cache.load(filepath)
+            else:
+                values_per_constraints, policy = JsonPolicyParser.parse_file(filepath)
+            policies.append(policy)
+        return ComparisonSession(policies[0], policies[1])
+
+    def handles(self, side):
+        """
+        :param side: 1 or 2.
+        :return: The handles of the rules of a policy, in the order in which they were added.
+        """
+        return [handle for handle, entry in self._entries.items() if entry.side == side]
+
+    def rule(self, handle):
+        return self._entries[handle].rule
+
+    def add_rule(self, side, rule):
+        """
+        Adds a rule to one of the policies.
+
+        :param side: 1 or 2.
+        :param rule: A Permission or Prohibition, which does not need to be normalised.
+        :return: The handle of the rule, used to remove it.
+        """
+        return self.add_rules(side, [rule])[0]
+
+    def add_rules(self, side, rules):
+        """
+        Same as add_rule, for several rules at once. Intervals are split again at most once.
+
+        :return: The handles of the rules.
+        """
+        if side not in (1, 2):
+            raise ValueError(f"Unknown side {side}.")
+        new_entries = self._new_entries(side, rules)
+        changed = set()
+        for handle, entry in new_entries:
+            changed |= self._update_constants(side, entry.constants, 1)
+        self._resplit(changed, [entry for handle, entry in new_entries])
+        return [handle for handle, entry in new_entries]
+
+    def remove_rule(self, handle):
+        """
+        Removes a rule from its policy.
+
+        :param handle: The handle returned when the rule was added, or one of handles(side).
+        """
+        self.remove_rules([handle])
+
+    def remove_rules(self, handles):
+        """
+        Same as remove_rule, for several rules at once. Intervals are split again at most once. The session is left
+        unchanged if a handle is unknown or repeated.
+
+        :raises KeyError: If a handle is not one of the rules of the session.
+        :raises ValueError: If a handle is given more than once.
+        """
+        handles = list(handles)
+        for handle in handles:
+            if handle not in self._entries:
+                raise KeyError(handle)
+        if len(set(handles)) != len(handles):
+            raise ValueError("Each rule can only be removed once.")
+        entries = [self._entries.pop(handle) for handle in handles]
+        changed = set()
+        for entry in entries:
+            self._add_cells(entry, -1)
+            changed |= self._update_constants(entry.side, entry.constants, -1)
+        self._resplit(changed, [])
+
+    def compare(self):
+        """
+        :return: A tuple (overlap, True if (1) is contained in (2), True if (2) is contained in (1)), as in
+        PolicyComparer.compare. The overlap has each effective permission of the first policy that is also an
+        effective permission of the second policy once.
+        """
+        return [self._effective[1][key] for key in self._overlap], self._missing[1] == 0, self._missing[2] == 0
+
+    def _new_entries(self, side, rules):
+        new_entries = [(next(self._handles), _Entry(side, rule)) for rule in rules]
+        self._entries.update(new_entries)
+        return new_entries
+
+    def _update_constants(self, side, constants, sign):
+        """
+        Adds (sign 1) or removes (sign -1) the constants of a rule of a policy.
+
+        :param constants: The constants of the rule, as a map from left operands to sets of values.
+        :return: The left operands whose split points changed.
+        """
+        changed = set()
+        for key, values in constants.items():
+            counter = self._constants[side].setdefault(key, collections.Counter())
+            for value in values:
+                counter[value] += sign
+                if counter[value] <= 0:
+                    del counter[value]
+            if len(counter) == 0:
+                del self._constants[side][key]
+            if self._merged_values(key) != self.split_points.get(key, []):
+                changed.add(key)
+        return changed
+
+    def _merged_values(self, key):
+        # The constants of both policies, each once, as in the value maps of get_values_from_constraints.
+        return sorted(self._constants[1].get(key, dict()).keys() | self._constants[2].get(key, dict()).keys())
+
+    def _resplit(self, keys, new_entries):
+        """
+        Splits the new entries, and updates the split points of the changed left operands and the cells of the entries
+        they change.
+
+        :param keys: The left operands whose constants changed.
+        :param new_entries: The entries that have no cells yet.
+        """
+        if not keys:
+            for entry in new_entries:
+                self._split(entry)
+                self._add_cells(entry, 1)
+            return
+        with Instrumentation.stage("resplit"):
+            Instrumentation.count("resplits")
+            old_split_points = self.split_points
+            self.split_points = old_split_points.replace({key: self._merged_values(key) for key in keys})
+            new_ids = {id(entry) for entry in new_entries}
+            if old_split_points.keys() != self.split_points.keys():
+                # Every cell gains or loses a left operand.
+                for counts in self._counts.values():
+                    for counter in counts.values():
+                        counter.clear()
+                self._permissions = {1: dict(), 2: dict()}
+                self._effective = {1: dict(), 2: dict()}
+                self._overlap = set()
+                self._missing = {1: 0, 2: 0}
+                entries = list(self._entries.values())
+            else:
+                entries = [entry for entry in self._entries.values()
+                           if id(entry) in new_ids or self._changes_cells(entry, keys, old_split_points)]
+                for entry in entries:
+                    if id(entry) not in new_ids:
+                        self._add_cells(entry, -1)
+            Instrumentation.count("resplit_rules", len(entries))
+            for entry in entries:
+                self._split(entry)
+                self._add_cells(entry, 1)
+
+    def _changes_cells(self, entry, keys, old_split_points):
+        # The cells of a clause only depend on the constants strictly between its bounds on each left operand.
+        for clause in entry.clauses:
+            bounds = self.split_points.bounds(clause)
+            for key in keys:
+                min_value, max_value = bounds.get(key, (-math.inf, math.inf))
+                if min_value != max_value and (old_split_points.between(key, min_value, max_value) !=
+                                               self.split_points.between(key, min_value, max_value)):
+                    return True
+        return False
+
+    def _split(self, entry):
+        # As in PolicyComparer.compare_normal_policies, rules are not split if there are no constants.
+        if len(self.split_points) == 0:
+            entry.cells = list(entry.normal_rules)
+        else:
+            entry.cells = [cell for rule in entry.normal_rules for cell in rule.split_intervals(self.split_points)]
+
+    def _add_cells(self, entry, sign):
+        counts = self._counts[entry.side][entry.kind]
+        permissions = self._permissions[entry.side]
+        # Cells are counted by their canonical keys.
+        for cell in entry.cells:
+            key = cell.canonical_key()
+            before = self._is_effective(entry.side, key)
+            counts[key] += sign
+            if counts[key] <= 0:
+                del counts[key]
+            if entry.kind == "permission":
+                if key not in counts:
+                    del permissions[key]
+                elif key not in permissions:
+                    permissions[key] = cell
+            after = self._is_effective(entry.side, key)
+            if after and not before:
+                self._set_effective(entry.side, key)
+            elif before and not after:
+                self._unset_effective(entry.side, key)
+
+    def _is_effective(self, side, key):
+        return key in self._counts[side]["permission"] and key not in self._counts[side]["prohibition"]
+
+    def _set_effective(self, side, key):
+        other = 3 - side
+        self._effective[side][key] = self._permissions[side][key]
+        if key in self._effective[other]:
+            self._overlap.add(key)
+            self._missing[other] -= 1
+        else:
+            self._missing[side] += 1
+
+    def _unset_effective(self, side, key):
+        other = 3 - side
+        del self._effective[side][key]
+        if key in self._effective[other]:
+            self._overlap.discard(key)
+            self._missing[other] += 1
+        else:
+            self._missing[side] -= 1
@@ -6,19 +6,78 @@ Description: This is the constraint package which has logical and arithmetic con
 Contributors:
 
 """
+import bisect
+import enum
 import itertools
 import math
 import datetime
+import sys
 
 import rdflib
 
+import Instrumentation
 import Utils
 
 ODRL_IRI = "http://www.w3.org/ns/odrl/2/"
 ODRL = rdflib.Namespace(ODRL_IRI)
 
 
+class Operator(enum.IntEnum):
+    """
+    Operators of arithmetic constraints. Constraints store these codes, and operator IRIs are only used when
+    constraints are parsed or serialized.
+    """
+    EQ = 0
+    NEQ = 1
+    LT = 2
+    LTEQ = 3
+    GT = 4
+    GTEQ = 5
+    IS_A = 6
+    HAS_PART = 7
+    IS_PART_OF = 8
+    IS_ALL_OF = 9
+    IS_ANY_OF = 10
+    IS_NONE_OF = 11
+
+    @property
+    def iri(self):
+        return ODRL_IRI + _OPERATOR_NAMES[self]
+
+    @staticmethod
+    def from_iri(operator):
+        """
+        :param operator: An Operator, an ODRL operator IRI or its local name.
+        :return: The Operator, or the operator itself if it is not an ODRL operator.
+        """
+        if isinstance(operator, str):
+            return _OPERATORS_BY_IRI.get(str(operator), operator)
+        return operator
+
+    @staticmethod
+    def to_iri(operator):
+        """
+        :return: The IRI of an Operator. Other operators are returned unchanged.
+        """
+        return operator.iri if isinstance(operator, Operator) else operator
+
+
+_OPERATOR_NAMES = ["eq", "neq", "lt", "lteq", "gt", "gteq", "isA", "hasPart", "isPartOf", "isAllOf", "isAnyOf",
+                   "isNoneOf"]
+_OPERATORS_BY_IRI = dict()
+for _operator in Operator:
+    _OPERATORS_BY_IRI[ODRL_IRI + _OPERATOR_NAMES[_operator]] = _operator
+    _OPERATORS_BY_IRI[_OPERATOR_NAMES[_operator]] = _operator
+
+# Operators of the constraints that bound intervals after normalisation.
+INTERVAL_OPERATORS = frozenset([Operator.EQ, Operator.GT, Operator.LT])
+
+_set = object.__setattr__
+
+
 class Constraint:
+    __slots__ = ()
+
     def __init__(self, leftOperand=None, operator=None, rightOperand=None, **args):
         if leftOperand is None:
             LogicalConstraint.__init__(self, **args)
@@ -38,6 +97,41 @@ class Constraint:
         else:
             return LogicalConstraint(operator=operator, **args)
 
+    @staticmethod
+    def clause_key(constraints):
+        """
+        :return: A hashable key of a conjunctive clause, equal for two clauses if and only if they have the same
+        constraints.
+        """
+        return frozenset(constraint.canonical_key() for constraint in constraints)
+
+    @staticmethod
+    def from_dict(data, decoder):
+        """
+        Builds a constraint from its dictionary form.
+
+        :param data: A dictionary returned by ArithmeticConstraint.to_dict or LogicalConstraint.to_dict.
+        :param decoder: The SnapshotDecoder of the tables the dictionary refers to.
+        """
+        if "leftOperand" in data:
+            operator = data["operator"]
+            return ArithmeticConstraint(decoder.term(data["leftOperand"]),
+                                        Operator(operator) if isinstance(operator, int) else operator,
+                                        decoder.term(data["rightOperand"]))
+        return LogicalConstraint(operator=data["operator"],
+                                 constraints=[decoder.constraint(index) for index in data["constraints"]])
+
+    def stable_id(self):
+        """
+        :return: An identifier derived from the canonical key, which is the same for equal constraints in every
+        process. It is computed once.
+        """
+        try:
+            return self._stable_id
+        except AttributeError:
+            _set(self, "_stable_id", Utils.stable_id(self.canonical_key()))
+            return self._stable_id
+
     def evaluate(self):
         pass
 
@@ -51,13 +145,32 @@ class Refinement(Constraint):
 
 
 class ArithmeticConstraint(Constraint):
+    __slots__ = ("leftOperand", "operator", "rightOperand", "_key", "_stable_id")
+
     def __init__(self, leftOperand, operator, rightOperand):
-        self.operator = operator
-        self.leftOperand = leftOperand  # The specific operand that needs an exact match to proceed
-        self.rightOperand = rightOperand
+        """
+        Initializes an immutable ArithmeticConstraint instance.
+
+        :param leftOperand: The left operand. Plain strings are interned, so equal left operands share one object.
+        :param operator: An Operator, or an operator IRI, which is converted to an Operator.
+        :param rightOperand: The right operand.
+        """
+        _set(self, "operator", Operator.from_iri(operator))
+        # The specific operand that needs an exact match to proceed
+        _set(self, "leftOperand", sys.intern(leftOperand) if type(leftOperand) is str else leftOperand)
+        _set(self, "rightOperand", rightOperand)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ArithmeticConstraint objects are immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("ArithmeticConstraint objects are immutable.")
+
+    def __reduce__(self):
+        return ArithmeticConstraint, (self.leftOperand, self.operator, self.rightOperand)
 
     def __str__(self):
-        return f"({self.leftOperand} {self.operator} {self.rightOperand})"
+        return f"({self.leftOperand} {Operator.to_iri(self.operator)} {self.rightOperand})"
 
     def __eq__(self, other):
         if isinstance(other, ArithmeticConstraint):
@@ -65,67 +178,80 @@ class ArithmeticConstraint(Constraint):
         else:
             return False
 
+    def __hash__(self):
+        return hash(self.canonical_key())
+
+    def canonical_key(self):
+        """
+        :return: A hashable key that is equal for two constraints if and only if they are equal. It is computed once.
+        """
+        try:
+            return self._key
+        except AttributeError:
+            _set(self, "_key", ("arithmetic", self.leftOperand, self.operator, Utils.to_hashable(self.rightOperand)))
+            return self._key
+
     def check_constraint(self, leftOperandValue, value):
         # First, check if the leftOperand matches exactly
         if self.leftOperand is not None and self.leftOperand != leftOperandValue:
             return False  # The leftOperand does not match; constraint check does not proceed
 
         # Proceed with the constraint checks
-        if self.operator == ODRL_IRI + 'eq':
+        if self.operator == Operator.EQ:
             return value == self.rightOperand
-        elif self.operator == ODRL_IRI + 'gt':
+        elif self.operator == Operator.GT:
             return value > self.rightOperand
-        elif self.operator == ODRL_IRI + 'gteq':
+        elif self.operator == Operator.GTEQ:
             return value >= self.rightOperand
-        elif self.operator == ODRL_IRI + 'lt':
+        elif self.operator == Operator.LT:
             return value < self.rightOperand
-        elif self.operator == ODRL_IRI + 'lteq':
+        elif self.operator == Operator.LTEQ:
             return value <= self.rightOperand
-        elif self.operator == ODRL_IRI + 'neq':
+        elif self.operator == Operator.NEQ:
             return value != self.rightOperand
-        elif self.operator == ODRL_IRI + "isA":  # This will require OWL reasoning for completeness.
+        elif self.operator == Operator.IS_A:  # This will require OWL reasoning for completeness.
             return value.type == self.rightOperand
-        elif self.operator == ODRL_IRI + "hasPart":
+        elif self.operator == Operator.HAS_PART:
             return all(item in self.rightOperand for item in value)
-        elif self.operator == ODRL_IRI + "isPartOf":
+        elif self.operator == Operator.IS_PART_OF:
             return all(item in value for item in self.rightOperand)
-        elif self.operator == ODRL_IRI + "isAllOf":
+        elif self.operator == Operator.IS_ALL_OF:
             return all(item == self.rightOperand for item in value)
-        elif self.operator == ODRL_IRI + "isAnyOf":
+        elif self.operator == Operator.IS_ANY_OF:
             return any(item == self.rightOperand for item in value)
-        elif self.operator == ODRL_IRI + "isNoneOf":
+        elif self.operator == Operator.IS_NONE_OF:
             return all(item != self.rightOperand for item in value)
         else:
             return False
 
     def normalise(self):
-        if self.operator == ODRL_IRI + 'eq':
+        if self.operator == Operator.EQ:
             return self
-        elif self.operator == ODRL_IRI + 'gt':
+        elif self.operator == Operator.GT:
             return self
-        elif self.operator == ODRL_IRI + 'gteq':
-            interval_1 = ArithmeticConstraint(self.leftOperand, ODRL_IRI + "gt", self.rightOperand)
-            equality_1 = ArithmeticConstraint(self.leftOperand, ODRL_IRI + "eq", self.rightOperand)
+        elif self.operator == Operator.GTEQ:
+            interval_1 = ArithmeticConstraint(self.leftOperand, Operator.GT, self.rightOperand)
+            equality_1 = ArithmeticConstraint(self.leftOperand, Operator.EQ, self.rightOperand)
             or_constraint = LogicalConstraint(operator="or", constraints=[interval_1, equality_1])
             return or_constraint
-        elif self.operator == ODRL_IRI + 'lt':
+        elif self.operator == Operator.LT:
             return self
-        elif self.operator == ODRL_IRI + 'lteq':
-            interval_1 = ArithmeticConstraint(self.leftOperand, ODRL_IRI + "lt", self.rightOperand)
-            equality_1 = ArithmeticConstraint(self.leftOperand, ODRL_IRI + "eq", self.rightOperand)
+        elif self.operator == Operator.LTEQ:
+            interval_1 = ArithmeticConstraint(self.leftOperand, Operator.LT, self.rightOperand)
+            equality_1 = ArithmeticConstraint(self.leftOperand, Operator.EQ, self.rightOperand)
             or_constraint = LogicalConstraint(operator="or", constraints=[interval_1, equality_1])
             return or_constraint
-        elif self.operator == ODRL_IRI + 'neq':
+        elif self.operator == Operator.NEQ:
             if isinstance(self.rightOperand, (int, float)):
-                interval_1 = ArithmeticConstraint(self.leftOperand, ODRL_IRI + "gt", self.rightOperand)
-                interval_2 = ArithmeticConstraint(self.leftOperand, ODRL_IRI + "lt", self.rightOperand)
+                interval_1 = ArithmeticConstraint(self.leftOperand, Operator.GT, self.rightOperand)
+                interval_2 = ArithmeticConstraint(self.leftOperand, Operator.LT, self.rightOperand)
                 or_constraint = LogicalConstraint(operator="or", constraints=[interval_1, interval_2])
                 return or_constraint
             elif isinstance(self.rightOperand, str):
                 try:
                     timestamp = datetime.datetime.fromisoformat(self.rightOperand).timestamp()
-                    interval_1 = ArithmeticConstraint(self.leftOperand, ODRL_IRI + "gt", timestamp)
-                    interval_2 = ArithmeticConstraint(self.leftOperand, ODRL_IRI + "lt", timestamp)
+                    interval_1 = ArithmeticConstraint(self.leftOperand, Operator.GT, timestamp)
+                    interval_2 = ArithmeticConstraint(self.leftOperand, Operator.LT, timestamp)
                     or_constraint = LogicalConstraint(operator="or", constraints=[interval_1, interval_2])
                     return or_constraint
                 except:
@@ -136,19 +262,45 @@ class ArithmeticConstraint(Constraint):
             return self
 
 
+    def is_disjunctive(self):
+        """
+        :return: True if the normal form of this constraint is a disjunction.
+        """
+        return isinstance(self.normalise(), LogicalConstraint)
+
+    def iter_clauses(self):
+        """
+        :return: A generator of the conjunctive clauses of the normal form of this constraint.
+        """
+        normal_constraint = self.normalise()
+        if isinstance(normal_constraint, LogicalConstraint):
+            for c in normal_constraint.constraints:
+                yield [c]
+        else:
+            yield [normal_constraint]
+
+    def clause_bound(self):
+        """
+        :return: The number of conjunctive clauses of the normal form of this constraint, before pruning.
+        """
+        normal_constraint = self.normalise()
+        if isinstance(normal_constraint, LogicalConstraint):
+            return len(normal_constraint.constraints)
+        return 1
+
     def __neg__(self):
-        if self.operator == ODRL_IRI + 'eq':
-            return ArithmeticConstraint(self.leftOperand, "neq", self.rightOperand)
-        elif self.operator == ODRL_IRI + 'gt':
-            return ArithmeticConstraint(self.leftOperand, "lteq", self.rightOperand)
-        elif self.operator == ODRL_IRI + 'gteq':
-            return ArithmeticConstraint(self.leftOperand, "lt", self.rightOperand)
-        elif self.operator == ODRL_IRI + 'lt':
-            return ArithmeticConstraint(self.leftOperand, "gteq", self.rightOperand)
-        elif self.operator == ODRL_IRI + 'lteq':
-            return ArithmeticConstraint(self.leftOperand, "gt", self.rightOperand)
-        elif self.operator == ODRL_IRI + 'neq':
-            return ArithmeticConstraint(self.leftOperand, "eq", self.rightOperand)
+        if self.operator == Operator.EQ:
+            return ArithmeticConstraint(self.leftOperand, Operator.NEQ, self.rightOperand)
+        elif self.operator == Operator.GT:
+            return ArithmeticConstraint(self.leftOperand, Operator.LTEQ, self.rightOperand)
+        elif self.operator == Operator.GTEQ:
+            return ArithmeticConstraint(self.leftOperand, Operator.LT, self.rightOperand)
+        elif self.operator == Operator.LT:
+            return ArithmeticConstraint(self.leftOperand, Operator.GTEQ, self.rightOperand)
+        elif self.operator == Operator.LTEQ:
+            return ArithmeticConstraint(self.leftOperand, Operator.GT, self.rightOperand)
+        elif self.operator == Operator.NEQ:
+            return ArithmeticConstraint(self.leftOperand, Operator.EQ, self.rightOperand)
         else:
             return LogicalConstraint("not", [self])
 
@@ -156,116 +308,31 @@ class ArithmeticConstraint(Constraint):
         return {self.leftOperand: [self.rightOperand]}
 
     def split_intervals(self, value_map):
-        left_operand_map = dict()
-        for key in value_map.keys():  # For each left operand:
-            min_value = -math.inf
-            max_value = math.inf
-            if self.leftOperand == key:  # Does it contain the current left operand?
-                if self.operator == ODRL_IRI + "gt":
-                    min_value = max(min_value, self.rightOperand)
-                elif self.operator == ODRL_IRI + "lt":
-                    max_value = min(max_value, self.rightOperand)
-                elif self.operator == ODRL_IRI + "eq":
-                    min_value = self.rightOperand
-                    max_value = self.rightOperand
-            if min_value == max_value:
-                left_operand_map[key] = [min_value]
-            elif min_value == -math.inf and max_value == math.inf:
-                left_operand_map[key] = []
-            else:
-                left_operand_map[key] = [min_value, max_value]
-        final_intervals = []
-        for key in left_operand_map.keys():
-            interval = left_operand_map[key]
-            if len(interval) == 1:
-                if len(final_intervals) == 0:
-                    final_intervals.append(
-                        [Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq", rightOperand=interval[0])])
-                else:
-                    new_final_constraints = []
-                    for c in final_intervals:
-                        c_copy = c.copy()
-                        c_copy.append(
-                            Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq", rightOperand=interval[0]))
-                        new_final_constraints.append(c_copy)
-                    final_intervals = new_final_constraints
-            else:
-                min_value = -math.inf
-                max_value = math.inf
-                if len(interval) == 2:
-                    min_value = interval[0]
-                    max_value = interval[1]
-                key_intervals = value_map[key]
-                valid_interval = [min_value] + [x for x in key_intervals if min_value < x < max_value] + [max_value]
-                or_intervals = []
-                if len(valid_interval) == 2:  # No values between min value and max value.
-                    and_intervals = []
-                    if not min_value == -math.inf:
-                        and_intervals.append(
-                            Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt", rightOperand=min_value))
-                    if not max_value == math.inf:
-                        and_intervals.append(
-                            Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt", rightOperand=max_value))
-                    or_intervals.append(and_intervals)
-                elif len(valid_interval) > 2:
-                    for i in range(len(valid_interval) - 1):
-                        and_intervals = []
-                        if i == 0:
-                            if valid_interval[i] == -math.inf:
-                                or_intervals.append([Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt",
-                                                                       rightOperand=valid_interval[i + 1])])
-                            else:
-                                and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt",
-                                                                       rightOperand=valid_interval[i]))
-                                and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt",
-                                                                       rightOperand=valid_interval[i + 1]))
-                                or_intervals.append(and_intervals)
-
-                        elif i == len(valid_interval) - 2:
-                            if valid_interval[i + 1] == math.inf:
-                                or_intervals.append([Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt",
-                                                                       rightOperand=valid_interval[i])])
-                            else:
-                                and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt",
-                                                                       rightOperand=valid_interval[i]))
-                                and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt",
-                                                                       rightOperand=valid_interval[i + 1]))
-                                or_intervals.append(and_intervals)
-                            or_intervals.append([Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq",
-                                                                   rightOperand=valid_interval[i])])
-
-                            break
-                        else:
-                            and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt",
-                                                                   rightOperand=valid_interval[i]))
-                            and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt",
-                                                                   rightOperand=valid_interval[i + 1]))
-                            or_intervals.append(and_intervals)
-                            or_intervals.append([Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq",
-                                                                   rightOperand=valid_interval[i])])
-                if len(final_intervals) == 0:
-                    for interval in or_intervals:
-                        final_intervals.append(interval)
-                else:
-                    new_final_constraints = []
-                    for c in final_intervals:
-                        for or_interval in or_intervals:
-                            new_final_constraints.append(c + or_interval)
-                    final_intervals = new_final_constraints
-        return Constraint.create(operator="or", constraints=final_intervals)
+        return _split_clause([self], value_map)
     
-    def to_triples(self, subject):
-        if self.leftOperand == ODRL_IRI + "dateTime":
+    def to_dict(self, encoder):
+        """
+        :param encoder: The SnapshotEncoder of the tables the dictionary refers to.
+        :return: A dictionary with the indices of the operands in the term table, and the code of the operator.
+        """
+        return {"leftOperand": encoder.term(self.leftOperand),
+                "operator": int(self.operator) if isinstance(self.operator, Operator) else self.operator,
+                "rightOperand": encoder.term(self.rightOperand)}
+
+    def to_triples(self, subject, base=None):
+        # Date times parsed from policies are already strings, and only timestamps are converted.
+        if self.leftOperand == ODRL_IRI + "dateTime" and isinstance(self.rightOperand, (int, float)):
             proper_datetime = datetime.datetime.fromtimestamp(self.rightOperand, tz=datetime.timezone.utc).isoformat()
-            return [(subject, ODRL.leftOperand, Utils.string_to_rdflib_node(self.leftOperand)), (subject, ODRL.operator, Utils.string_to_rdflib_node(self.operator)),
+            return [(subject, ODRL.leftOperand, Utils.string_to_rdflib_node(self.leftOperand)), (subject, ODRL.operator, Utils.string_to_rdflib_node(Operator.to_iri(self.operator))),
                 (subject, ODRL.rightOperand, Utils.string_to_rdflib_node(proper_datetime))]
         else:
-            return [(subject, ODRL.leftOperand, Utils.string_to_rdflib_node(self.leftOperand)), (subject, ODRL.operator, Utils.string_to_rdflib_node(self.operator)),
+            return [(subject, ODRL.leftOperand, Utils.string_to_rdflib_node(self.leftOperand)), (subject, ODRL.operator, Utils.string_to_rdflib_node(Operator.to_iri(self.operator))),
                 (subject, ODRL.rightOperand, Utils.string_to_rdflib_node(self.rightOperand))]
 
 
 class LogicalConstraint(Constraint):
     def __init__(self, operator=None, constraints=None, **args):
+        self._key = None
         if operator is None:
             if (ODRL_IRI + 'and') in args:
                 op = 'and'
@@ -295,17 +362,25 @@ class LogicalConstraint(Constraint):
         return "(" + str(self.operator) + " " + list_to_string + ")"
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if isinstance(other, LogicalConstraint):
-            if self.operator == other.operator and len(self.constraints) == len(other.constraints):
-                for constraint in self.constraints:
-                    if constraint not in other.constraints:
-                        return False
-                for constraint in other.constraints:
-                    if constraint not in self.constraints:
-                        return False
-                return True
+            return hash(self) == hash(other) and self.canonical_key() == other.canonical_key()
         return False
 
+    def __hash__(self):
+        return hash(self.canonical_key())
+
+    def canonical_key(self):
+        """
+        :return: A hashable key that is equal for two constraints if and only if they are equal. It is computed once,
+        so the constraints of a LogicalConstraint should not be changed after it is compared or hashed.
+        """
+        if self._key is None:
+            self._key = "logical", self.operator, len(self.constraints), frozenset(
+                constraint.canonical_key() for constraint in self.constraints)
+        return self._key
+
     def check_constraint(self, value):
         if self.operator == 'or':
             return any(constraint.check_constraint(None, value) for constraint in self.constraints)
@@ -357,6 +432,141 @@ class LogicalConstraint(Constraint):
                 final_constraints.append(final_constraint.normalise())
             return LogicalConstraint(operator="or", constraints=final_constraints)
 
+    def is_disjunctive(self):
+        """
+        :return: True if the normal form of this constraint is a disjunction.
+        """
+        if self.operator == 'or':
+            return True
+        elif self.operator == 'and':
+            return any(constraint.is_disjunctive() for constraint in self.constraints)
+        return False
+
+    def iter_clauses(self):
+        """
+        Generator version of normalise. Instead of building the whole disjunctive normal form, this yields one
+        conjunctive clause at a time, in the same order as the constraints of normalise().
+
+        :return: A generator of conjunctive clauses, each one a list of constraints.
+        """
+        if self.operator == 'or':
+            for constraint in self.constraints:
+                yield from constraint.iter_clauses()
+        elif self.operator == 'and':
+            union_constraints = []
+            sub_constraints = []
+            for constraint in self.constraints:
+                if constraint.is_disjunctive():
+                    union_constraints.append(constraint)
+                else:
+                    for clause in constraint.iter_clauses():
+                        sub_constraints.extend(clause)
+            if Instrumentation.enabled:
+                width = 1
+                for constraint in union_constraints:
+                    width *= constraint.clause_bound()
+                Instrumentation.maximum("widest_product", width)
+            bounds = LogicalConstraint._tighten(dict(), sub_constraints)
+            if bounds is None:
+                return
+            yield from LogicalConstraint._iter_product(union_constraints, 0, [], sub_constraints, bounds)
+        else:
+            # Other logical operators are not normalised.
+            yield [self]
+
+    def clause_bound(self):
+        """
+        :return: The number of conjunctive clauses of the normal form of this constraint, before pruning.
+        """
+        if self.operator == 'or':
+            return sum(constraint.clause_bound() for constraint in self.constraints)
+        elif self.operator == 'and':
+            ans = 1
+            for constraint in self.constraints:
+                ans *= constraint.clause_bound()
+            return ans
+        return 1
+
+    @staticmethod
+    def _iter_product(union_constraints, i, prefix, sub_constraints, bounds):
+        # Lazy equivalent of itertools.product, which only keeps the current clause of each union in memory.
+        # Each partial clause carries the bounds of its left operands, and is dropped as soon as they are empty.
+        if i == len(union_constraints):
+            yield prefix + sub_constraints
+        else:
+            for clause in union_constraints[i].iter_clauses():
+                new_bounds = LogicalConstraint._tighten(bounds, clause)
+                if new_bounds is not None:
+                    yield from LogicalConstraint._iter_product(union_constraints, i + 1, prefix + clause,
+                                                               sub_constraints, new_bounds)
+                elif Instrumentation.enabled:
+                    Instrumentation.count("pruned_clauses")
+
+    @staticmethod
+    def _interval_value(constraint):
+        # Datetimes are compared as timestamps.
+        if isinstance(constraint.rightOperand, str):
+            try:
+                return datetime.datetime.fromisoformat(constraint.rightOperand).timestamp()
+            except ValueError:
+                return constraint.rightOperand
+        return constraint.rightOperand
+
+    @staticmethod
+    def _add_bound(bounds, constraint):
+        """
+        Tightens the bounds of the left operand of an 'eq', 'gt' or 'lt' constraint.
+
+        :param bounds: A map from left operands to tuples (min_value, max_value, exact_value), updated in place.
+        :param constraint: An ArithmeticConstraint with an 'eq', 'gt' or 'lt' operator.
+        :return: False if the constraints on this left operand can no longer be satisfied, True otherwise.
+        """
+        min_value, max_value, exact_value = bounds.get(constraint.leftOperand, (-math.inf, math.inf, None))
+        value = LogicalConstraint._interval_value(constraint)
+        if constraint.operator == Operator.EQ:
+            if exact_value is None:
+                exact_value = value
+            elif exact_value != value:
+                return False
+        elif constraint.operator == Operator.GT:
+            if min_value == -math.inf:
+                min_value = value
+            else:
+                min_value = max(value, min_value)
+        elif constraint.operator == Operator.LT:
+            if max_value == math.inf:
+                max_value = value
+            else:
+                max_value = min(value, max_value)
+        bounds[constraint.leftOperand] = (min_value, max_value, exact_value)
+        if exact_value is not None:
+            if min_value != -math.inf and not min_value < exact_value:
+                return False
+            if max_value != math.inf and not exact_value < max_value:
+                return False
+            return True
+        return min_value == -math.inf or max_value == math.inf or min_value < max_value
+
+    @staticmethod
+    def _tighten(bounds, clause):
+        """
+        Adds the interval constraints of a clause to the bounds of a partial conjunctive clause.
+
+        :return: A new map of bounds, or None if the conjunction of both is unsatisfiable.
+        """
+        new_bounds = None
+        for constraint in clause:
+            if constraint.operator in INTERVAL_OPERATORS:
+                if new_bounds is None:
+                    new_bounds = dict(bounds)
+                try:
+                    if not LogicalConstraint._add_bound(new_bounds, constraint):
+                        return None
+                except TypeError:
+                    # Values that cannot be compared are left to simplify_intervals.
+                    continue
+        return bounds if new_bounds is None else new_bounds
+
     def get_values_per_left_operand(self):
         ans = dict()
         for constraint in self.constraints:
@@ -371,57 +581,26 @@ class LogicalConstraint(Constraint):
     def simplify_intervals(self):
         if self.operator == "and":
             simplified_intervals = []
-            key_map = dict()
+            bounds = dict()
             for constraint in self.constraints:
-                if constraint.operator == ODRL_IRI + "lt" or constraint.operator == ODRL_IRI + "gt" or constraint.operator == ODRL_IRI + "eq":
-                    if constraint.leftOperand not in key_map:
-                        key_map[constraint.leftOperand] = []
-                    key_map[constraint.leftOperand].append(constraint)
+                if constraint.operator in INTERVAL_OPERATORS:
+                    if not LogicalConstraint._add_bound(bounds, constraint):
+                        # raise ValueError("Invalid interval. Minimum value is greater than maximum value.")
+                        return None
                 else:
                     simplified_intervals.append(constraint)
-            for key in key_map.keys():
-                min_value = -math.inf
-                max_value = math.inf
-                exact_value = None
-                for constraint in key_map[key]:
-                    if isinstance(constraint.rightOperand, str):
-                        try:
-                            constraint.rightOperand = datetime.datetime.fromisoformat(constraint.rightOperand).timestamp()
-                        except ValueError:
-                            constraint.rightOperand = constraint.rightOperand
-                    if constraint.operator == ODRL_IRI + "eq":
-                        if exact_value is None:
-                            exact_value = constraint.rightOperand
-                        elif exact_value != constraint.rightOperand:
-                            # raise ValueError("More than one equality per left operand.")
-                            return None
-                    elif constraint.operator == ODRL_IRI + "gt":
-                        if min_value == -math.inf:
-                            min_value = constraint.rightOperand
-                        else:
-                            min_value = max(constraint.rightOperand, min_value)
-                    elif constraint.operator == ODRL_IRI + "lt":
-                        if max_value == math.inf:
-                            max_value = constraint.rightOperand
-                        else:
-                            max_value = min(constraint.rightOperand, max_value)
+            for key in bounds.keys():
+                min_value, max_value, exact_value = bounds[key]
                 if exact_value is not None:
-                    if max_value == math.inf and min_value == -math.inf:
-                        simplified_intervals.append(
-                            Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq", rightOperand=exact_value))
-                    elif max_value > exact_value > min_value:
-                        simplified_intervals.append(
-                            Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq", rightOperand=exact_value))
-                elif min_value < max_value:
+                    simplified_intervals.append(
+                        Constraint.create(leftOperand=key, operator=Operator.EQ, rightOperand=exact_value))
+                else:
                     if min_value != -math.inf:
-                        interval_1 = ArithmeticConstraint(key, ODRL_IRI + "gt", min_value)
+                        interval_1 = ArithmeticConstraint(key, Operator.GT, min_value)
                         simplified_intervals.append(interval_1)
                     if max_value != math.inf:
-                        interval_2 = ArithmeticConstraint(key, ODRL_IRI + "lt", max_value)
+                        interval_2 = ArithmeticConstraint(key, Operator.LT, max_value)
                         simplified_intervals.append(interval_2)
-                else:
-                    # raise ValueError("Invalid interval. Minimum value is greater than maximum value.")
-                    return None
             return LogicalConstraint(operator="and", constraints=simplified_intervals)
         elif self.operator == "or":
             simplified_intervals = []
@@ -433,12 +612,25 @@ class LogicalConstraint(Constraint):
                     simplified_intervals.append(constraint)
             return LogicalConstraint(operator="or", constraints=simplified_intervals)
         
-    def to_triples(self, subject):
+    def to_dict(self, encoder):
+        """
+        :param encoder: The SnapshotEncoder of the tables the dictionary refers to.
+        :return: A dictionary with the operator and the indices of the sub-constraints in the constraint table.
+        """
+        return {"operator": self.operator, "constraints": [encoder.constraint(c) for c in self.constraints]}
+
+    def to_triples(self, subject, base=None):
+        """
+        :param subject: The node of the constraint.
+        :param base: Optional prefix of the IRIs of the sub-constraints, which are followed by their stable_id. By
+        default, sub-constraints are blank nodes.
+        :return: A list of triples.
+        """
         triples = []
         for constraint in self.constraints:
-            constraint_bnode = rdflib.BNode()
-            triples.append((subject, ODRL.operator, constraint_bnode))
-            triples.extend(constraint.to_triples(constraint_bnode))
+            constraint_node = rdflib.BNode() if base is None else rdflib.URIRef(base + constraint.stable_id())
+            triples.append((subject, ODRL[self.operator], constraint_node))
+            triples.extend(constraint.to_triples(constraint_node, base))
         return triples
 
     # def split_intervals(self, value_map):
@@ -541,102 +733,123 @@ class LogicalConstraint(Constraint):
     def split_intervals(self, value_map):
         #Note that this will only work correctly if this is a CQ.
         if self.operator == "and":
-            left_operand_map = dict()
-            for key in value_map.keys():  # For each left operand:
-                min_value = -math.inf
-                max_value = math.inf
-                for c in self.constraints:  # For each constraint in this list of constraints.
-                    if c.leftOperand == key:  # Does it contain the current left operand?
-                        if c.operator == ODRL_IRI + "gt":
-                            min_value = max(min_value, c.rightOperand)
-                        elif c.operator == ODRL_IRI + "lt":
-                            max_value = min(max_value, c.rightOperand)
-                        elif c.operator == ODRL_IRI + "eq":
-                            min_value = c.rightOperand
-                            max_value = c.rightOperand
-                if min_value == max_value:
-                    left_operand_map[key] = [min_value]
-                elif min_value == -math.inf and max_value == math.inf:
-                    left_operand_map[key] = []
-                else:
-                    left_operand_map[key] = [min_value, max_value]
-            final_intervals = []
-            for key in left_operand_map.keys():
-                interval = left_operand_map[key]
-                if len(interval) == 1:
-                    if len(final_intervals) == 0:
-                        final_intervals.append(
-                            [Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq", rightOperand=interval[0])])
-                    else:
-                        new_final_constraints = []
-                        for c in final_intervals:
-                            c_copy = c.copy()
-                            c_copy.append(
-                                Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq", rightOperand=interval[0]))
-                            new_final_constraints.append(c_copy)
-                        final_intervals = new_final_constraints
-                else:
-                    min_value = -math.inf
-                    max_value = math.inf
-                    if len(interval) == 2:
-                        min_value = interval[0]
-                        max_value = interval[1]
-                    key_intervals = value_map[key]
-                    valid_interval = [min_value] + [x for x in key_intervals if min_value < x < max_value] + [max_value]
-                    or_intervals = []
-                    if len(valid_interval) == 2:  #  No values between min value and max value.
-                        and_intervals = []
-                        if not min_value == -math.inf:
-                            and_intervals.append(
-                                Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt", rightOperand=min_value))
-                        if not max_value == math.inf:
-                            and_intervals.append(
-                                Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt", rightOperand=max_value))
-                        or_intervals.append(and_intervals)
-                    elif len(valid_interval) > 2:
-                        for i in range(len(valid_interval) - 1):
-                            and_intervals = []
-                            if i == 0:
-                                if valid_interval[i] == -math.inf:
-                                    or_intervals.append([Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt",
-                                                                           rightOperand=valid_interval[i + 1])])
-                                else:
-                                    and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt",
-                                                                           rightOperand=valid_interval[i]))
-                                    and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt",
-                                                                           rightOperand=valid_interval[i + 1]))
-                                    or_intervals.append(and_intervals)
-
-                            elif i == len(valid_interval) - 2:
-                                if valid_interval[i + 1] == math.inf:
-                                    or_intervals.append([Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt",
-                                                                           rightOperand=valid_interval[i])])
-                                else:
-                                    and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt",
-                                                                           rightOperand=valid_interval[i]))
-                                    and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt",
-                                                                           rightOperand=valid_interval[i + 1]))
-                                    or_intervals.append(and_intervals)
-                                or_intervals.append([Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq",
-                                                                       rightOperand=valid_interval[i])])
-
-                                break
-                            else:
-                                and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "gt",
-                                                                       rightOperand=valid_interval[i]))
-                                and_intervals.append(Constraint.create(leftOperand=key, operator=ODRL_IRI + "lt",
-                                                                       rightOperand=valid_interval[i + 1]))
-                                or_intervals.append(and_intervals)
-                                or_intervals.append([Constraint.create(leftOperand=key, operator=ODRL_IRI + "eq",
-                                                                       rightOperand=valid_interval[i])])
-                    if len(final_intervals) == 0:
-                        for interval in or_intervals:
-                            final_intervals.append(interval)
-                    else:
-                        new_final_constraints = []
-                        for c in final_intervals:
-                            for or_interval in or_intervals:
-                                new_final_constraints.append(c + or_interval)
-                        final_intervals = new_final_constraints
-            return Constraint.create(operator="or", constraints=final_intervals)
+            return _split_clause(self.constraints, value_map)
         return self
+
+
+class SplitPoints(dict):
+    """
+    Map from left operands to their sorted constant values, used to split intervals. It is built once per policy, and
+    shared by the split_intervals calls of all its rules, which also share the cells of equal bounds.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cells = dict()
+
+    @staticmethod
+    def of(value_map):
+        """
+        :param value_map: A map from left operands to constant values, or a SplitPoints.
+        :return: The SplitPoints of the map.
+        """
+        if isinstance(value_map, SplitPoints):
+            return value_map
+        return SplitPoints({key: sorted(values) for key, values in value_map.items()})
+
+    def between(self, key, min_value, max_value):
+        """
+        :return: The constant values of the left operand that are strictly between min_value and max_value.
+        """
+        values = self[key]
+        return values[bisect.bisect_right(values, min_value):bisect.bisect_left(values, max_value)]
+
+    def cells(self, key, min_value, max_value):
+        """
+        :return: The cells of the left operand between min_value and max_value, as a list of conjunctive clauses. They
+        are computed once for each bounds.
+        """
+        # Equal bounds of different types (e.g. 1 and 1.0) give different constraints.
+        bounds = (key, type(min_value), min_value, type(max_value), max_value)
+        if bounds not in self._cells:
+            if min_value == max_value:
+                cells = [[Constraint.create(leftOperand=key, operator=Operator.EQ, rightOperand=min_value)]]
+            else:
+                cells = _split_interval(key, min_value, max_value, self.between(key, min_value, max_value))
+            self._cells[bounds] = cells
+        return self._cells[bounds]
+
+    def bounds(self, constraints):
+        """
+        :param constraints: A conjunctive clause of normalised constraints.
+        :return: A map from the left operands of the clause that have constant values to their bounds (min_value,
+        max_value). Left operands that the clause does not bound are missing, and their bounds are infinite.
+        """
+        bounds = dict()
+        for c in constraints:
+            if c.leftOperand in self:
+                min_value, max_value = bounds.get(c.leftOperand, (-math.inf, math.inf))
+                if c.operator == Operator.GT:
+                    bounds[c.leftOperand] = (max(min_value, c.rightOperand), max_value)
+                elif c.operator == Operator.LT:
+                    bounds[c.leftOperand] = (min_value, min(max_value, c.rightOperand))
+                elif c.operator == Operator.EQ:
+                    bounds[c.leftOperand] = (c.rightOperand, c.rightOperand)
+        return bounds
+
+    def replace(self, value_map):
+        """
+        :param value_map: A map from left operands to their new constant values. Left operands without values are
+        removed.
+        :return: A new SplitPoints, which keeps the cells of the left operands that are not in value_map.
+        """
+        split_points = SplitPoints(self)
+        for key, values in value_map.items():
+            if len(values) > 0:
+                split_points[key] = sorted(values)
+            else:
+                split_points.pop(key, None)
+        split_points._cells = {bounds: cells for bounds, cells in self._cells.items() if bounds[0] not in value_map}
+        return split_points
+
+
+def _split_clause(constraints, value_map):
+    # Splits a conjunctive clause into the cells defined by the constant values of each left operand.
+    split_points = SplitPoints.of(value_map)
+    bounds = split_points.bounds(constraints)
+    final_intervals = []
+    for key in split_points.keys():
+        min_value, max_value = bounds.get(key, (-math.inf, math.inf))
+        or_intervals = split_points.cells(key, min_value, max_value)
+        if len(final_intervals) == 0:
+            # The cells are shared, so the clauses are copied.
+            final_intervals = [list(or_interval) for or_interval in or_intervals]
+        else:
+            final_intervals = [c + or_interval for c in final_intervals for or_interval in or_intervals]
+    return Constraint.create(operator="or", constraints=final_intervals)
+
+
+def _split_interval(key, min_value, max_value, values):
+    # Cells of the interval (min_value, max_value) in order: the open intervals between consecutive values, each
+    # followed by its lower value.
+    if len(values) == 0:  # No values between min value and max value.
+        and_intervals = []
+        if not min_value == -math.inf:
+            and_intervals.append(Constraint.create(leftOperand=key, operator=Operator.GT, rightOperand=min_value))
+        if not max_value == math.inf:
+            and_intervals.append(Constraint.create(leftOperand=key, operator=Operator.LT, rightOperand=max_value))
+        return [and_intervals]
+    if min_value == -math.inf:
+        or_intervals = [[Constraint.create(leftOperand=key, operator=Operator.LT, rightOperand=values[0])]]
+    else:
+        or_intervals = [[Constraint.create(leftOperand=key, operator=Operator.GT, rightOperand=min_value),
+                         Constraint.create(leftOperand=key, operator=Operator.LT, rightOperand=values[0])]]
+    for i in range(len(values)):
+        if i == len(values) - 1 and max_value == math.inf:
+            or_intervals.append([Constraint.create(leftOperand=key, operator=Operator.GT, rightOperand=values[i])])
+        else:
+            upper = values[i + 1] if i < len(values) - 1 else max_value
+            or_intervals.append([Constraint.create(leftOperand=key, operator=Operator.GT, rightOperand=values[i]),
+                                 Constraint.create(leftOperand=key, operator=Operator.LT, rightOperand=upper)])
+        or_intervals.append([Constraint.create(leftOperand=key, operator=Operator.EQ, rightOperand=values[i])])
+    return or_intervals
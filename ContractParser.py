@@ -1,8 +1,13 @@
 from rdflib import Graph, Namespace, URIRef
 from rdflib.namespace import RDF
+from rdflib.plugins.sparql import prepareQuery
+import functools
+import os
+import re
 import sys
 
 import Utils
+from ActionMetadataIndex import ActionMetadataIndex
 
 if sys.version_info[0] < 3:
     raise Exception("Python 3.11 or higher is required.")
@@ -13,11 +18,225 @@ if sys.version_info[1] < 11:
 class ContractParser:
     IDSA = Namespace("https://w3id.org/idsa/core/")
     UPCAST = Namespace("https://www.upcast-project.eu/upcast-vocab/1.0/")
+    ODRL = Namespace("http://www.w3.org/ns/odrl/2/")
+
+    # RDF format names used by rdflib.
+    RDF_FORMATS = [
+        "xml",       # RDF/XML
+        "turtle",    # Turtle / TTL
+        "nt",        # N-Triples
+        "n3",        # Notation3
+        "json-ld",   # JSON-LD
+        "trig",      # TriG
+        "trix",      # TriX
+    ]
+
+    FORMATS_BY_EXTENSION = {
+        ".rdf": "xml",
+        ".owl": "xml",
+        ".xml": "xml",
+        ".ttl": "turtle",
+        ".turtle": "turtle",
+        ".nt": "nt",
+        ".n3": "n3",
+        ".json": "json-ld",
+        ".jsonld": "json-ld",
+        ".trig": "trig",
+        ".trix": "trix",
+    }
+
+    BYTE_ORDER_MARKS = [
+        (b"\xef\xbb\xbf", "utf-8-sig"),
+        (b"\xff\xfe", "utf-16"),
+        (b"\xfe\xff", "utf-16"),
+    ]
+
+    # SPARQL queries of the action getters, by ActionMetadataIndex map. They are prepared once, and used when the
+    # contract graph was not loaded by the parser.
+    ACTION_QUERIES = {
+        "containers": """
+            PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
+            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+            PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
+
+            SELECT ?rightOperand
+            WHERE {
+            ?actionIRI rdf:value ?actionValue .
+            ?actionIRI odrl:refinement ?refinement .
+            ?refinement odrl:leftOperand upcast:implementedBy ;
+                        odrl:operator odrl:eq ;
+                        odrl:rightOperand ?rightOperand .
+            }
+        """,
+        "execution_commands": """
+            PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
+            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+            PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
+
+            SELECT ?rightOperand
+            WHERE {
+            ?actionIRI rdf:value ?actionValue .
+            ?actionIRI odrl:refinement ?refinement .
+            ?refinement odrl:leftOperand upcast:executionCommand ;
+                        odrl:operator odrl:eq ;
+                        odrl:rightOperand ?rightOperand .
+            }
+        """,
+        "execution_limits": """
+            PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
+            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+            PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
+
+            SELECT ?operator ?rightOperand
+            WHERE {
+            ?actionIRI rdf:value ?actionValue .
+            ?actionIRI odrl:refinement ?refinement .
+            ?refinement odrl:leftOperand odrl:count ;
+                        odrl:operator ?operator;
+                        odrl:rightOperand ?rightOperand .
+            }
+        """,
+        "carbon_emission_limits": """
+            PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
+            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+            PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
+
+            SELECT ?rightOperand ?unit
+            WHERE {
+            ?actionIRI rdf:value ?actionValue .
+            ?actionIRI odrl:constraint ?constraint .
+            ?constraint odrl:leftOperand upcast:operationCarbonEmission ;
+                        odrl:operator odrl:lteq;
+                        odrl:rightOperand ?rightOperand;
+                        odrl:unit ?unit  .
+            }
+        """,
+        "energy_consumption_limits": """
+            PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
+            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+            PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
+
+            SELECT ?rightOperand ?unit
+            WHERE {
+            ?actionIRI rdf:value ?actionValue .
+            ?actionIRI odrl:constraint ?constraint .
+            ?constraint odrl:leftOperand upcast:operationEnergyConsumption ;
+                        odrl:operator odrl:lteq;
+                        odrl:rightOperand ?rightOperand ;
+                        odrl:unit ?unit  .
+            }
+        """,
+        "datetime_constraints": """
+            PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
+            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+            PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
+
+            SELECT ?rule ?operator ?rightOperand
+            WHERE {
+            ?policy a ?type .
+            VALUES ?type { odrl:Agreement odrl:Policy odrl:Set odrl:Offer }
+            ?policy ?rule ?rulesetBnode .
+            ?rulesetBnode odrl:action ?actionIRI .
+            ?actionIRI rdf:value ?actionValue .
+            ?rulesetBnode odrl:constraint ?constraint .
+            ?constraint odrl:leftOperand odrl:dateTime ;
+                        odrl:operator ?operator;
+                        odrl:rightOperand ?rightOperand .
+            }
+        """,
+        "dependencies": """
+            PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
+            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+            PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
+
+            SELECT ?dependencyValue
+            WHERE {
+            ?agreement a ?type ;
+                 odrl:permission ?permission .
+            VALUES ?type { odrl:Agreement odrl:Policy odrl:Set odrl:Offer }
+            ?permission odrl:action ?actionIRI .
+            ?actionIRI rdf:value ?actionValue .
+            ?permission odrl:duty ?dutyIRI .
+            ?dutyIRI odrl:action ?dependencyIRI .
+            ?dependencyIRI rdf:value ?dependencyValue .
+            }
+        """,
+    }
 
     def __init__(self):
         self.contract_graph = None
+        # The graph read by load, and the index of its actions.
+        self._loaded_graph = None
+        self._action_index = None
 
-    def load(self, file_path):
+    @staticmethod
+    def guess_format(file_path):
+        """
+        Guesses the RDF serialization and encoding of a file from its extension, byte order mark and first bytes.
+
+        :param file_path: Path to an RDF file.
+        :return: A tuple (format, encoding). format is None if it cannot be guessed.
+        """
+        with open(file_path, "rb") as f:
+            head = f.read(4096)
+        encoding = "utf-8"
+        for bom, bom_encoding in ContractParser.BYTE_ORDER_MARKS:
+            if head.startswith(bom):
+                encoding = bom_encoding
+                break
+        text = head.decode(encoding, errors="ignore").lstrip()
+
+        extension = os.path.splitext(file_path)[1].lower()
+        rdf_format = ContractParser.FORMATS_BY_EXTENSION.get(extension, None)
+        if rdf_format == "xml" and "<TriX" in text:
+            rdf_format = "trix"
+        if rdf_format is not None:
+            return rdf_format, encoding
+
+        if text.startswith("{") or text.startswith("["):
+            return "json-ld", encoding
+        elif text.startswith("<?xml") or re.match(r"<[A-Za-z]", text):
+            return ("trix" if "<TriX" in text else "xml"), encoding
+        elif re.match(r"(@prefix|@base|PREFIX|BASE)\b", text):
+            return "turtle", encoding
+        elif re.match(r"(<[^>\s]*>|_:\S+)\s+<[^>\s]*>\s+\S", text):
+            return "nt", encoding
+        return None, encoding
+
+    def load(self, file_path, format=None):
+        """
+        Loads the contract data from the specified file path.
+        The RDF serialization is taken from the format argument, or guessed from the file, so that the file is
+        parsed only once. If the guess is wrong, every serialization and encoding is tried with load_any_format.
+
+        :param file_path: Path to an RDF file.
+        :param format: Optional; an rdflib format name such as 'turtle', 'xml' or 'json-ld'.
+        """
+        rdf_format, encoding = ContractParser.guess_format(file_path)
+        if format is not None:
+            rdf_format = format
+        if rdf_format is None:
+            self.load_any_format(file_path)
+            return
+
+        self.contract_graph = Graph()
+        try:
+            if encoding == "utf-8":
+                self.contract_graph.parse(file_path, format=rdf_format)
+            else:
+                with open(file_path, "r", encoding=encoding) as f:
+                    self.contract_graph.parse(data=f.read(), format=rdf_format)
+        except Exception as e:
+            if format is not None:
+                raise ValueError(f"Failed to parse RDF file {file_path} as {format}. Error: {e}")
+            self.load_any_format(file_path)
+            return
+        self.contract_graph.bind("idsa-core", ContractParser.IDSA)
+        self.contract_graph.bind("upcast", ContractParser.UPCAST)
+        self._loaded_graph = self.contract_graph
+        self._action_index = None
+
+    def load_any_format(self, file_path):
         """
         Loads the contract data from the specified file path.
         Tries multiple RDF serializations and encodings until one succeeds, or
@@ -25,15 +244,7 @@ class ContractParser:
         """
         self.contract_graph = Graph()
 
-        rdf_formats = [
-            "xml",       # RDF/XML
-            "turtle",    # Turtle / TTL
-            "nt",        # N-Triples
-            "n3",        # Notation3
-            "json-ld",   # JSON-LD
-            "trig",      # TriG
-            "trix",      # TriX
-        ]
+        rdf_formats = ContractParser.RDF_FORMATS
 
         # Try parsing with each format
         last_exception = None
@@ -69,6 +280,8 @@ class ContractParser:
             )
         self.contract_graph.bind("idsa-core", ContractParser.IDSA)
         self.contract_graph.bind("upcast", ContractParser.UPCAST)
+        self._loaded_graph = self.contract_graph
+        self._action_index = None
 
     def query(self, query_string):
         """
@@ -167,56 +380,16 @@ class ContractParser:
         Input: action Value, i.e. , its name in String format
         Output: URL of the container that implements the input action IRI, None if not specified in the contract
         """
-
-        if self.contract_graph is None:
-            raise Exception("No contract loaded into this parser")
-
-        query = """
-        PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
-
-        SELECT ?rightOperand
-        WHERE {
-        ?actionIRI rdf:value ?actionValue .
-        ?actionIRI odrl:refinement ?refinement .
-        ?refinement odrl:leftOperand upcast:implementedBy ;
-                    odrl:operator odrl:eq ;
-                    odrl:rightOperand ?rightOperand .
-        }
-        """
-        qres = self.contract_graph.query(query,initBindings={'actionValue': URIRef(actionValue)})
-        qres_list = list(qres)
-
-        return str(qres_list[0]["rightOperand"]) if len(qres) > 0 else None
+        rows = self._action_rows("containers", actionValue)
+        return str(rows[0][0]) if len(rows) > 0 else None
 
     def get_action_execution_command(self,actionValue):
         """
         Input: action Value, i.e. , its name in String format
         Output: URL of the container that implements the input action IRI, None if not specified in the contract
         """
-
-        if self.contract_graph is None:
-            raise Exception("No contract loaded into this parser")
-
-        query = """
-        PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
-
-        SELECT ?rightOperand
-        WHERE {
-        ?actionIRI rdf:value ?actionValue .
-        ?actionIRI odrl:refinement ?refinement .
-        ?refinement odrl:leftOperand upcast:executionCommand ;
-                    odrl:operator odrl:eq ;
-                    odrl:rightOperand ?rightOperand .
-        }
-        """
-        qres = self.contract_graph.query(query,initBindings={'actionValue': URIRef(actionValue)})
-        qres_list = list(qres)
-
-        return str(qres_list[0]["rightOperand"]) if len(qres) > 0 else None
+        rows = self._action_rows("execution_commands", actionValue)
+        return str(rows[0][0]) if len(rows) > 0 else None
 
     def get_action_execution_limits(self,actionValue):
         """
@@ -224,30 +397,9 @@ class ContractParser:
         output: list of tuple of the form (operator, rightOperand) where operator is the comparison odrl operator (eq,lteq,gteq,gt) and rightOperand the integer value.
                 An empty list is returned if the action does not have any execution limit
         """
-        if self.contract_graph is None:
-            raise Exception("No contract loaded into this parser")
-
-        query = """
-        PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
-
-        SELECT ?operator ?rightOperand
-        WHERE {
-        ?actionIRI rdf:value ?actionValue .
-        ?actionIRI odrl:refinement ?refinement .
-        ?refinement odrl:leftOperand odrl:count ;
-                    odrl:operator ?operator;
-                    odrl:rightOperand ?rightOperand .
-        }
-        """
-        qres = self.contract_graph.query(query,initBindings={'actionValue': URIRef(actionValue)})
         limits = []
-        for row in qres:
-            operator = str(row["operator"]).split("/")[-1]
-            value = int(row["rightOperand"])
-            limits.append((operator,value))
-
+        for operator, right_operand in self._action_rows("execution_limits", actionValue):
+            limits.append((str(operator).split("/")[-1], int(right_operand)))
         return limits
 
     def get_action_carbon_emission_limit(self,actionValue):
@@ -256,26 +408,11 @@ class ContractParser:
         output: Float value of maximum carbon emission agreed for this operation (that is, operator less ro equal than is assumed)
           returns None if there is no carbon emission limit defined in the contract
         """
-        query = """
-        PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
-
-        SELECT ?rightOperand ?unit
-        WHERE {
-        ?actionIRI rdf:value ?actionValue .
-        ?actionIRI odrl:constraint ?constraint .
-        ?constraint odrl:leftOperand upcast:operationCarbonEmission ;
-                    odrl:operator odrl:lteq;
-                    odrl:rightOperand ?rightOperand;
-                    odrl:unit ?unit  .
-        }
-        """
-        qres = list(self.contract_graph.query(query,initBindings={'actionValue': URIRef(actionValue)}))
-        if len(qres) == 0:
+        rows = self._action_rows("carbon_emission_limits", actionValue)
+        if len(rows) == 0:
             return None
-        result = qres[0]
-        return (result["rightOperand"].toPython(),result["unit"].toPython())
+        right_operand, unit = rows[0]
+        return (right_operand.toPython(),unit.toPython())
 
     def get_action_energy_consumption_limit(self,actionValue):
         """
@@ -283,27 +420,11 @@ class ContractParser:
         output: tuple (value,unit), with value a float of maximum energy consumption agreed for this operation (that is, operator less ro equal than is assumed)
              unit a string with the unit of the value
         """
-        query = """
-        PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
-
-        SELECT ?rightOperand ?unit
-        WHERE {
-        ?actionIRI rdf:value ?actionValue .
-        ?actionIRI odrl:constraint ?constraint .
-        ?constraint odrl:leftOperand upcast:operationEnergyConsumption ;
-                    odrl:operator odrl:lteq;
-                    odrl:rightOperand ?rightOperand ;
-                    odrl:unit ?unit  .
-        }
-        """
-        qres = self.contract_graph.query(query,initBindings={'actionValue': URIRef(actionValue)})
-        qres = list(self.contract_graph.query(query,initBindings={'actionValue': URIRef(actionValue)}))
-        if len(qres) == 0:
+        rows = self._action_rows("energy_consumption_limits", actionValue)
+        if len(rows) == 0:
             return None
-        result = qres[0]
-        return (result["rightOperand"].toPython(),result["unit"].toPython())
+        right_operand, unit = rows[0]
+        return (right_operand.toPython(),unit.toPython())
 
     def get_action_datetime_constraints(self,actionValue):
         """
@@ -311,31 +432,9 @@ class ContractParser:
         output: list of tuple of the form (operator, datetime) where rule is one of {Permission,Prohibition,Duty}, operator is the comparison odrl operator (eq,lt,lteq,gteq,gt) and datetime is the constrained datetime.
                 An empty list is returned if the action does not have any datetime constraint.
         """
-        query = """
-        PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
-
-        SELECT ?rule ?operator ?rightOperand
-        WHERE {
-        ?policy a ?type .
-        VALUES ?type { odrl:Agreement odrl:Policy odrl:Set odrl:Offer }
-        ?policy ?rule ?rulesetBnode .
-        ?rulesetBnode odrl:action ?actionIRI .
-        ?actionIRI rdf:value ?actionValue .
-        ?rulesetBnode odrl:constraint ?constraint .
-        ?constraint odrl:leftOperand odrl:dateTime ;
-                    odrl:operator ?operator;
-                    odrl:rightOperand ?rightOperand .
-        }
-        """
-        qres = self.contract_graph.query(query,initBindings={'actionValue': URIRef(actionValue)})
         limits = []
-        for row in qres:
-            rule = str(row["rule"]).split("/")[-1]
-            operator = str(row["operator"]).split("/")[-1]
-            value = row["rightOperand"].toPython()
-            limits.append((operator,value))
+        for rule, operator, right_operand in self._action_rows("datetime_constraints", actionValue):
+            limits.append((str(operator).split("/")[-1], right_operand.toPython()))
         return limits
 
     def get_action_dependencies(self,actionValue):
@@ -343,34 +442,67 @@ class ContractParser:
         input: actionValue, that is the name of the action in string format
         output: list of actions that must be executed before the input action according to the loaded contract
         """
+        return [str(dependency_value) for dependency_value, in self._action_rows("dependencies", actionValue)]
+
+    def get_action_index(self):
+        """
+        :return: The ActionMetadataIndex of the loaded contract, built on first use, or None if the contract graph was
+        not loaded by this parser (e.g. it was assigned to contract_graph), as it may still be modified.
+        """
         if self.contract_graph is None:
             raise Exception("No contract loaded into this parser")
+        if self.contract_graph is not self._loaded_graph:
+            return None
+        if self._action_index is None:
+            self._action_index = ActionMetadataIndex(self.contract_graph)
+        return self._action_index
 
-        # Note the permission and not the action is the one that has a duty
-        query = """
-        PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX upcast: <https://www.upcast-project.eu/upcast-vocab/1.0/>
-
-        SELECT ?dependencyValue
-        WHERE {
-        ?agreement a ?type ;
-             odrl:permission ?permission .
-        VALUES ?type { odrl:Agreement odrl:Policy odrl:Set odrl:Offer }
-        ?permission odrl:action ?actionIRI .
-        ?actionIRI rdf:value ?actionValue .
-        ?permission odrl:duty ?dutyIRI .
-        ?dutyIRI odrl:action ?dependencyIRI .
-        ?dependencyIRI rdf:value ?dependencyValue .
-        }
+    @staticmethod
+    @functools.cache
+    def prepared_query(name):
         """
+        :param name: The name of a query of ACTION_QUERIES.
+        :return: The query, parsed once.
+        """
+        return prepareQuery(ContractParser.ACTION_QUERIES[name])
 
-        qres = self.contract_graph.query(query,initBindings={'actionValue': URIRef(actionValue)})
-        dependencies = [str(row["dependencyValue"]) for row in qres]
-        return dependencies
+    def _action_rows(self, name, actionValue):
+        # Rows of the metadata of an action, from the index or from the prepared query.
+        index = self.get_action_index()
+        if index is not None:
+            return index.rows(name, actionValue)
+        query_results = self.contract_graph.query(ContractParser.prepared_query(name),
+                                                  initBindings={'actionValue': URIRef(actionValue)})
+        return [tuple(row) for row in query_results]
 
     def get_values_from_constraints(self):
         """
+        :return: A map from each left operand to the sorted list of the distinct right operands of the constraints
+        with that left operand. The right operands are converted as in the constraints of the parsed policy
+        (Utils.node_to_element).
+        """
+
+        if self.contract_graph is None:
+            raise Exception("No contract loaded into this parser")
+
+        # The constraint triples are read directly, without the SPARQL engine: the left and right operands are each read
+        # with one scan of their predicate, and joined on the constraint. Each distinct node is converted once.
+        right_operands = dict()
+        for constraint, right_operand in self.contract_graph.subject_objects(ContractParser.ODRL.rightOperand):
+            right_operands.setdefault(constraint, []).append(right_operand)
+        nodes = dict()
+        for constraint, left_operand in self.contract_graph.subject_objects(ContractParser.ODRL.leftOperand):
+            if constraint in right_operands:
+                nodes.setdefault(str(left_operand), set()).update(right_operands[constraint])
+        return {left_operand: sorted({Utils.node_to_element(node) for node in right_operands})
+                for left_operand, right_operands in nodes.items()}
+
+    def query_values_from_constraints(self):
+        """
+        The former version of get_values_from_constraints, with a SPARQL query, kept for benchmarks. The right operands
+        of each left operand are concatenated and split on spaces, so values with spaces are split too, and duplicates
+        are kept.
+
         :return: All right operands associated with a particular constraint.
         """
 
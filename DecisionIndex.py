@@ -0,0 +1,186 @@
+"""
+Description: Decision index of a normalised policy, which answers single access requests without scanning rules.
+Rules are grouped by action, target and assignee, and the constants of each left operand split its values into
+cells. A request is located in the cells of each left operand by binary search, and the rules that apply to it are
+the intersection of the rule bitmasks of its cells.
+
+Contributors:
+
+"""
+import bisect
+import collections
+
+from Constraint import ArithmeticConstraint, Operator
+
+# The maximum number of combinations of action, target and assignee whose groups are remembered.
+MAX_QUERIES = 4096
+
+
+class _Group:
+    def __init__(self, breakpoints):
+        """
+        Rules with the same action, target and assignee, numbered by their bit in the masks.
+
+        :param breakpoints: A map from left operands to sorted lists of constants.
+        """
+        self.breakpoints = breakpoints
+        # For each left operand, the mask of the rules that include each cell, and of the rules that do not constrain
+        # the left operand.
+        self.cells = dict()
+        self.unconstrained = dict()
+        # Rules with constraints that are not intervals, checked one by one.
+        self.residual = dict()
+        self.rules = 0
+        self.size = 0
+
+    def add(self, ranges, residual_constraints):
+        bit = 1 << self.size
+        self.size += 1
+        self.rules |= bit
+        for key in ranges.keys() - self.cells.keys():
+            self.cells[key] = [0] * (2 * len(self.breakpoints[key]) + 1)
+            self.unconstrained[key] = self.rules & ~bit
+        for key in self.cells:
+            if key in ranges:
+                low, high = ranges[key]
+                for cell in range(low, high + 1):
+                    self.cells[key][cell] |= bit
+            else:
+                self.unconstrained[key] |= bit
+        if residual_constraints:
+            self.residual[bit] = residual_constraints
+
+    def match(self, values):
+        """
+        :return: True if a rule of the group applies to the values.
+        """
+        mask = self.rules
+        for key, cells in self.cells.items():
+            value = values.get(key)
+            if value is None or value != value:
+                mask &= self.unconstrained[key]
+            else:
+                mask &= cells[_cell(self.breakpoints[key], value)] | self.unconstrained[key]
+            if mask == 0:
+                return False
+        for bit, constraints in self.residual.items():
+            if mask & bit and not all(constraint.leftOperand in values and constraint.check_constraint(
+                    constraint.leftOperand, values[constraint.leftOperand]) for constraint in constraints):
+                mask &= ~bit
+        return mask != 0
+
+
+def _cell(breakpoints, value):
+    # Cells alternate between open intervals and constants: (-inf, b0), b0, (b0, b1), b1, ..., (bn, inf).
+    i = bisect.bisect_left(breakpoints, value)
+    if i < len(breakpoints) and breakpoints[i] == value:
+        return 2 * i + 1
+    return 2 * i
+
+
+class DecisionIndex:
+    def __init__(self, breakpoints):
+        """
+        Initializes an empty DecisionIndex instance. Use DecisionIndex.compile to build the index of a policy.
+
+        :param breakpoints: A map from left operands to sorted lists of constants.
+        """
+        self.breakpoints = breakpoints
+        self.permissions = dict()
+        self.prohibitions = dict()
+        self._queries = collections.OrderedDict()
+
+    @staticmethod
+    def compile(normal_policy, value_map=None):
+        """
+        Builds the decision index of a normalised policy.
+
+        :param normal_policy: A normalised policy. Its intervals may be split (Policy.split_intervals) or not.
+        :param value_map: Optional map from left operands to constant values, as returned by
+        get_values_from_constraints. The constants of the rules are always added.
+        :return: A DecisionIndex.
+        """
+        constants = {key: set(values) for key, values in value_map.items()} if value_map else dict()
+        for rule in normal_policy.permission + normal_policy.prohibition:
+            for constraint in rule.constraint:
+                if DecisionIndex._is_interval(constraint):
+                    constants.setdefault(constraint.leftOperand, set()).add(constraint.rightOperand)
+        index = DecisionIndex({key: sorted(values) for key, values in constants.items()})
+        for rules, groups in ((normal_policy.permission, index.permissions),
+                              (normal_policy.prohibition, index.prohibitions)):
+            for rule in rules:
+                index._add_rule(rule, groups)
+        return index
+
+    @staticmethod
+    def _is_interval(constraint):
+        return isinstance(constraint, ArithmeticConstraint) and constraint.operator in (
+            Operator.EQ, Operator.GT, Operator.LT)
+
+    def _add_rule(self, rule, groups):
+        ranges = dict()
+        residual_constraints = []
+        for constraint in rule.constraint:
+            if not DecisionIndex._is_interval(constraint):
+                residual_constraints.append(constraint)
+                continue
+            breakpoints = self.breakpoints[constraint.leftOperand]
+            low, high = ranges.get(constraint.leftOperand, (0, 2 * len(breakpoints)))
+            cell = _cell(breakpoints, constraint.rightOperand)
+            if constraint.operator == Operator.EQ:
+                low, high = max(low, cell), min(high, cell)
+            elif constraint.operator == Operator.GT:
+                low = max(low, cell + 1)
+            else:
+                high = min(high, cell - 1)
+            ranges[constraint.leftOperand] = (low, high)
+        if any(low > high for low, high in ranges.values()):
+            return
+        for key in DecisionIndex._keys(rule.action, rule.target, rule.assignee):
+            if key not in groups:
+                groups[key] = _Group(self.breakpoints)
+            groups[key].add(ranges, residual_constraints)
+
+    @staticmethod
+    def _keys(actions, targets, assignees):
+        # Rules without actions, targets or assignees apply to all of them, and are indexed under None.
+        for action in [str(action.value) for action in actions] or [None]:
+            for target in [str(target.value) for target in targets] or [None]:
+                for assignee in [str(assignee.value) for assignee in assignees] or [None]:
+                    yield action, target, assignee
+
+    def decide(self, values, action=None, target=None, assignee=None):
+        """
+        Decides a single request. Prohibitions take precedence over permissions.
+
+        :param values: A map from left operands to the values of the request. Missing values do not satisfy any
+        constraint.
+        :param action: The action of the request, or None to ignore actions.
+        :param target: The target of the request, or None to ignore targets.
+        :param assignee: The assignee of the request, or None to ignore assignees.
+        :return: True if a permission and no prohibition applies to the request.
+        """
+        return not self.denies(values, action, target, assignee) and any(
+            group.match(values) for group in self._candidates("permissions", action, target, assignee))
+
+    def denies(self, values, action=None, target=None, assignee=None):
+        """
+        :return: True if a prohibition applies to the request.
+        """
+        return any(group.match(values) for group in self._candidates("prohibitions", action, target, assignee))
+
+    def _candidates(self, rules, action, target, assignee):
+        # The groups that apply to the most recent combinations of action, target and assignee are remembered.
+        action, target, assignee = (None if value is None else str(value) for value in (action, target, assignee))
+        query = (rules, action, target, assignee)
+        if query in self._queries:
+            self._queries.move_to_end(query)
+            return self._queries[query]
+        candidates = [group for key, group in getattr(self, rules).items() if
+                      (action is None or key[0] is None or key[0] == action)
+                      and (target is None or key[1] is None or key[1] == target)
+                      and (assignee is None or key[2] is None or key[2] == assignee)]
+        self._queries[query] = candidates
+        if len(self._queries) > MAX_QUERIES:
+            self._queries.popitem(last=False)
+        return candidates
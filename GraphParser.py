@@ -3,7 +3,7 @@ from rdflib import Graph, RDF
 
 import Refinables, Utils
 from Refinables import Refinable
-from Constraint import Constraint, LogicalConstraint
+from Constraint import Constraint, LogicalConstraint, Operator
 from Policy import Policy, Permission, Prohibition, Obligation
 
 ODRL = rdflib.Namespace("http://www.w3.org/ns/odrl/2/")
@@ -12,9 +12,54 @@ ODRL_OR = rdflib.URIRef("http://www.w3.org/ns/odrl/2/or")
 ID_NODE = rdflib.URIRef("@id")
 
 
-class GraphParser:
-    def __init__(self, graph=Graph()):
+class _TripleIndex:
+    def __init__(self, graph):
+        """
+        Subject -> predicate -> objects index of a graph. The triples of each subject are read from the graph with a
+        single query the first time the subject is reached, and the membership, objects and value queries of
+        GraphParser are answered from the index. Queries without a subject are passed to the graph.
+        """
         self.graph = graph
+        self.index = dict()
+
+    def _predicates(self, subject):
+        if subject not in self.index:
+            # Objects keep the order of the graph, so parsed policies are the same as without the index.
+            predicates = dict()
+            for predicate, obj in self.graph.predicate_objects(subject):
+                predicates.setdefault(predicate, []).append(obj)
+            self.index[subject] = predicates
+        return self.index[subject]
+
+    def __contains__(self, triple):
+        subject, predicate, obj = triple
+        if subject is None:
+            return triple in self.graph
+        objects = self._predicates(subject).get(predicate, ())
+        return len(objects) > 0 if obj is None else obj in objects
+
+    def objects(self, subject, predicate):
+        if subject is None:
+            return self.graph.objects(subject, predicate)
+        return iter(self._predicates(subject).get(predicate, ()))
+
+    def value(self, subject, predicate):
+        if subject is None:
+            return self.graph.value(subject, predicate)
+        objects = self._predicates(subject).get(predicate, ())
+        return objects[0] if objects else None
+
+
+class GraphParser:
+    def __init__(self, graph=Graph(), indexed=False):
+        """
+        Initializes a GraphParser instance.
+
+        :param graph: The rdflib Graph of a contract.
+        :param indexed: If True, the triples of the graph are indexed by subject and predicate with one pass, and
+        policies are parsed from the index instead of querying the graph for every node.
+        """
+        self.graph = _TripleIndex(graph) if indexed else graph
 
     def parse(self) -> Policy:
         policy = self.graph.value(RDF.type, ODRL.Policy)
@@ -132,9 +177,9 @@ class GraphParser:
         for constraint in constraints:
             if (constraint, ODRL.leftOperand, None) in self.graph:
                 left_operand = str(self.graph.value(constraint, ODRL.leftOperand))
-                operator = str(self.graph.value(constraint, ODRL.operator))
+                operator = Operator.from_iri(str(self.graph.value(constraint, ODRL.operator)))
                 if (constraint, ODRL.rightOperand, None) in self.graph:
-                    right_operand = Utils.string_to_element(str(self.graph.value(constraint, ODRL.rightOperand)))
+                    right_operand = Utils.node_to_element(self.graph.value(constraint, ODRL.rightOperand))
                 else:
                     right_operand = self.graph.value(constraint, ODRL.rightOperandReference)
                 constraint_list.append(Constraint.create(left_operand, operator, right_operand))
@@ -0,0 +1,115 @@
+"""
+Description: Optional instrumentation of the comparison pipeline. Stages report their wall time, and normalisation,
+splitting and comparison report counters, to the registered hooks. Without hooks, instrumentation is disabled and
+call sites only check the enabled flag.
+
+Contributors:
+
+"""
+import time
+
+# True if at least one hook is registered. Call sites in loops check it before reporting anything.
+enabled = False
+_hooks = []
+
+
+def add_hook(callback):
+    """
+    Registers a hook, and enables instrumentation.
+
+    :param callback: A function callback(kind, name, value), where kind is 'stage' (value is the wall time of the
+    stage in seconds), 'count' (value is added to a counter) or 'max' (value is a candidate maximum).
+    """
+    global enabled
+    _hooks.append(callback)
+    enabled = True
+
+
+def remove_hook(callback):
+    global enabled
+    _hooks.remove(callback)
+    enabled = len(_hooks) > 0
+
+
+def emit(kind, name, value):
+    for callback in _hooks:
+        callback(kind, name, value)
+
+
+def count(name, value=1):
+    if enabled:
+        emit("count", name, value)
+
+
+def maximum(name, value):
+    if enabled:
+        emit("max", name, value)
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        emit("stage", self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """
+    :return: A context manager that reports the wall time of its block as the given stage.
+    """
+    return _Stage(name) if enabled else _NO_STAGE
+
+
+class PipelineStats:
+    def __init__(self):
+        """
+        Initializes a PipelineStats instance, a hook that aggregates stage times, counters and maxima.
+        It can be used as a context manager, which registers the hook on entry and removes it on exit.
+        """
+        self.stages = dict()
+        self.counters = dict()
+        self.maxima = dict()
+
+    def __call__(self, kind, name, value):
+        if kind == "stage":
+            seconds, calls = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (seconds + value, calls + 1)
+        elif kind == "count":
+            self.counters[name] = self.counters.get(name, 0) + value
+        elif kind == "max":
+            if name not in self.maxima or value > self.maxima[name]:
+                self.maxima[name] = value
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        remove_hook(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "stages": {name: {"seconds": round(seconds, 6), "calls": calls}
+                       for name, (seconds, calls) in self.stages.items()},
+            "counters": dict(self.counters),
+            "maxima": dict(self.maxima),
+        }
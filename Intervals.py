@@ -0,0 +1,203 @@
+"""
+Description: Intervals and N-dimensional boxes over left operands, used to compare normalised rules symbolically
+instead of splitting them into grid cells.
+
+Contributors:
+
+"""
+from Constraint import ArithmeticConstraint, Operator
+
+
+def _below(value1, closed1, value2, closed2):
+    # True if the lower bound (value1, closed1) is weaker than the lower bound (value2, closed2).
+    if value1 is None:
+        return value2 is not None
+    if value2 is None:
+        return False
+    return value1 < value2 or (value1 == value2 and closed1 and not closed2)
+
+
+def _above(value1, closed1, value2, closed2):
+    # True if the upper bound (value1, closed1) is weaker than the upper bound (value2, closed2).
+    if value1 is None:
+        return value2 is not None
+    if value2 is None:
+        return False
+    return value1 > value2 or (value1 == value2 and closed1 and not closed2)
+
+
+class Interval:
+    def __init__(self, low=None, low_closed=False, high=None, high_closed=False):
+        """
+        Initializes an Interval instance.
+
+        :param low: The lower bound, or None if the interval is not bounded below.
+        :param low_closed: True if the lower bound is included in the interval.
+        :param high: The upper bound, or None if the interval is not bounded above.
+        :param high_closed: True if the upper bound is included in the interval.
+        """
+        self.low = low
+        self.low_closed = low_closed and low is not None
+        self.high = high
+        self.high_closed = high_closed and high is not None
+
+    @staticmethod
+    def point(value):
+        return Interval(value, True, value, True)
+
+    def __str__(self):
+        low = "(-inf" if self.low is None else ("[" if self.low_closed else "(") + str(self.low)
+        high = "inf)" if self.high is None else str(self.high) + ("]" if self.high_closed else ")")
+        return low + ", " + high
+
+    def __eq__(self, other):
+        if isinstance(other, Interval):
+            return (self.low, self.low_closed, self.high, self.high_closed) == (
+                other.low, other.low_closed, other.high, other.high_closed)
+        return False
+
+    def is_full(self):
+        return self.low is None and self.high is None
+
+    def is_point(self):
+        return self.low is not None and self.low == self.high and self.low_closed and self.high_closed
+
+    def is_empty(self):
+        if self.low is None or self.high is None:
+            return False
+        if self.low == self.high:
+            return not (self.low_closed and self.high_closed)
+        return self.low > self.high
+
+    def intersect(self, other):
+        if _below(self.low, self.low_closed, other.low, other.low_closed):
+            low, low_closed = other.low, other.low_closed
+        else:
+            low, low_closed = self.low, self.low_closed
+        if _above(self.high, self.high_closed, other.high, other.high_closed):
+            high, high_closed = other.high, other.high_closed
+        else:
+            high, high_closed = self.high, self.high_closed
+        return Interval(low, low_closed, high, high_closed)
+
+    def subtract(self, other):
+        """
+        :return: The non-empty parts of this interval below and above the other interval.
+        """
+        ans = []
+        if other.low is not None:
+            below = self.intersect(Interval(None, False, other.low, not other.low_closed))
+            if not below.is_empty():
+                ans.append(below)
+        if other.high is not None:
+            above = self.intersect(Interval(other.high, not other.high_closed, None, False))
+            if not above.is_empty():
+                ans.append(above)
+        return ans
+
+    def to_constraints(self, left_operand):
+        if self.is_point():
+            return [ArithmeticConstraint(left_operand, Operator.EQ, self.low)]
+        ans = []
+        if self.low is not None:
+            ans.append(ArithmeticConstraint(left_operand, Operator.GTEQ if self.low_closed else Operator.GT, self.low))
+        if self.high is not None:
+            ans.append(ArithmeticConstraint(left_operand, Operator.LTEQ if self.high_closed else Operator.LT, self.high))
+        return ans
+
+
+class Box:
+    def __init__(self, intervals=None):
+        """
+        Initializes a Box instance, i.e. a product of intervals.
+
+        :param intervals: A map from left operands to Interval objects. Missing left operands are not bounded.
+        """
+        self.intervals = intervals if intervals else dict()
+
+    def __str__(self):
+        return " x ".join(f"{key} {interval}" for key, interval in self.intervals.items())
+
+    @staticmethod
+    def from_constraints(constraints):
+        """
+        Builds a Box from a conjunctive clause of a normalised rule.
+
+        :param constraints: A list of constraints.
+        :return: A tuple (box, other_constraints) where other_constraints are the constraints that are not 'eq',
+        'gt' or 'lt'. box is None if the clause is unsatisfiable.
+        """
+        intervals = dict()
+        other_constraints = []
+        for constraint in constraints:
+            if isinstance(constraint, ArithmeticConstraint) and constraint.operator == Operator.EQ:
+                interval = Interval.point(constraint.rightOperand)
+            elif isinstance(constraint, ArithmeticConstraint) and constraint.operator == Operator.GT:
+                interval = Interval(low=constraint.rightOperand)
+            elif isinstance(constraint, ArithmeticConstraint) and constraint.operator == Operator.LT:
+                interval = Interval(high=constraint.rightOperand)
+            else:
+                other_constraints.append(constraint)
+                continue
+            if constraint.leftOperand in intervals:
+                interval = intervals[constraint.leftOperand].intersect(interval)
+            intervals[constraint.leftOperand] = interval
+        for interval in intervals.values():
+            if interval.is_empty():
+                return None, other_constraints
+        return Box(intervals), other_constraints
+
+    def is_empty(self):
+        return any(interval.is_empty() for interval in self.intervals.values())
+
+    def intersect(self, other):
+        """
+        :return: The intersection of both boxes, or None if it is empty.
+        """
+        intervals = dict(self.intervals)
+        for key, interval in other.intervals.items():
+            if key in intervals:
+                interval = intervals[key].intersect(interval)
+                if interval.is_empty():
+                    return None
+            intervals[key] = interval
+        return Box(intervals)
+
+    def subtract(self, other):
+        """
+        Box subtraction: splits this box along the bounds of the other box, one left operand at a time.
+
+        :return: A list of disjoint boxes covering this box minus the other box.
+        """
+        if self.intersect(other) is None:
+            return [self]
+        ans = []
+        remaining = dict(self.intervals)
+        for key, interval in other.intervals.items():
+            current = remaining.get(key, Interval())
+            for part in current.subtract(interval):
+                intervals = dict(remaining)
+                intervals[key] = part
+                ans.append(Box(intervals))
+            remaining[key] = current.intersect(interval)
+        return ans
+
+    @staticmethod
+    def subtract_all(boxes, other_boxes):
+        """
+        :return: A list of disjoint boxes covering the union of boxes minus the union of other_boxes.
+        """
+        for other in other_boxes:
+            new_boxes = []
+            for box in boxes:
+                new_boxes.extend(box.subtract(other))
+            boxes = new_boxes
+            if len(boxes) == 0:
+                break
+        return boxes
+
+    def to_constraints(self):
+        ans = []
+        for key, interval in self.intervals.items():
+            ans.extend(interval.to_constraints(key))
+        return ans
@@ -0,0 +1,318 @@
+"""
+Description: Parser of ODRL policies written as JSON or JSON-LD, which maps the document directly to Policy, Rule and
+Constraint objects without building an RDF graph. Keys can be bare ODRL terms (as with the ODRL context), compact IRIs
+such as odrl:permission, or full IRIs. The policy is the same as the one that GraphParser builds from the graph of the
+document, and documents whose context cannot be interpreted without a JSON-LD processor are parsed with rdflib.
+
+Contributors:
+
+"""
+import json
+
+from rdflib import Literal, URIRef
+
+import Refinables
+import Utils
+from Constraint import Constraint, LogicalConstraint, Operator, ODRL_IRI
+from ContractParser import ContractParser
+from GraphParser import GraphParser
+from Policy import Policy, Permission, Prohibition, Obligation
+from Refinables import Refinable
+
+RDF_VALUE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#value"
+
+# Remote contexts that are known without fetching them.
+ODRL_CONTEXTS = frozenset(["http://www.w3.org/ns/odrl.jsonld", "https://www.w3.org/ns/odrl.jsonld"])
+ODRL_CONTEXT_PREFIXES = {
+    "odrl": ODRL_IRI,
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+    "owl": "http://www.w3.org/2002/07/owl#",
+    "dct": "http://purl.org/dc/terms/",
+    "skos": "http://www.w3.org/2004/02/skos/core#",
+    "foaf": "http://xmlns.com/foaf/0.1/",
+}
+
+# Values of bare ODRL terms are coerced to IRIs, as in the ODRL context. Vocabulary terms are relative to the ODRL
+# namespace.
+ID_TERMS = frozenset(["target", "assigner", "assignee", "source", "rightOperandReference"])
+VOCAB_TERMS = frozenset(["action", "leftOperand", "operator"])
+# Aliases of keywords in the ODRL context.
+ODRL_KEYWORD_ALIASES = {"uid": "@id", "type": "@type"}
+# Keywords of nodes and values that the parser interprets. Others (e.g. @graph, @list, @reverse) need rdflib.
+KEYWORDS = frozenset(["@context", "@id", "@type", "@value", "@language"])
+# Properties whose values are rules or constraints. References to nodes described elsewhere need rdflib.
+NODE_PROPERTIES = frozenset(ODRL_IRI + term for term in (
+    "permission", "prohibition", "obligation", "duty", "remedy", "consequence", "constraint", "refinement",
+    "refinable", "and", "or", "xor"))
+
+
+class _Node(dict):
+    """
+    Properties of a node, from the full IRIs of the properties to lists of values, which are rdflib terms or other
+    _Nodes. iri is None for blank nodes.
+    """
+
+    def __init__(self, iri=None):
+        super().__init__()
+        self.iri = iri
+
+    def first(self, iri):
+        values = self.get(iri)
+        return values[0] if values else None
+
+
+class JsonPolicyParser:
+    def __init__(self, document):
+        """
+        Initializes a JsonPolicyParser instance.
+
+        :param document: A JSON object with one policy.
+        :raises ValueError: If the document needs a JSON-LD processor, e.g. because of a remote or scoped context.
+        """
+        if not isinstance(document, dict):
+            raise ValueError("The document is not a single JSON object.")
+        self.document = document
+        self.prefixes = dict()
+        self.odrl_context = False
+        self._iris = set()
+        self._add_context(document.get("@context"))
+        self.policy = self._node(document)
+
+    @staticmethod
+    def load(file_path):
+        """
+        :param file_path: Path to a JSON or JSON-LD file.
+        :return: A JsonPolicyParser, or None if the file is not JSON or cannot be parsed without rdflib.
+        """
+        rdf_format, encoding = ContractParser.guess_format(file_path)
+        if rdf_format != "json-ld":
+            return None
+        try:
+            with open(file_path, "r", encoding=encoding) as f:
+                return JsonPolicyParser(json.load(f))
+        except (ValueError, UnicodeError):
+            return None
+
+    @staticmethod
+    def load_contract(file_path):
+        """
+        :param file_path: Path to a policy file.
+        :return: A JsonPolicyParser if the file is ODRL JSON that it can interpret, and otherwise a ContractParser
+        with the graph of the file. Both have get_values_from_constraints, and parse_contract parses either.
+        """
+        parser = JsonPolicyParser.load(file_path)
+        if parser is None:
+            parser = ContractParser()
+            parser.load(file_path)
+        return parser
+
+    @staticmethod
+    def parse_contract(parser) -> Policy:
+        if isinstance(parser, JsonPolicyParser):
+            return parser.parse()
+        return GraphParser(parser.contract_graph, indexed=True).parse()
+
+    @staticmethod
+    def parse_file(file_path):
+        """
+        Parses a policy file, directly if it is ODRL JSON that JsonPolicyParser can interpret, and otherwise as an
+        RDF graph.
+
+        :return: A tuple (values_per_constraints, policy).
+        """
+        parser = JsonPolicyParser.load_contract(file_path)
+        return parser.get_values_from_constraints(), JsonPolicyParser.parse_contract(parser)
+
+    def _add_context(self, context):
+        if context is None:
+            return
+        if isinstance(context, list):
+            for sub_context in context:
+                self._add_context(sub_context)
+        elif isinstance(context, str):
+            if context not in ODRL_CONTEXTS:
+                raise ValueError(f"Unknown remote context {context}.")
+            self.odrl_context = True
+            for prefix, iri in ODRL_CONTEXT_PREFIXES.items():
+                self.prefixes.setdefault(prefix, iri)
+        elif isinstance(context, dict):
+            # Only prefixes and aliases are interpreted, not term definitions or keywords such as @vocab.
+            for term, iri in context.items():
+                if term.startswith("@") or not isinstance(iri, str):
+                    raise ValueError(f"Unsupported context entry {term}.")
+                self.prefixes[term] = iri
+        else:
+            raise ValueError("Unsupported context.")
+
+    def _expand(self, value):
+        # Expands an alias or a compact IRI, which are resolved the same way as in rdflib.
+        if value in self.prefixes:
+            return self._expand(self.prefixes[value]) if self.prefixes[value] != value else value
+        prefix, separator, suffix = value.partition(":")
+        if separator and not suffix.startswith("//") and prefix in self.prefixes:
+            return self.prefixes[prefix] + suffix
+        return value
+
+    def _property(self, key):
+        """
+        :return: A tuple (IRI of the property, coercion of its string values), where the coercion is None, '@id'
+        or '@vocab'.
+        """
+        if ":" in key or key in self.prefixes:
+            return self._expand(key), None
+        if key in ID_TERMS:
+            return ODRL_IRI + key, "@id"
+        if key in VOCAB_TERMS:
+            return ODRL_IRI + key, "@vocab"
+        return ODRL_IRI + key, None
+
+    def _keywords(self, node):
+        if not self.odrl_context:
+            return node
+        return {ODRL_KEYWORD_ALIASES.get(key, key): value for key, value in node.items()}
+
+    def _node(self, node):
+        node = self._keywords(node)
+        iri = None
+        if "@id" in node:
+            iri = self._expand(node["@id"])
+            # A graph merges the nodes with the same IRI.
+            if iri.startswith("_:") or iri in self._iris:
+                raise ValueError(f"Node {iri} is described more than once.")
+            self._iris.add(iri)
+        properties = _Node(iri)
+        for key, values in node.items():
+            if key.startswith("@"):
+                if key not in KEYWORDS:
+                    raise ValueError(f"Unsupported keyword {key}.")
+                continue
+            property_iri, coercion = self._property(key)
+            terms = properties.setdefault(property_iri, [])
+            for value in values if isinstance(values, list) else [values]:
+                if value is None:
+                    continue
+                term = self._value(value, coercion)
+                if property_iri in NODE_PROPERTIES and not isinstance(term, _Node):
+                    raise ValueError(f"Reference {term} to a node described elsewhere.")
+                # Like the triples of a graph, equal values of a property are only kept once.
+                if isinstance(term, _Node) or term not in terms:
+                    terms.append(term)
+        return properties
+
+    def _value(self, value, coercion):
+        if isinstance(value, dict):
+            value = self._keywords(value)
+            for key in value.keys():
+                if key.startswith("@") and key not in KEYWORDS:
+                    raise ValueError(f"Unsupported keyword {key}.")
+            if "@value" in value:
+                return Literal(value["@value"])
+            if "@id" in value and all(key.startswith("@") for key in value.keys()):
+                if value["@id"].startswith("_:"):
+                    raise ValueError("Blank node identifiers are not supported.")
+                return URIRef(self._expand(value["@id"]))
+            return self._node(value)
+        if isinstance(value, str) and coercion is not None:
+            expanded = self._expand(value)
+            if coercion == "@vocab" and expanded == value and ":" not in value:
+                expanded = ODRL_IRI + value
+            return URIRef(expanded)
+        if isinstance(value, list):
+            raise ValueError("Nested lists are not supported.")
+        return Literal(value)
+
+    def parse(self) -> Policy:
+        """
+        :return: The policy of the document, as GraphParser.parse would build it from the graph of the document.
+        """
+        policy = self.policy
+        policy_type = self._keywords(self.document).get("@type")
+        if isinstance(policy_type, list):
+            policy_type = policy_type[0] if policy_type else None
+        if policy_type is not None:
+            policy_type = self._expand(policy_type)
+            if self.odrl_context and ":" not in policy_type:
+                policy_type = ODRL_IRI + policy_type
+        return Policy(uid=None if policy.iri is None else URIRef(policy.iri),
+                      type=None if policy_type is None else URIRef(policy_type),
+                      conflict=policy.first(ODRL_IRI + "conflict"),
+                      permission=[self.parse_rule(node, Permission) for node in self._nodes(policy, "permission")],
+                      prohibition=[self.parse_rule(node, Prohibition) for node in self._nodes(policy, "prohibition")],
+                      obligation=[self.parse_rule(node, Obligation) for node in self._nodes(policy, "obligation")])
+
+    @staticmethod
+    def _nodes(node, term):
+        return [value for value in node.get(ODRL_IRI + term, []) if isinstance(value, _Node)]
+
+    def parse_rule(self, node, rule_type):
+        arguments = dict()
+        if ODRL_IRI + "target" in node:
+            arguments["target"] = self.parse_refinables(node[ODRL_IRI + "target"], Refinable, "refinement")
+        if ODRL_IRI + "action" in node:
+            # GraphParser reads the refinements of actions from odrl:refinable.
+            arguments["action"] = self.parse_refinables(node[ODRL_IRI + "action"], Refinables.Action, "refinable")
+        for term in ("assigner", "assignee"):
+            if ODRL_IRI + term in node:
+                arguments[term] = self.parse_refinables(node[ODRL_IRI + term], Refinable, "refinement")
+        if ODRL_IRI + "constraint" in node:
+            arguments["constraint"] = self.parse_constraints(node[ODRL_IRI + "constraint"])
+        # Rules have a single duty, remedy or consequence.
+        for term in {Permission: ("duty",), Prohibition: ("remedy",), Obligation: ("consequence",)}[rule_type]:
+            nodes = JsonPolicyParser._nodes(node, term)
+            if nodes:
+                arguments[term] = self.parse_rule(nodes[0], Obligation)
+        return rule_type(**arguments)
+
+    def parse_refinables(self, values, refinable_type, refinement_term):
+        refinables = []
+        for value in values:
+            if isinstance(value, _Node) and value.iri is not None:
+                # As in GraphParser, only blank nodes are read, and other nodes are identified by their IRI.
+                refinables.append(refinable_type(value=URIRef(value.iri)))
+            elif isinstance(value, _Node):
+                refinement = self.parse_constraints(value.get(ODRL_IRI + refinement_term, []))
+                if refinable_type is Refinables.Action:
+                    refinables.append(refinable_type(value=value.first(RDF_VALUE), refinement=refinement))
+                else:
+                    refinables.append(refinable_type(value=value.first(RDF_VALUE),
+                                                     source=value.first(ODRL_IRI + "source"), refinement=refinement))
+            else:
+                refinables.append(refinable_type(value=value))
+        return refinables
+
+    def parse_constraints(self, values) -> list[Constraint]:
+        constraint_list = []
+        for node in values:
+            if ODRL_IRI + "leftOperand" in node:
+                left_operand = str(node.first(ODRL_IRI + "leftOperand"))
+                operator = Operator.from_iri(str(node.first(ODRL_IRI + "operator")))
+                if ODRL_IRI + "rightOperand" in node:
+                    right_operand = Utils.node_to_element(node.first(ODRL_IRI + "rightOperand"))
+                else:
+                    right_operand = node.first(ODRL_IRI + "rightOperandReference")
+                constraint_list.append(Constraint.create(left_operand, operator, right_operand))
+            else:
+                for operator in ("and", "or", "xor"):
+                    if ODRL_IRI + operator in node:
+                        constraint_list.append(LogicalConstraint(
+                            operator=operator, constraints=self.parse_constraints(node[ODRL_IRI + operator])))
+                        break
+        return constraint_list
+
+    def get_values_from_constraints(self):
+        """
+        Same as ContractParser.get_values_from_constraints: the right operands of every node of the document with a
+        left operand, grouped by left operand.
+        """
+        right_operands = dict()
+        nodes = [self.policy]
+        while nodes:
+            node = nodes.pop()
+            for values in node.values():
+                nodes.extend(value for value in values if isinstance(value, _Node))
+            for left_operand in node.get(ODRL_IRI + "leftOperand", []):
+                for right_operand in node.get(ODRL_IRI + "rightOperand", []):
+                    right_operands.setdefault(str(left_operand), set()).add(Utils.node_to_element(right_operand))
+        return {left_operand: sorted(values) for left_operand, values in right_operands.items()}
@@ -1,14 +1,120 @@
-# TODO these dummy functions still need to be completed
+from concurrent.futures import ProcessPoolExecutor
 
-def normalise_policies(graphs, only_first=False):
+import Utils
+from ContractParser import ContractParser
+from GraphParser import GraphParser
+from JsonPolicyParser import JsonPolicyParser
+from PolicyComparer import PolicyComparer
+
+
+def _load_policy(graph):
+    """
+    Worker function: parses an rdflib graph or an RDF file.
+
+    :return: A tuple (values_per_constraints, policy).
+    """
+    if isinstance(graph, str):
+        return JsonPolicyParser.parse_file(graph)
+    parser = ContractParser()
+    parser.contract_graph = graph
+    return parser.get_values_from_constraints(), GraphParser(parser.contract_graph).parse()
+
+
+def _load_values(graph):
+    """
+    Worker function: reads the constant values of an rdflib graph or an RDF file, without parsing its policy.
+
+    :return: The values_per_constraints.
+    """
+    if isinstance(graph, str):
+        return JsonPolicyParser.load_contract(graph).get_values_from_constraints()
+    parser = ContractParser()
+    parser.contract_graph = graph
+    return parser.get_values_from_constraints()
+
+
+def _normalise_policy(policy, value_map):
+    """
+    Worker function: normalises a policy and splits its intervals.
+
+    :return: The normalised policy. Policy objects are much cheaper to send back to the parent process than graphs.
+    """
+    normal_policy = policy.normalise()
+    if len(value_map) > 0:
+        normal_policy = normal_policy.split_intervals(value_map)
+    return normal_policy
+
+
+def normalise_policies(graphs, only_first=False, workers=None, as_graphs=True):
     """
-    Normalise a list of ODRL policies with respect to each other
+    Normalise a list of ODRL policies with respect to each other.
+    Policies are parsed, and then normalised, in parallel worker processes.
     :param graphs: a list of rdflib graph objects containing ODRL policies OR a list of RDF files containing ODRL policies
+    :param only_first: if True, only the first policy is normalised; the others only contribute their constant values
+    :param workers: the number of worker processes, by default the number of CPUs. With 1, everything runs in this process
+    :param as_graphs: if False, the normalised policies are returned as Policy objects instead of rdflib graphs
     :return: if only_first is False, a list A, of the same length as graphs, where A[i] contains ODRL policy x,
     normalised version of policy y, with respect to all the policies in graphs, if and only if graphs[i] contains policy y;
     else only the first element of list A will be returned
     """
-    return None
+    if len(graphs) == 0:
+        return None if only_first else []
+    if workers == 1:
+        normal_policies = _normalise_policies(graphs, only_first, map)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            normal_policies = _normalise_policies(graphs, only_first, executor.map)
+    if as_graphs:
+        normal_policies = [normal_policy.to_rdflib_graph() for normal_policy in normal_policies]
+    return normal_policies[0] if only_first else normal_policies
+
+
+def _normalise_policies(graphs, only_first, map_function):
+    # With only_first, the other policies are not parsed, and only contribute their constant values.
+    loaded = map_function(_load_policy, graphs[:1] if only_first else graphs)
+    other_values = map_function(_load_values, graphs[1:]) if only_first else []
+    loaded = list(loaded)
+
+    # The value map is merged once, and shared by all policies.
+    value_map = dict()
+    for values_per_constraints in [values for values, policy in loaded] + list(other_values):
+        value_map = Utils.merge_key_multisets(value_map, values_per_constraints)
+
+    policies = [policy for values_per_constraints, policy in loaded]
+    return list(map_function(_normalise_policy, policies, [value_map] * len(policies)))
+
+
+def compare(policy_1, policy_2, mode="grid"):
+    """
+    Computes the overlap between two policies, and two-way containment. Each policy is loaded and normalised once,
+    with the constant values of both policies.
+    :param policy_1: an rdflib graph object, or an RDF file, containing a single ODRL policy
+    :param policy_2: an rdflib graph object, or an RDF file, containing a single ODRL policy
+    :param mode: 'grid' or 'box', as in PolicyComparer.compare
+    :return: a tuple (overlap, True if policy_1 is contained in policy_2, True if policy_2 is contained in policy_1)
+    """
+    if mode not in ("grid", "box"):
+        raise ValueError(f"Unknown comparison mode {mode}.")
+    (values_1, loaded_1), (values_2, loaded_2) = _load_policy(policy_1), _load_policy(policy_2)
+    value_map = Utils.merge_key_multisets(dict(values_1), values_2)
+    normal_policy_1 = _normalise_for_comparison(loaded_1, value_map, mode)
+    normal_policy_2 = _normalise_for_comparison(loaded_2, value_map, mode)
+    return _compare_normal_policies(normal_policy_1, normal_policy_2, mode)
+
+
+def _normalise_for_comparison(policy, value_map, mode):
+    """
+    Worker function: normalises a policy for compare. In grid mode, its intervals are also split, so the normal
+    policies are compared without splitting them again.
+    """
+    if mode == "box":
+        return policy.normalise()
+    return _normalise_policy(policy, value_map)
+
+
+def _compare_normal_policies(normal_policy_1, normal_policy_2, mode):
+    return PolicyComparer.compare_normal_policies(normal_policy_1, normal_policy_2, dict(), mode)
+
 
 def contains(policy_1, policy2):
     """
@@ -17,13 +123,14 @@ def contains(policy_1, policy2):
     :param policy2: an rdflib graph object, or an RDF file, containing a single ODRL policy
     :return: True if policy_1 contains policy2, else False
     """
-    return None
+    return compare(policy_1, policy2)[2]
 
 def equals(policy_1, policy_2):
     """
-    Check if the two policies are identical
+    Check if the two policies are identical. Both directions are checked with a single comparison.
     :param policy_1: an rdflib graph object, or an RDF file, containing a single ODRL policy
     :param policy2: an rdflib graph object, or an RDF file, containing a single ODRL policy
     :return: True if policy_1 is semantically equivalent to policy_2, else False
     """
-    return contains(policy_1, policy_2) and contains(policy_2, policy_1)
\ No newline at end of file
+    overlap, contained_1, contained_2 = compare(policy_1, policy_2)
+    return contained_1 and contained_2
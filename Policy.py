@@ -11,9 +11,11 @@ from typing import Union, Optional
 
 from rdflib import BNode
 
+import Instrumentation
 import Utils
 from Refinables import Action, AssetCollection, PartyCollection
-from Constraint import Constraint, LogicalConstraint, ArithmeticConstraint
+from Constraint import Constraint, LogicalConstraint, ArithmeticConstraint, SplitPoints
+from PolicySnapshot import PolicySnapshot, SnapshotDecoder, SnapshotEncoder, SNAPSHOT_VERSION
 
 
 class Rule:
@@ -74,9 +76,9 @@ class Rule:
             else:
                 self.constraint.append(Constraint.create(constraint))
 
-        self.type = type
         self.uid = uid
         self.state = "Inactive"  # Default state is Inactive
+        self._key = None  # Cached canonical key, reset by the methods that change the rule.
 
     def __str__(self):
         ans = f"""
@@ -89,47 +91,40 @@ class Rule:
         return ans
 
     def equiv(self, other):
+        """
+        Rules are equivalent if they have the same canonical key, regardless of their type. Rules themselves are only
+        equal to themselves, as they are mutable.
+        """
+        if Instrumentation.enabled:
+            Instrumentation.count("equiv_calls")
         if isinstance(other, Rule):
-            for action1 in self.action:
-                if action1 not in other.action:
-                    return False
-            for action2 in other.action:
-                if action2 not in self.action:
-                    return False
-            for target1 in self.target:
-                if target1 not in other.target:
-                    return False
-            for target2 in other.target:
-                if target2 not in self.target:
-                    return False
-            for assigner1 in self.assigner:
-                if assigner1 not in other.assigner:
-                    return False
-            for assigner2 in other.assigner:
-                if assigner2 not in self.assigner:
-                    return False
-            for assignee1 in self.assignee:
-                if assignee1 not in other.assignee:
-                    return False
-            for assignee2 in other.assignee:
-                if assignee2 not in self.assignee:
-                    return False
-            for constraint in self.constraint:
-                if constraint not in other.constraint:
-                    return False
-            for constraint in other.constraint:
-                if constraint not in self.constraint:
-                    return False
-            return True
+            return self.canonical_key() == other.canonical_key()
         else:
             return False
 
+    def canonical_key(self):
+        """
+        Builds a hashable key for the Rule. Two rules have the same key if and only if they are equivalent.
+
+        :return: A tuple of frozensets with the actions, targets, assigners, assignees and constraints of the Rule.
+        The key is computed once. The methods of Rule that change it reset it, but changing the lists of the Rule
+        directly does not.
+        """
+        if self._key is None:
+            self._key = (frozenset(action.value for action in self.action),
+                         frozenset(target.value for target in self.target),
+                         frozenset(assigner.value for assigner in self.assigner),
+                         frozenset(assignee.value for assignee in self.assignee),
+                         Constraint.clause_key(self.constraint))
+        return self._key
+
     def add_constraint(self, constraint: Union[Constraint, 'LogicalConstraint']):
         """
         Adds a constraint to the Rule.
 
         :param constraint: Constraint or LogicalConstraint object to be added.
         """
+        self._key = None
         if isinstance(constraint, list):
             for c in constraint:
                 self.add_constraint(c)
@@ -142,6 +137,7 @@ class Rule:
 
         :param constraint: Constraint or LogicalConstraint object to be removed.
         """
+        self._key = None
         if constraint in self.constraint:
             self.constraint.remove(constraint)
 
@@ -149,6 +145,7 @@ class Rule:
         """
         Clears all constraints associated with the Rule.
         """
+        self._key = None
         self.constraint = []
 
     def activate(self):
@@ -175,21 +172,21 @@ class Rule:
         return self.__class__
 
     def normalise(self):
-        ans = []
+        return list(self.iter_clauses())
+
+    def iter_clauses(self):
+        """
+        Lazily normalises the constraints of the Rule, dropping clauses with empty intervals.
+
+        :return: A generator of conjunctive clauses, each one a list of constraints.
+        """
         and_constraint = LogicalConstraint(operator="and", constraints=self.constraint)
-        and_constraint = and_constraint.normalise()
-        and_constraint = and_constraint.simplify_intervals()
-        if and_constraint.operator == "or":
-            cqs = and_constraint.constraints
-            for c in cqs:
-                if isinstance(c, LogicalConstraint) and c.operator == "and":
-                    ans.append(c.constraints)
-                else:
-                    ans.append(c)
-        elif and_constraint.operator == "and":
-            cqs = [and_constraint.constraints]
-            return cqs
-        return ans
+        for clause in and_constraint.iter_clauses():
+            simplified = LogicalConstraint(operator="and", constraints=clause).simplify_intervals()
+            if simplified is not None:
+                if Instrumentation.enabled:
+                    Instrumentation.count("clauses")
+                yield simplified.constraints
 
     def get_values_from_constraints(self):
         ans = dict()
@@ -214,8 +211,65 @@ class Rule:
                 ans = Utils.merge_key_multisets(ans, sub_values)
         return ans
     
-    def to_triples(self, uri):
-        from rdflib import Namespace
+    def stable_id(self):
+        """
+        :return: An identifier derived from the canonical key, which is the same for equivalent rules in every process.
+        """
+        # The constraints are represented by their own identifiers, which are computed once.
+        key = self.canonical_key()
+        return Utils.stable_id(key[:-1] + (frozenset(constraint.stable_id() for constraint in self.constraint),))
+
+    def to_dict(self, encoder):
+        """
+        :param encoder: The SnapshotEncoder of the tables the dictionary refers to.
+        :return: A dictionary with the class of the Rule and its properties that are set. Lists of refinables and
+        constraints are indices in the tables, and the duties, remedies and consequences are dictionaries.
+        """
+        data = {"class": type(self).__name__}
+        for key in ("action", "target", "assigner", "assignee"):
+            if getattr(self, key):
+                data[key] = encoder.refinable_list(getattr(self, key))
+        if self.constraint:
+            data["constraint"] = [encoder.constraint(constraint) for constraint in self.constraint]
+        if self.uid is not None:
+            data["uid"] = encoder.term(self.uid)
+        if self.state != "Inactive":
+            data["state"] = self.state
+        for key in ("duty", "remedy", "consequence"):
+            rules = getattr(self, key, [])
+            if rules is None:
+                data[key] = None
+            elif rules:
+                data[key] = [rule.to_dict(encoder) for rule in rules]
+        return data
+
+    @staticmethod
+    def from_dict(data, decoder):
+        """
+        Builds a rule from its dictionary form.
+
+        :param data: A dictionary returned by to_dict.
+        :param decoder: The SnapshotDecoder of the tables the dictionary refers to.
+        """
+        args = {key: decoder.refinable_list(data[key]) for key in ("action", "target", "assigner", "assignee")
+                if key in data}
+        args["constraint"] = [decoder.constraint(index) for index in data.get("constraint", [])]
+        rule = RULE_CLASSES[data["class"]](uid=decoder.term(data["uid"]) if "uid" in data else None, **args)
+        rule.state = data.get("state", "Inactive")
+        for key in ("duty", "remedy", "consequence"):
+            if key in data:
+                rules = data[key]
+                setattr(rule, key, None if rules is None else [Rule.from_dict(r, decoder) for r in rules])
+        return rule
+
+    def to_triples(self, uri, base=None):
+        """
+        :param uri: The node of the Rule.
+        :param base: Optional prefix of the IRIs of the constraints, which are followed by their stable_id. By
+        default, constraints are blank nodes.
+        :return: A list of triples.
+        """
+        from rdflib import Namespace, URIRef
 
         ODRL = Namespace("http://www.w3.org/ns/odrl/2/")
         triples = []
@@ -228,9 +282,9 @@ class Rule:
         for assignee in self.assignee:
             triples.append((uri, ODRL.assignee, assignee.to_node()))
         for constraint in self.constraint:
-            constraint_bnode = BNode()
-            triples.append((uri, ODRL.constraint, constraint_bnode))
-            triples.extend(constraint.to_triples(constraint_bnode))
+            constraint_node = BNode() if base is None else URIRef(base + constraint.stable_id())
+            triples.append((uri, ODRL.constraint, constraint_node))
+            triples.extend(constraint.to_triples(constraint_node, base))
         return triples
 
 
@@ -259,6 +313,7 @@ class Duty(Rule):
 
         :param action: Action object to be added.
         """
+        self._key = None
         self.action.append(action)
 
     def remove_action(self, action):
@@ -267,6 +322,7 @@ class Duty(Rule):
 
         :param action: Action object to be removed.
         """
+        self._key = None
         if action in self.action:
             self.action.remove(action)
 
@@ -276,6 +332,7 @@ class Duty(Rule):
 
         :param constraint: Constraint object to be added.
         """
+        self._key = None
         self.constraint.append(constraint)
 
     def set_consequence(self, consequence):
@@ -307,12 +364,14 @@ class Duty(Rule):
         """
         Clears all additional action associated with the duty.
         """
+        self._key = None
         self.action = []
 
     def clear_constraint(self):
         """
         Clears all constraints associated with the duty.
         """
+        self._key = None
         self.constraint = []
 
     def clear_consequence(self):
@@ -322,13 +381,13 @@ class Duty(Rule):
         self.consequence = None
 
     def normalise(self):
-        clone = super().normalise()
-        ans = []
-        for c in clone:
+        return list(self.iter_normalise())
+
+    def iter_normalise(self):
+        for c in self.iter_clauses():
             temp = Duty(self.target, self.action, self.assigner, self.assignee)
             temp.add_constraint(c)
-            ans.append(temp)
-        return ans
+            yield temp
 
 
 class Obligation(Duty):
@@ -363,12 +422,14 @@ class Obligation(Duty):
         """
         Clears all additional action associated with the duty.
         """
+        self._key = None
         self.action = []
 
     def clear_constraint(self):
         """
         Clears all constraints associated with the duty.
         """
+        self._key = None
         self.constraint = []
 
     def clear_consequence(self):
@@ -424,38 +485,41 @@ class Permission(Rule):
         pass
 
     def normalise(self):
-        clone = super().normalise()
-        ans = []
-        if len(clone) == 0:
-            return [self]
-        for c in clone:
+        return list(self.iter_normalise())
+
+    def iter_normalise(self):
+        # A rule whose constraints can never be satisfied has no clauses, and no normalised rules.
+        for c in self.iter_clauses():
             temp = Permission(self.target, self.action, self.assigner, self.assignee)
             temp.add_constraint(c)
             temp.set_duty(self.duty)
-            ans.append(temp)
-        return ans
+            yield temp
 
     # Note this only works after normalisation.
     def split_intervals(self, value_map) -> list[Rule]:
         unique_constraints = []
+        unique_keys = set()
         unique_rules = []
+        value_map = SplitPoints.of(value_map)
         # TODO: What to do if there are no constraints? i.e. everything is allowed.
         if len(self.constraint) == 0:
             c = Constraint.create(operator="and", constraints=[]).split_intervals(value_map)
             if isinstance(c, LogicalConstraint):
                 if c.operator == "or":
                     for sub_c in c.constraints:
-                        if sub_c not in unique_constraints:
+                        key = Constraint.clause_key(sub_c)
+                        if key not in unique_keys:
+                            unique_keys.add(key)
                             unique_constraints.append(sub_c)
-                        else:
-                            print([str(s) for s in sub_c])
         else:
             for constraint in self.constraint:
                 c = constraint.split_intervals(value_map)
                 if isinstance(c, LogicalConstraint):
                     if c.operator == "or":
                         for sub_c in c.constraints:
-                            if sub_c not in unique_constraints:
+                            key = Constraint.clause_key(sub_c)
+                            if key not in unique_keys:
+                                unique_keys.add(key)
                                 unique_constraints.append(sub_c)
         for constraint in unique_constraints:
             unique_rules.append(
@@ -514,36 +578,39 @@ class Prohibition(Rule):
         self.remedy = None
 
     def normalise(self):
-        clone = super().normalise()
-        ans = []
-        if len(clone) == 0:
-            return [self]
-        for c in clone:
+        return list(self.iter_normalise())
+
+    def iter_normalise(self):
+        # A rule whose constraints can never be satisfied has no clauses, and no normalised rules.
+        for c in self.iter_clauses():
             temp = Prohibition(self.target, self.action, self.assigner, self.assignee)
             temp.add_constraint(c)
             temp.set_remedy(self.remedy)
-            ans.append(temp)
-        return ans
+            yield temp
 
     # Note this only works after normalisation.
     def split_intervals(self, value_map):
         unique_constraints = []
+        unique_keys = set()
         unique_rules = []
+        value_map = SplitPoints.of(value_map)
         if len(self.constraint) == 0:
             c = Constraint.create(operator="and", constraints=[]).split_intervals(value_map)
             if isinstance(c, LogicalConstraint):
                 if c.operator == "or":
                     for sub_c in c.constraints:
-                        if sub_c not in unique_constraints:
+                        key = Constraint.clause_key(sub_c)
+                        if key not in unique_keys:
+                            unique_keys.add(key)
                             unique_constraints.append(sub_c)
-                        else:
-                            print([str(s) for s in sub_c])
         for constraint in self.constraint:
             c = constraint.split_intervals(value_map)
             if isinstance(c, LogicalConstraint):
                 if c.operator == "or":
                     for sub_c in c.constraints:
-                        if sub_c not in unique_constraints:
+                        key = Constraint.clause_key(sub_c)
+                        if key not in unique_keys:
+                            unique_keys.add(key)
                             unique_constraints.append(sub_c)
 
         for constraint in unique_constraints:
@@ -553,6 +620,9 @@ class Prohibition(Rule):
         return unique_rules
 
 
+RULE_CLASSES = {cls.__name__: cls for cls in (Rule, Duty, Obligation, Permission, Prohibition)}
+
+
 class Policy:
     def __init__(self, uid, type, profiles=None, inherit_from=None, conflict=None,
                  permission: Optional[list[Permission]] = None, prohibition: Optional[list[Prohibition]] = None,
@@ -576,24 +646,43 @@ class Policy:
         return ans
 
     def normalise(self):
-        final_permissions = []
-        final_prohibitions = []
-        final_obligations = []
-        for permission in self.permission:
-            normal_permissions = permission.normalise()
-            for normal_permission in normal_permissions:
-                final_permissions.append(normal_permission)
-        for prohibition in self.prohibition:
-            normal_prohibitions = prohibition.normalise()
-            for normal_prohibition in normal_prohibitions:
-                final_prohibitions.append(normal_prohibition)
-        for obligation in self.obligation:
-            normal_obligations = obligation.normalise()
-            for normal_obligation in normal_obligations:
-                final_obligations.append(normal_obligation)
+        with Instrumentation.stage("normalise"):
+            final_permissions = list(self.iter_normalise("permission"))
+            final_prohibitions = list(self.iter_normalise("prohibition"))
+            final_obligations = list(self.iter_normalise("obligation"))
         return Policy(uid=self.uid, type=self.type, profiles=self.profiles, permission=final_permissions,
                       prohibition=final_prohibitions, obligation=final_obligations)
 
+    def iter_normalise(self, rule_type="permission"):
+        """
+        Lazily normalises the rules of one type.
+
+        :param rule_type: One of 'permission', 'prohibition' or 'obligation'.
+        :return: A generator of normalised rules.
+        """
+        for rule in getattr(self, rule_type):
+            yield from rule.iter_normalise()
+
+    def iter_normal_rules(self, rule_type="permission", value_map=None):
+        """
+        Pipeline version of normalise followed by split_intervals, for one type of rule. Each normalised rule is
+        split as soon as it is produced, so the normal form of the policy is never built as a whole.
+
+        :param rule_type: One of 'permission', 'prohibition' or 'obligation'.
+        :param value_map: Optional map from left operands to constant values. If empty, rules are not split.
+        :return: A generator of normalised (and split) rules.
+        """
+        if value_map:
+            value_map = SplitPoints.of(value_map)
+        for rule in self.iter_normalise(rule_type):
+            if value_map and rule_type != "obligation":
+                split_rules = rule.split_intervals(value_map)
+                if Instrumentation.enabled:
+                    Policy._count_split_cells(split_rules)
+                yield from split_rules
+            else:
+                yield rule
+
     def get_values_from_constraints(self):
         ans = dict()
         for permission in self.permission:
@@ -604,53 +693,149 @@ class Policy:
             ans = Utils.merge_key_multisets(ans, obligation.get_values_from_constraints())
         return ans
 
-    def split_intervals(self, value_map):
+    def split_intervals(self, value_map, deduplicate=True):
+        """
+        Splits the intervals of a normalised policy along the constant values of each left operand.
+
+        :param value_map: A map from left operands to constant values.
+        :param deduplicate: If True, the cells that several rules produce are only kept once (see deduplicate).
+        :return: The split policy.
+        """
         new_permissions = []
         new_prohibitions = []
-        for permission in self.permission:
-            split_permissions = permission.split_intervals(value_map)
-            for split_permission in split_permissions:
-                # for new_permission in new_permissions:
-                #     if split_permission.equiv(new_permission):
-                #         break
-                new_permissions.append(split_permission)
-        for prohibition in self.prohibition:
-            split_prohibitions = prohibition.split_intervals(value_map)
-            for split_prohibition in split_prohibitions:
-                # for new_prohibition in new_prohibitions:
-                #     if split_prohibition.equiv(new_prohibition):
-                #         break
-                new_prohibitions.append(split_prohibition)
-        return Policy(uid=self.uid, type=self.type, profiles=self.profiles, permission=new_permissions,
-                      prohibition=new_prohibitions, obligation=self.obligation)
-    
-    def to_rdflib_graph(self):
-        from rdflib import Graph, Namespace, URIRef, Literal
+        value_map = SplitPoints.of(value_map)
+        with Instrumentation.stage("split_intervals"):
+            for permission in self.permission:
+                split_permissions = permission.split_intervals(value_map)
+                if Instrumentation.enabled:
+                    Policy._count_split_cells(split_permissions)
+                for split_permission in split_permissions:
+                    # for new_permission in new_permissions:
+                    #     if split_permission.equiv(new_permission):
+                    #         break
+                    new_permissions.append(split_permission)
+            for prohibition in self.prohibition:
+                split_prohibitions = prohibition.split_intervals(value_map)
+                if Instrumentation.enabled:
+                    Policy._count_split_cells(split_prohibitions)
+                for split_prohibition in split_prohibitions:
+                    # for new_prohibition in new_prohibitions:
+                    #     if split_prohibition.equiv(new_prohibition):
+                    #         break
+                    new_prohibitions.append(split_prohibition)
+        split_policy = Policy(uid=self.uid, type=self.type, profiles=self.profiles, permission=new_permissions,
+                              prohibition=new_prohibitions, obligation=self.obligation)
+        if deduplicate:
+            split_policy, removed = split_policy.deduplicate()
+        return split_policy
+
+    def deduplicate(self):
+        """
+        Removes the permissions and prohibitions that are equivalent to a previous rule of the same type, using their
+        canonical keys. The number of removed rules is also reported as the 'duplicate_rules' counter.
+
+        :return: A tuple (policy, number of removed rules).
+        """
+        with Instrumentation.stage("deduplicate"):
+            permissions = list(Policy._unique_rules(self.permission))
+            prohibitions = list(Policy._unique_rules(self.prohibition))
+        removed = len(self.permission) - len(permissions) + len(self.prohibition) - len(prohibitions)
+        Instrumentation.count("duplicate_rules", removed)
+        return Policy(uid=self.uid, type=self.type, profiles=self.profiles, permission=permissions,
+                      prohibition=prohibitions, obligation=self.obligation), removed
+
+    @staticmethod
+    def _unique_rules(rules):
+        keys = set()
+        for rule in rules:
+            key = rule.canonical_key()
+            if key not in keys:
+                keys.add(key)
+                yield rule
+
+    @staticmethod
+    def _count_split_cells(split_rules):
+        Instrumentation.count("split_rules")
+        Instrumentation.count("split_cells", len(split_rules))
+        Instrumentation.maximum("split_cells_per_rule", len(split_rules))
+
+    def to_dict(self):
+        """
+        Builds the compact dictionary form of the policy. Every distinct term, constraint and refinable is stored once,
+        in the tables of the dictionary, and rules refer to them by index. The dictionary only contains JSON types.
+
+        :return: A dictionary that Policy.from_dict turns back into an equal policy.
+        """
+        encoder = SnapshotEncoder()
+        data = {"uid": encoder.term(self.uid), "type": encoder.term(self.type), "conflict": encoder.term(self.conflict),
+                "profiles": [encoder.term(profile) for profile in self.profiles],
+                "inherit_from": [encoder.term(policy) for policy in self.inherit_from]}
+        for key in ("permission", "prohibition", "obligation", "duty"):
+            data[key] = [rule.to_dict(encoder) for rule in getattr(self, key)]
+        return {"version": SNAPSHOT_VERSION, **encoder.tables(), **data}
+
+    @staticmethod
+    def from_dict(data):
+        """
+        :param data: A dictionary returned by Policy.to_dict.
+        :return: The Policy.
+        :raises ValueError: If the dictionary was written by an incompatible version.
+        """
+        decoder = SnapshotDecoder(data)
+        rules = {key: [Rule.from_dict(rule, decoder) for rule in data[key]]
+                 for key in ("permission", "prohibition", "obligation", "duty")}
+        return Policy(uid=decoder.term(data["uid"]), type=decoder.term(data["type"]),
+                      conflict=decoder.term(data["conflict"]),
+                      profiles=[decoder.term(index) for index in data["profiles"]],
+                      inherit_from=[decoder.term(index) for index in data["inherit_from"]], **rules)
+
+    def to_snapshot(self):
+        """
+        :return: The binary snapshot of the policy, i.e. its dictionary form in the format of PolicySnapshot.dumps.
+        """
+        return PolicySnapshot.dumps(self.to_dict())
+
+    @staticmethod
+    def from_snapshot(snapshot):
+        return Policy.from_dict(PolicySnapshot.loads(snapshot))
+
+    def __reduce__(self):
+        # Policies are pickled (e.g. by worker processes) in their compact dictionary form.
+        return Policy.from_dict, (self.to_dict(),)
+
+    def iter_triples(self):
+        """
+        Lazily generates the triples of the policy. Rules and constraints are identified by IRIs derived from their
+        content (see Rule.stable_id), so equal policies have the same triples, and the triples of a rule or constraint
+        that appears more than once are only generated once.
+
+        :return: A generator of rdflib triples.
+        """
+        from rdflib import Namespace, URIRef
         from rdflib.namespace import RDF
 
         ODRL = Namespace("http://www.w3.org/ns/odrl/2/")
-        graph = Graph()
-
         policy_uri = URIRef(f"http://example.com/policy/{self.uid}")
-        graph.add((policy_uri, RDF.type, ODRL.Policy))
-
-        for permission in self.permission:
-            permission_uri = URIRef(f"{policy_uri}/permission/{id(permission)}")
-            graph.add((policy_uri, ODRL.permission, permission_uri))
-            for triple in permission.to_triples(permission_uri):
-                graph.add(triple)
+        constraint_base = f"{policy_uri}/constraint/"
+        yield policy_uri, RDF.type, ODRL.Policy
+        described = set()
+        for rule_type in ("permission", "prohibition", "obligation"):
+            for rule in getattr(self, rule_type):
+                rule_uri = URIRef(f"{policy_uri}/{rule_type}/{rule.stable_id()}")
+                yield policy_uri, ODRL[rule_type], rule_uri
+                if rule_uri in described:
+                    continue
+                subjects = set()
+                for triple in rule.to_triples(rule_uri, constraint_base):
+                    if triple[0] not in described:
+                        subjects.add(triple[0])
+                        yield triple
+                described |= subjects
 
-        for prohibition in self.prohibition:
-            prohibition_uri = URIRef(f"{policy_uri}/prohibition/{id(prohibition)}")
-            graph.add((policy_uri, ODRL.prohibition, prohibition_uri))
-            for triple in prohibition.to_triples(prohibition_uri):
-                graph.add(triple)
-
-        for obligation in self.obligation:
-            obligation_uri = URIRef(f"{policy_uri}/obligation/{id(obligation)}")
-            graph.add((policy_uri, ODRL.obligation, obligation_uri))
-            for triple in obligation.to_triples(obligation_uri):
-                graph.add(triple)
+    def to_rdflib_graph(self):
+        from rdflib import Graph
 
+        graph = Graph()
+        for triple in self.iter_triples():
+            graph.add(triple)
         return graph
-
@@ -0,0 +1,201 @@
+"""
+Description: Content-addressed on-disk cache of parsed and normalised policies. Entries are stored as compressed JSON,
+with the policies in their dictionary form (Policy.to_dict), so reading a shared cache directory never runs code.
+
+Contributors:
+
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+
+import Utils
+from ContractParser import ContractParser
+from JsonPolicyParser import JsonPolicyParser
+from Policy import Policy
+
+CACHE_DIR_VARIABLE = "POLICY_CACHE_DIR"
+CACHE_SIZE_VARIABLE = "POLICY_CACHE_MAX_BYTES"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class PolicyCache:
+    _default = None
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initializes a PolicyCache instance.
+
+        :param directory: The directory where cached policies are stored. It is created if it does not exist.
+        :param max_bytes: The maximum size of the cache. The least recently used entries are evicted beyond it.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Estimate of the size of the entries, counted on the first put and then increased by each put, so that the
+        # directory is only listed when the cache may be full.
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def enable(directory, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Enables the default cache, used by PolicyComparer.compare and demo.py.
+        """
+        PolicyCache._default = PolicyCache(directory, max_bytes)
+        return PolicyCache._default
+
+    @staticmethod
+    def disable():
+        PolicyCache._default = None
+
+    @staticmethod
+    def default():
+        """
+        :return: The default cache, or None if it is not enabled. It can also be enabled by setting the
+        POLICY_CACHE_DIR (and optionally POLICY_CACHE_MAX_BYTES) environment variables.
+        """
+        if PolicyCache._default is None and os.environ.get(CACHE_DIR_VARIABLE):
+            max_bytes = int(os.environ.get(CACHE_SIZE_VARIABLE, DEFAULT_MAX_BYTES))
+            PolicyCache.enable(os.environ[CACHE_DIR_VARIABLE], max_bytes)
+        return PolicyCache._default
+
+    @staticmethod
+    def key(file_path):
+        """
+        :return: The hash of the content of the file, the RDF serialization it is parsed with (see
+        ContractParser.guess_format) and the library version.
+        """
+        digest = PolicyCache._digest(ContractParser.guess_format(file_path)[0])
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def content_key(data, rdf_format=None):
+        """
+        :param data: The content of a policy file, as bytes.
+        :param rdf_format: The RDF serialization the content is parsed with, or None if it is guessed from the content.
+        :return: The same hash as key, for a file with this content that is parsed with this serialization.
+        """
+        digest = PolicyCache._digest(rdf_format)
+        digest.update(data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _digest(rdf_format):
+        digest = hashlib.sha256()
+        digest.update(f"{Utils.VERSION}\0{rdf_format}\0".encode())
+        return digest
+
+    @staticmethod
+    def parse(file_path):
+        """
+        Loads, parses and normalises a policy without using the cache.
+
+        :return: A tuple (values_per_constraints, policy, normal_policy).
+        """
+        values_per_constraints, policy = JsonPolicyParser.parse_file(file_path)
+        return values_per_constraints, policy, policy.normalise()
+
+    def load(self, file_path):
+        """
+        Same as parse, but returns the cached result if the content of the file has already been parsed.
+
+        :return: A tuple (values_per_constraints, policy, normal_policy).
+        """
+        key = PolicyCache.key(file_path)
+        entry = self.get(key)
+        if entry is None:
+            entry = PolicyCache.parse(file_path)
+            self.put(key, entry)
+        return entry
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".policy")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = json.loads(zlib.decompress(f.read()))
+            entry = (data["values"], Policy.from_dict(data["policy"]), Policy.from_dict(data["normal_policy"]))
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, ValueError, KeyError, IndexError, TypeError):
+            # Corrupted or outdated entry.
+            self._remove(path)
+            return None
+        # The modification time records the last use of the entry.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, entry):
+        values_per_constraints, policy, normal_policy = entry
+        try:
+            data = json.dumps({"values": values_per_constraints, "policy": policy.to_dict(),
+                               "normal_policy": normal_policy.to_dict()}, separators=(",", ":"))
+        except TypeError:
+            # Constant values that are not JSON types are not cached.
+            return
+        data = zlib.compress(data.encode("utf-8"))
+        if len(data) > self.max_bytes:
+            return
+        # Write to a temporary file first, so other processes never read a partial entry.
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, self._path(key))
+        if self._size is None:
+            self._size = self._entries()[1]
+        else:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_bytes.
+        """
+        entries, total = self._entries()
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+        self._size = total
+
+    def _entries(self):
+        # The entries of the directory, as tuples (modification time, size, path), and their total size.
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".policy"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        return entries, total
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".policy"):
+                self._remove(os.path.join(self.directory, name))
+        self._size = 0
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,56 +1,153 @@
-from ContractParser import ContractParser
-from GraphParser import GraphParser
+from concurrent.futures import ProcessPoolExecutor
+
+from Intervals import Box
+from JsonPolicyParser import JsonPolicyParser
+from Policy import Permission
+from PolicyCache import PolicyCache
+import Instrumentation
 import Utils
 
 
 class PolicyComparer:
 
     @staticmethod
-    def compare(filepath1, filepath2):
-        # Load contracts from local files as RDF graphs.
-        parser1 = ContractParser()
-        parser1.load(filepath1)
-        parser2 = ContractParser()
-        parser2.load(filepath2)
+    def compare(filepath1, filepath2, indexed=True, stream=False, mode="grid"):
+        """
+        Computes the overlap between two policies, and two-way containment.
+
+        :param filepath1: Path to a file with the first policy.
+        :param filepath2: Path to a file with the second policy.
+        :param indexed: If True, rules are compared through hash indexes instead of pairwise equiv checks.
+        :param stream: If True, rules are normalised and split one at a time.
+        :param mode: 'grid' splits rules into cells along the constants of both policies. 'box' compares
+        normalised rules as boxes of intervals without splitting them.
+        :return: A tuple (overlap, True if (1) is contained in (2), True if (2) is contained in (1)).
+        Stage times and counters are reported to the hooks registered with Instrumentation.add_hook.
+        """
+        if mode not in ("grid", "box"):
+            raise ValueError(f"Unknown comparison mode {mode}.")
+        cache = PolicyCache.default()
+        if cache is not None:
+            # Reuse the parsed and normalised policies of files that have not changed.
+            with Instrumentation.stage("cache"):
+                values_per_constraints_1, policy1, normal_policy1 = cache.load(filepath1)
+                values_per_constraints_2, policy2, normal_policy2 = cache.load(filepath2)
+        else:
+            # Load contracts from local files, as ODRL JSON documents or as RDF graphs.
+            with Instrumentation.stage("load"):
+                parser1 = JsonPolicyParser.load_contract(filepath1)
+                parser2 = JsonPolicyParser.load_contract(filepath2)
 
-        # Create a map between left operands and respective sets of constant values.
-        values_per_constraints_1 = parser1.get_values_from_constraints()
-        values_per_constraints_2 = parser2.get_values_from_constraints()
+            # Create a map between left operands and respective sets of constant values.
+            with Instrumentation.stage("values"):
+                values_per_constraints_1 = parser1.get_values_from_constraints()
+                values_per_constraints_2 = parser2.get_values_from_constraints()
+
+            # Convert the documents or RDF graphs into Python data structures
+            with Instrumentation.stage("parse"):
+                policy1 = JsonPolicyParser.parse_contract(parser1)
+                policy2 = JsonPolicyParser.parse_contract(parser2)
+            normal_policy1 = None
+            normal_policy2 = None
 
         # Merge these maps to use when splitting intervals.
         merged_values = Utils.merge_key_multisets(values_per_constraints_1, values_per_constraints_2)
 
-        # Convert RDF graphs into Python data structures
-        graph_parser1 = GraphParser(parser1.contract_graph)
-        graph_parser2 = GraphParser(parser2.contract_graph)
-        policy1 = graph_parser1.parse()
-        policy2 = graph_parser2.parse()
+        if stream and mode == "grid":
+            # Normalise and split one rule at a time, keeping only the hash indexes of the effective policies.
+            with Instrumentation.stage("stream"):
+                index1 = PolicyComparer.effective_index(policy1, merged_values)
+                index2 = PolicyComparer.effective_index(policy2, merged_values)
+                ov, diff1, diff2 = PolicyComparer.overlap_and_diff_indexes(index1, index2)
+            return ov, len(diff1) == 0, len(diff2) == 0
 
         # Normalise logical constraints to sets of rules, and reformulate simple constraints.
-        policy1 = policy1.normalise()
-        policy2 = policy2.normalise()
+        if normal_policy1 is None:
+            normal_policy1 = policy1.normalise()
+            normal_policy2 = policy2.normalise()
 
-        if len(merged_values) == 0:
-            normal_policy1 = policy1
-            normal_policy2 = policy2
-        else:
+        if indexed or mode == "box":
+            return PolicyComparer.compare_normal_policies(normal_policy1, normal_policy2, merged_values, mode)
+
+        if len(merged_values) > 0:
             # Split intervals using the merged map.
-            normal_policy1 = policy1.split_intervals(merged_values)
-            normal_policy2 = policy2.split_intervals(merged_values)
+            normal_policy1 = normal_policy1.split_intervals(merged_values)
+            normal_policy2 = normal_policy2.split_intervals(merged_values)
+
+        with Instrumentation.stage("diff"):
+            # Compute the effective policies by removing permissions that match prohibitions.
+            effective_policy1 = PolicyComparer.diff(normal_policy1.permission, normal_policy1.prohibition)
+            effective_policy2 = PolicyComparer.diff(normal_policy2.permission, normal_policy2.prohibition)
+
+            #TODO: Add a check here that if an effective policy has no permissions, then nothing is contained in it.
+
+            # Compute the overlap between policies, and two-way containment.
+            ov = PolicyComparer.overlap(effective_policy1, effective_policy2)
+            diff1 = PolicyComparer.diff(effective_policy1, effective_policy2)
+            diff2 = PolicyComparer.diff(effective_policy2, effective_policy1)
+
+        return ov, len(diff1) == 0, len(diff2) == 0
+
+    @staticmethod
+    def compare_normal_policies(normal_policy1, normal_policy2, value_map, mode="grid"):
+        """
+        Computes the overlap between two normalised policies, and two-way containment, using the hash indexes.
 
-        # Compute the effective policies by removing permissions that match prohibitions.
-        effective_policy1 = PolicyComparer.diff(normal_policy1.permission, normal_policy1.prohibition)
-        effective_policy2 = PolicyComparer.diff(normal_policy2.permission, normal_policy2.prohibition)
+        :param normal_policy1: The first normalised policy.
+        :param normal_policy2: The second normalised policy.
+        :param value_map: A map from left operands to the constant values of both policies.
+        :param mode: 'grid' or 'box', as in compare.
+        :return: A tuple (overlap, True if (1) is contained in (2), True if (2) is contained in (1)).
+        """
+        if mode == "box":
+            with Instrumentation.stage("boxes"):
+                return PolicyComparer.compare_boxes(normal_policy1, normal_policy2)
 
-        #TODO: Add a check here that if an effective policy has no permissions, then nothing is contained in it.
+        if len(value_map) > 0:
+            # Split intervals using the merged map.
+            normal_policy1 = normal_policy1.split_intervals(value_map)
+            normal_policy2 = normal_policy2.split_intervals(value_map)
 
-        # Compute the overlap between policies, and two-way containment.
-        ov = PolicyComparer.overlap(effective_policy1, effective_policy2)
-        diff1 = PolicyComparer.diff(effective_policy1, effective_policy2)
-        diff2 = PolicyComparer.diff(effective_policy2, effective_policy1)
+        with Instrumentation.stage("diff"):
+            # Compute the effective policies by removing permissions that match prohibitions.
+            effective_policy1 = PolicyComparer.indexed_diff(normal_policy1.permission, normal_policy1.prohibition)
+            effective_policy2 = PolicyComparer.indexed_diff(normal_policy2.permission, normal_policy2.prohibition)
 
+            # Compute the overlap between policies, and two-way containment.
+            ov, diff1, diff2 = PolicyComparer.overlap_and_diff(effective_policy1, effective_policy2)
         return ov, len(diff1) == 0, len(diff2) == 0
 
+    @staticmethod
+    def compare_matrix(filepaths, workers=None, mode="grid"):
+        """
+        Compares every pair of policies in a list of files. Each policy is loaded and normalised once, and pairs are
+        compared in parallel worker processes.
+
+        :param filepaths: A list of paths to files with one policy each.
+        :param workers: The number of worker processes, by default the number of CPUs. With 1, everything runs in
+        this process.
+        :param mode: 'grid' or 'box', as in compare.
+        :return: A matrix (list of lists) where entry [i][j] is True if policy i is contained in policy j.
+        Policies i and j are equivalent if entries [i][j] and [j][i] are both True.
+        """
+        if mode not in ("grid", "box"):
+            raise ValueError(f"Unknown comparison mode {mode}.")
+        size = len(filepaths)
+        matrix = [[i == j for j in range(size)] for i in range(size)]
+        pairs = [(i, j, mode) for i in range(size) for j in range(i + 1, size)]
+        if workers == 1:
+            _init_matrix([_load_matrix_entry(filepath) for filepath in filepaths])
+            matrix_results = list(map(_compare_matrix_pair, pairs))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                entries = list(executor.map(_load_matrix_entry, filepaths))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_matrix, initargs=(entries,)) as executor:
+                matrix_results = list(executor.map(_compare_matrix_pair, pairs, chunksize=max(1, len(pairs) // 64)))
+        for i, j, contained1, contained2 in matrix_results:
+            matrix[i][j] = contained1
+            matrix[j][i] = contained2
+        return matrix
+
     @staticmethod
     def overlap(rule_list1, rule_list2):
         ans = []
@@ -71,4 +168,181 @@ class PolicyComparer:
                     break
             if not broken:
                 ans.append(rule1)
-        return ans
\ No newline at end of file
+        return ans
+
+    @staticmethod
+    def index_rules(rule_list):
+        """
+        Builds a hash index over a list of rules.
+
+        :param rule_list: A list of normalised rules.
+        :return: A dictionary from the canonical key of each rule to the number of rules with that key.
+        """
+        index = dict()
+        for rule in rule_list:
+            key = rule.canonical_key()
+            index[key] = index.get(key, 0) + 1
+        return index
+
+    @staticmethod
+    def indexed_diff(rule_list1, rule_list2):
+        """
+        Same as diff, but uses a hash index instead of comparing every pair of rules.
+        """
+        index2 = PolicyComparer.index_rules(rule_list2)
+        return [rule1 for rule1 in rule_list1 if rule1.canonical_key() not in index2]
+
+    @staticmethod
+    def overlap_and_diff(rule_list1, rule_list2):
+        """
+        Computes overlap(rule_list1, rule_list2), diff(rule_list1, rule_list2) and diff(rule_list2, rule_list1)
+        with one pass over each list.
+
+        :return: A tuple with the overlap and both differences, in the same order as the equiv-based methods.
+        """
+        keys1 = [rule1.canonical_key() for rule1 in rule_list1]
+        keys2 = [rule2.canonical_key() for rule2 in rule_list2]
+        index2 = dict()
+        for key in keys2:
+            index2[key] = index2.get(key, 0) + 1
+        index1 = set(keys1)
+        ov = []
+        diff1 = []
+        for rule1, key in zip(rule_list1, keys1):
+            count = index2.get(key, 0)
+            if count == 0:
+                diff1.append(rule1)
+            else:
+                # overlap adds rule1 once for every equivalent rule in rule_list2.
+                ov.extend([rule1] * count)
+        diff2 = [rule2 for rule2, key in zip(rule_list2, keys2) if key not in index1]
+        return ov, diff1, diff2
+
+    @staticmethod
+    def effective_index(policy, value_map):
+        """
+        Streams the normalised and split rules of a policy into a hash index of its effective permissions, i.e.
+        the permissions that do not match any prohibition.
+
+        :param policy: A policy, which does not need to be normalised.
+        :param value_map: A map from left operands to constant values used to split intervals.
+        :return: A dictionary from canonical keys to the first rule with that key. Like Policy.deduplicate, the
+        number of duplicate rules is reported as the 'duplicate_rules' counter.
+        """
+        prohibited = set()
+        duplicates = 0
+        for rule in policy.iter_normal_rules("prohibition", value_map):
+            key = rule.canonical_key()
+            if key in prohibited:
+                duplicates += 1
+            prohibited.add(key)
+        permitted = set()
+        index = dict()
+        for rule in policy.iter_normal_rules("permission", value_map):
+            key = rule.canonical_key()
+            if key in permitted:
+                duplicates += 1
+                continue
+            permitted.add(key)
+            if key not in prohibited:
+                index[key] = rule
+        Instrumentation.count("duplicate_rules", duplicates)
+        return index
+
+    @staticmethod
+    def overlap_and_diff_indexes(index1, index2):
+        """
+        Same as overlap_and_diff, but takes two indexes built by effective_index.
+        """
+        ov = [rule1 for key, rule1 in index1.items() if key in index2]
+        diff1 = [rule1 for key, rule1 in index1.items() if key not in index2]
+        diff2 = [rule2 for key, rule2 in index2.items() if key not in index1]
+        return ov, diff1, diff2
+
+    @staticmethod
+    def effective_boxes(policy):
+        """
+        Groups the rules of a normalised policy by everything except their interval constraints, and subtracts the
+        prohibitions of each group from its permissions as boxes.
+
+        :param policy: A normalised policy, which does not need to be split.
+        :return: A dictionary from group keys to a tuple (rule, other_constraints, boxes), where rule is one of the
+        permissions in the group, other_constraints the constraints that are not intervals, and boxes a list of
+        disjoint boxes allowed by the group.
+        """
+        permissions = dict()
+        prohibitions = dict()
+        for rules, index in ((policy.permission, permissions), (policy.prohibition, prohibitions)):
+            for rule in rules:
+                box, other_constraints = Box.from_constraints(rule.constraint)
+                if box is None:
+                    continue
+                key = rule.canonical_key()[:4] + (frozenset(c.canonical_key() for c in other_constraints),)
+                if key not in index:
+                    index[key] = (rule, other_constraints, [])
+                index[key][2].append(box)
+        for key, (rule, other_constraints, boxes) in permissions.items():
+            if key in prohibitions:
+                permissions[key] = (rule, other_constraints, Box.subtract_all(boxes, prohibitions[key][2]))
+        return permissions
+
+    @staticmethod
+    def compare_boxes(policy1, policy2):
+        """
+        Box version of compare, which works on normalised policies without splitting their intervals.
+
+        :return: A tuple (overlap, True if (1) is contained in (2), True if (2) is contained in (1)), where overlap
+        is a list of permissions, one per non-empty intersection of boxes.
+        """
+        effective1 = PolicyComparer.effective_boxes(policy1)
+        effective2 = PolicyComparer.effective_boxes(policy2)
+        ov = []
+        for key, (rule1, other_constraints, boxes1) in effective1.items():
+            if key not in effective2:
+                continue
+            for box1 in boxes1:
+                for box2 in effective2[key][2]:
+                    intersection = box1.intersect(box2)
+                    if intersection is not None:
+                        ov.append(Permission(target=rule1.target, action=rule1.action, assigner=rule1.assigner,
+                                             assignee=rule1.assignee,
+                                             constraint=intersection.to_constraints() + other_constraints))
+        return ov, PolicyComparer.box_contained(effective1, effective2), PolicyComparer.box_contained(effective2,
+                                                                                                     effective1)
+
+    @staticmethod
+    def box_contained(effective1, effective2):
+        """
+        :return: True if the boxes in effective1 are covered by the boxes in effective2 with the same key.
+        """
+        for key, (rule1, other_constraints, boxes1) in effective1.items():
+            other_boxes = effective2[key][2] if key in effective2 else []
+            if len(Box.subtract_all(boxes1, other_boxes)) > 0:
+                return False
+        return True
+
+
+# Normalised policies shared by the worker processes of PolicyComparer.compare_matrix.
+_matrix_entries = []
+
+
+def _load_matrix_entry(filepath):
+    cache = PolicyCache.default()
+    values_per_constraints, policy, normal_policy = cache.load(filepath) if cache else PolicyCache.parse(filepath)
+    return values_per_constraints, normal_policy
+
+
+def _init_matrix(entries):
+    global _matrix_entries
+    _matrix_entries = entries
+
+
+def _compare_matrix_pair(pair):
+    i, j, mode = pair
+    values1, normal_policy1 = _matrix_entries[i]
+    values2, normal_policy2 = _matrix_entries[j]
+    # Project the value map on this pair. merge_key_multisets updates its first argument, so it gets a copy.
+    value_map = Utils.merge_key_multisets(dict(values1), values2)
+    ov, contained1, contained2 = PolicyComparer.compare_normal_policies(normal_policy1, normal_policy2, value_map,
+                                                                        mode)
+    return i, j, contained1, contained2
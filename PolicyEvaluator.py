@@ -0,0 +1,178 @@
+"""
+Description: Batch evaluation of access requests against a normalised policy. Requests are given as columns, one per
+left operand, and each constraint of the policy is evaluated on a whole column at once. NumPy is used if it is
+installed, and otherwise requests are evaluated one at a time with the same semantics.
+
+Contributors:
+
+"""
+import operator
+
+from Constraint import ArithmeticConstraint, Operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_COMPARISONS = {
+    Operator.EQ: operator.eq,
+    Operator.NEQ: operator.ne,
+    Operator.LT: operator.lt,
+    Operator.LTEQ: operator.le,
+    Operator.GT: operator.gt,
+    Operator.GTEQ: operator.ge,
+}
+
+
+class PolicyEvaluator:
+    def __init__(self, normal_policy):
+        """
+        Initializes a PolicyEvaluator instance, compiling the rules of a normalised policy once.
+
+        :param normal_policy: A normalised policy, i.e. the result of Policy.normalise(). Its intervals do not need
+        to be split.
+        :raises ValueError: If a rule has a constraint that is not an ArithmeticConstraint.
+        """
+        self.permissions = [PolicyEvaluator._compile_rule(rule) for rule in normal_policy.permission]
+        self.prohibitions = [PolicyEvaluator._compile_rule(rule) for rule in normal_policy.prohibition]
+
+    @staticmethod
+    def _compile_rule(rule):
+        for constraint in rule.constraint:
+            if not isinstance(constraint, ArithmeticConstraint):
+                raise ValueError(f"Constraint {constraint} is not normalised.")
+        # Refinements of actions, targets and assignees are not evaluated, only their values.
+        return (frozenset(str(action.value) for action in rule.action),
+                frozenset(str(target.value) for target in rule.target),
+                frozenset(str(assignee.value) for assignee in rule.assignee),
+                tuple(rule.constraint))
+
+    def evaluate(self, values, actions=None, targets=None, assignees=None):
+        """
+        Decides a batch of requests. A rule applies to a request if the action, target and assignee of the request
+        are among those of the rule (a rule without targets applies to all targets, and so on), and the values of the
+        request satisfy all its constraints. Missing values, given as NaN, do not satisfy any constraint.
+
+        :param values: A map from left operands to columns of values, e.g. NumPy arrays, one value per request.
+        :param actions: Optional column with the action of each request. If None, actions are not checked.
+        :param targets: Optional column with the target of each request. If None, targets are not checked.
+        :param assignees: Optional column with the assignee of each request. If None, assignees are not checked.
+        :return: A tuple (permit, deny) of boolean columns. deny is True for the requests to which a prohibition
+        applies, and permit for the requests to which a permission and no prohibition applies. Prohibitions take
+        precedence, and a request to which no rule applies is neither permitted nor denied.
+        """
+        size = PolicyEvaluator._batch_size(values, actions, targets, assignees)
+        columns = {key: PolicyEvaluator._column(column) for key, column in values.items()}
+        identifiers = [None if column is None else PolicyEvaluator._identifiers(column)
+                       for column in (actions, targets, assignees)]
+        # Rules often share actions, targets or constraints, so their masks are computed once per batch.
+        masks = dict()
+        deny = PolicyEvaluator._any(self.prohibitions, columns, identifiers, masks, size)
+        permit = PolicyEvaluator._any(self.permissions, columns, identifiers, masks, size)
+        if numpy is not None:
+            return permit & ~deny, deny
+        return [p and not d for p, d in zip(permit, deny)], deny
+
+    def decide(self, values, action=None, target=None, assignee=None):
+        """
+        Decides a single request.
+
+        :param values: A map from left operands to values.
+        :return: True if the request is permitted.
+        """
+        permit, deny = self.evaluate({key: [value] for key, value in values.items()},
+                                     None if action is None else [action],
+                                     None if target is None else [target],
+                                     None if assignee is None else [assignee])
+        return bool(permit[0])
+
+    @staticmethod
+    def _batch_size(values, actions, targets, assignees):
+        sizes = {len(column) for column in list(values.values()) + [actions, targets, assignees]
+                 if column is not None}
+        if len(sizes) > 1:
+            raise ValueError("All columns must have the same length.")
+        return sizes.pop() if sizes else 0
+
+    @staticmethod
+    def _column(column):
+        if numpy is None:
+            return list(column)
+        column = numpy.asarray(column)
+        # Columns of strings are compared as Python objects, element by element.
+        return column if column.dtype.kind in "biufcmMO" else column.astype(object)
+
+    @staticmethod
+    def _identifiers(column):
+        if numpy is None:
+            return [str(identifier) for identifier in column]
+        return numpy.asarray(column).astype(str)
+
+    @staticmethod
+    def _any(rules, columns, identifiers, masks, size):
+        ans = PolicyEvaluator._constant(False, size)
+        for actions, targets, assignees, constraints in rules:
+            mask = PolicyEvaluator._constant(True, size)
+            for index, allowed in enumerate((actions, targets, assignees)):
+                column = identifiers[index]
+                if column is not None and allowed:
+                    mask = PolicyEvaluator._and(mask, PolicyEvaluator._mask(
+                        masks, (index, allowed), lambda: PolicyEvaluator._isin(column, allowed)))
+            for constraint in constraints:
+                mask = PolicyEvaluator._and(mask, PolicyEvaluator._mask(
+                    masks, constraint.canonical_key(), lambda: PolicyEvaluator._check(constraint, columns, size)))
+            ans = PolicyEvaluator._or(ans, mask)
+        return ans
+
+    @staticmethod
+    def _mask(masks, key, compute):
+        if key not in masks:
+            masks[key] = compute()
+        return masks[key]
+
+    @staticmethod
+    def _check(constraint, columns, size):
+        if constraint.leftOperand not in columns:
+            return PolicyEvaluator._constant(False, size)
+        column = columns[constraint.leftOperand]
+        comparison = _COMPARISONS.get(constraint.operator)
+        if comparison is None:
+            mask = [PolicyEvaluator._present(value) and constraint.check_constraint(constraint.leftOperand, value)
+                    for value in column]
+        elif numpy is None or column.dtype.kind == "O":
+            mask = [PolicyEvaluator._present(value) and comparison(value, constraint.rightOperand)
+                    for value in column]
+        else:
+            mask = numpy.asarray(comparison(column, constraint.rightOperand), dtype=bool)
+            if constraint.operator == Operator.NEQ and column.dtype.kind in "fc":
+                mask &= ~numpy.isnan(column)
+        return mask if numpy is None else numpy.asarray(mask, dtype=bool)
+
+    @staticmethod
+    def _present(value):
+        return value is not None and value == value
+
+    @staticmethod
+    def _isin(column, allowed):
+        if numpy is None:
+            return [identifier in allowed for identifier in column]
+        return numpy.isin(column, list(allowed))
+
+    @staticmethod
+    def _constant(value, size):
+        if numpy is None:
+            return [value] * size
+        return numpy.full(size, value, dtype=bool)
+
+    @staticmethod
+    def _and(mask1, mask2):
+        if numpy is None:
+            return [m1 and m2 for m1, m2 in zip(mask1, mask2)]
+        return mask1 & mask2
+
+    @staticmethod
+    def _or(mask1, mask2):
+        if numpy is None:
+            return [m1 or m2 for m1, m2 in zip(mask1, mask2)]
+        return mask1 | mask2
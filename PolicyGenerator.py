@@ -0,0 +1,160 @@
+"""
+Description: Seeded generator of synthetic ODRL policies, written as Turtle or JSON-LD, used by the scaling benchmark.
+
+Contributors:
+
+"""
+import json
+import random
+
+ODRL_IRI = "http://www.w3.org/ns/odrl/2/"
+OPERATORS = ["eq", "neq", "lt", "lteq", "gt", "gteq"]
+ACTIONS = ["use", "distribute", "modify", "archive"]
+LEFT_OPERAND_IRI = "http://example.com/leftOperand/"
+TARGET_IRI = "http://example.com/asset/"
+POLICY_IRI = "http://example.com/policy/"
+
+
+class PolicyGenerator:
+    def __init__(self, rules=10, constraints_per_rule=2, left_operands=2, constants_per_operand=4, depth=0,
+                 prohibition_ratio=0.25, actions=2, targets=2, seed=0):
+        """
+        Initializes a PolicyGenerator instance.
+
+        :param rules: The number of rules of each policy.
+        :param constraints_per_rule: The number of top level constraints of each rule.
+        :param left_operands: The number of distinct left operands.
+        :param constants_per_operand: The number of distinct right operands of each left operand.
+        :param depth: The nesting depth of logical constraints. With depth 0 all constraints are arithmetic, and
+        otherwise each top level constraint is a tree of 'and' and 'or' constraints with two operands each.
+        :param prohibition_ratio: The ratio of rules that are prohibitions.
+        :param actions: The number of distinct actions.
+        :param targets: The number of distinct targets.
+        :param seed: The seed of the random generator. The same parameters and seed give the same policy.
+        """
+        self.rules = rules
+        self.constraints_per_rule = constraints_per_rule
+        self.left_operands = left_operands
+        self.constants_per_operand = constants_per_operand
+        self.depth = depth
+        self.prohibition_ratio = prohibition_ratio
+        self.actions = min(actions, len(ACTIONS))
+        self.targets = targets
+        self.seed = seed
+
+    def generate(self):
+        """
+        :return: A policy as a dictionary with a uid and lists of permission and prohibition rules. Each rule is a
+        dictionary with an action, a target and a list of constraints, and each constraint is either a dictionary with
+        a leftOperand, operator and rightOperand, or a dictionary with an 'and' or 'or' list of constraints.
+        """
+        rng = random.Random(self.seed)
+        constants = dict()
+        for i in range(self.left_operands):
+            constants[LEFT_OPERAND_IRI + str(i)] = sorted(rng.sample(range(10 * self.constants_per_operand),
+                                                                     self.constants_per_operand))
+        prohibitions = round(self.rules * self.prohibition_ratio)
+        policy = {"uid": POLICY_IRI + str(self.seed), "permission": [], "prohibition": []}
+        for i in range(self.rules):
+            rule = {
+                "action": ODRL_IRI + ACTIONS[rng.randrange(self.actions)],
+                "target": TARGET_IRI + str(rng.randrange(self.targets)),
+                "constraint": [self._generate_constraint(rng, constants, self.depth)
+                               for _ in range(self.constraints_per_rule)],
+            }
+            policy["prohibition" if i < prohibitions else "permission"].append(rule)
+        return policy
+
+    def _generate_constraint(self, rng, constants, depth):
+        if depth == 0:
+            left_operand = rng.choice(sorted(constants.keys()))
+            return {
+                "leftOperand": left_operand,
+                "operator": ODRL_IRI + rng.choice(OPERATORS),
+                "rightOperand": rng.choice(constants[left_operand]),
+            }
+        operator = "or" if depth % 2 == 1 else "and"
+        return {operator: [self._generate_constraint(rng, constants, depth - 1) for _ in range(2)]}
+
+    @staticmethod
+    def to_turtle(policy):
+        """
+        :return: The policy serialized as Turtle.
+        """
+        lines = ["@prefix odrl: <http://www.w3.org/ns/odrl/2/> .", "",
+                 f"<{policy['uid']}> a odrl:Policy"]
+        for rule_type in ("permission", "prohibition"):
+            if len(policy[rule_type]) == 0:
+                continue
+            rules = [PolicyGenerator._rule_to_turtle(rule, rule_type, "        ") for rule in policy[rule_type]]
+            lines[-1] += " ;"
+            lines.append(f"    odrl:{rule_type} " + ",\n        ".join(rules))
+        lines[-1] += " ."
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _rule_to_turtle(rule, rule_type, indent):
+        properties = [f"a odrl:{rule_type.capitalize()}", f"odrl:action <{rule['action']}>",
+                      f"odrl:target <{rule['target']}>"]
+        if len(rule["constraint"]) > 0:
+            properties.append("odrl:constraint " + ", ".join(
+                PolicyGenerator._constraint_to_turtle(constraint) for constraint in rule["constraint"]))
+        return "[ " + (" ;\n" + indent + "    ").join(properties) + " ]"
+
+    @staticmethod
+    def _constraint_to_turtle(constraint):
+        for operator in ("and", "or"):
+            if operator in constraint:
+                return f"[ odrl:{operator} " + ", ".join(
+                    PolicyGenerator._constraint_to_turtle(c) for c in constraint[operator]) + " ]"
+        return (f"[ odrl:leftOperand <{constraint['leftOperand']}> ; odrl:operator <{constraint['operator']}> ; "
+                f"odrl:rightOperand {constraint['rightOperand']} ]")
+
+    @staticmethod
+    def to_json_ld(policy):
+        """
+        :return: The policy serialized as JSON-LD. It describes the same graph as to_turtle.
+        """
+        document = {
+            "@context": {"odrl": ODRL_IRI},
+            "@id": policy["uid"],
+            "@type": ODRL_IRI + "Policy",
+        }
+        for rule_type in ("permission", "prohibition"):
+            if len(policy[rule_type]) == 0:
+                continue
+            document["odrl:" + rule_type] = [{
+                "@type": ODRL_IRI + rule_type.capitalize(),
+                "odrl:action": {"@id": rule["action"]},
+                "odrl:target": {"@id": rule["target"]},
+                "odrl:constraint": [PolicyGenerator._constraint_to_json_ld(c) for c in rule["constraint"]],
+            } for rule in policy[rule_type]]
+        return json.dumps(document, indent=2)
+
+    @staticmethod
+    def _constraint_to_json_ld(constraint):
+        for operator in ("and", "or"):
+            if operator in constraint:
+                return {"odrl:" + operator: [PolicyGenerator._constraint_to_json_ld(c) for c in constraint[operator]]}
+        return {
+            "odrl:leftOperand": {"@id": constraint["leftOperand"]},
+            "odrl:operator": {"@id": constraint["operator"]},
+            "odrl:rightOperand": constraint["rightOperand"],
+        }
+
+    def write(self, file_path, format="turtle"):
+        """
+        Generates a policy and writes it to a file.
+
+        :param file_path: Path to the output file.
+        :param format: Either 'turtle' or 'json-ld'.
+        """
+        policy = self.generate()
+        if format == "turtle":
+            data = PolicyGenerator.to_turtle(policy)
+        elif format == "json-ld":
+            data = PolicyGenerator.to_json_ld(policy)
+        else:
+            raise ValueError(f"Unknown format {format}.")
+        with open(file_path, "w") as f:
+            f.write(data)
@@ -0,0 +1,488 @@
+"""
+Description: Long-running comparison service. A PolicyRegistry keeps registered policies parsed and normalised in
+memory, keyed by the hash of their content, and answers normalise, compare, contains and equals requests by policy ID
+or content hash. Identical requests that are in flight at the same time are computed once, and comparison results are
+memoised by the pair of content hashes. PolicyServer exposes a registry over HTTP, on localhost or a Unix socket, and
+PolicyClient sends it requests. Clients can only register files by path below the root directory of the server.
+
+Contributors:
+
+"""
+import collections
+import http.client
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import Instrumentation
+import Utils
+from ContractParser import ContractParser
+from PolicyCache import PolicyCache
+from PolicyComparer import PolicyComparer
+from PolicyWriter import PolicyWriter
+
+DEFAULT_ADDRESS = ("127.0.0.1", 8765)
+DEFAULT_MAX_RESULTS = 100000
+DEFAULT_MAX_RESULT_BYTES = 256 * 1024 * 1024
+COMMANDS = ("register", "unregister", "policies", "normalise", "compare", "contains", "equals")
+
+
+class PolicyRegistry:
+    def __init__(self, max_results=DEFAULT_MAX_RESULTS, max_result_bytes=DEFAULT_MAX_RESULT_BYTES):
+        """
+        Initializes an empty PolicyRegistry instance.
+
+        :param max_results: The maximum number of memoised results. The least recently used ones are removed beyond it.
+        :param max_result_bytes: The maximum total size of the memoised results, e.g. normalised policies. The least
+        recently used ones are removed beyond it, and larger results are not memoised.
+        """
+        self.max_results = max_results
+        self.max_result_bytes = max_result_bytes
+        # Parsed policies by content hash, as tuples (values_per_constraints, policy, normal_policy), and the content
+        # hash of each policy ID.
+        self._entries = dict()
+        self._ids = dict()
+        # Memoised results, as tuples (result, size), and their total size.
+        self._results = collections.OrderedDict()
+        self._result_bytes = 0
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def register(self, path=None, content=None, format=None, policy_id=None):
+        """
+        Registers a policy, given by the path of a file or by its content. Policies with the same content are only
+        parsed and normalised once.
+
+        :param path: Path to a file with the policy.
+        :param content: The content of the policy, as a string or bytes, if path is not given.
+        :param format: The extension of the format of the content, e.g. 'ttl' or 'json'. By default, it is guessed.
+        :param policy_id: Optional ID of the policy. An ID that is already registered is assigned to the new policy.
+        :return: A tuple (policy ID, content hash). The policy ID is the content hash if none is given. The hash
+        includes the serialization given by the extension, as the same content can be parsed differently.
+        """
+        if path is not None:
+            with open(path, "rb") as f:
+                content = f.read()
+            extension = os.path.splitext(path)[1]
+        elif content is None:
+            raise ValueError("A path or the content of the policy is required.")
+        else:
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            extension = "." + format.lstrip(".") if format else ""
+        # Without a known extension, the serialization is guessed from the content.
+        rdf_format = ContractParser.FORMATS_BY_EXTENSION.get(extension.lower())
+        content_hash = PolicyCache.content_key(content, rdf_format)
+        if content_hash not in self._entries:
+            self._coalesce(("register", content_hash), lambda: self._parse(content_hash, path, content, format))
+        policy_id = content_hash if policy_id is None else policy_id
+        with self._lock:
+            previous_hash = self._ids.get(policy_id)
+            self._ids[policy_id] = content_hash
+            if previous_hash is not None and previous_hash != content_hash:
+                self._release(previous_hash)
+        return policy_id, content_hash
+
+    def unregister(self, policy_id):
+        """
+        Removes a policy ID. Policies that no ID refers to are removed with their memoised results.
+        """
+        with self._lock:
+            if policy_id not in self._ids:
+                raise KeyError(f"Unknown policy {policy_id}.")
+            self._release(self._ids.pop(policy_id))
+
+    def policies(self):
+        """
+        :return: A map from the registered policy IDs to their content hashes.
+        """
+        with self._lock:
+            return dict(self._ids)
+
+    def resolve(self, reference):
+        """
+        :param reference: A policy ID or a content hash.
+        :return: The content hash of the policy.
+        :raises KeyError: If the policy is not registered.
+        """
+        with self._lock:
+            if reference in self._ids:
+                return self._ids[reference]
+            if reference in self._entries:
+                return reference
+        raise KeyError(f"Unknown policy {reference}.")
+
+    def entry(self, reference):
+        """
+        :return: A tuple (values_per_constraints, policy, normal_policy) with the registered policy.
+        """
+        return self._entries[self.resolve(reference)]
+
+    def normalise(self, reference, format="text"):
+        """
+        :param reference: A policy ID or content hash.
+        :param format: 'text' for the string of the normalised policy, or 'nt' or 'turtle' (see PolicyWriter).
+        :return: The normalised policy, in the given format.
+        """
+        if format not in ("text", "nt", "turtle"):
+            raise ValueError(f"Unknown format {format}.")
+        content_hash = self.resolve(reference)
+        return self._memoised(("normalise", content_hash, format),
+                              lambda: self._write(self._entries[content_hash][2], format))
+
+    def compare(self, reference1, reference2, mode="grid"):
+        """
+        Same as PolicyComparer.compare, for two registered policies.
+
+        :param reference1: The ID or content hash of the first policy.
+        :param reference2: The ID or content hash of the second policy.
+        :param mode: 'grid' or 'box'.
+        :return: A dictionary with the number of overlapping permissions ('overlap'), whether (1) is contained in (2)
+        ('contained1'), whether (2) is contained in (1) ('contained2') and whether they are equivalent ('equivalent').
+        """
+        if mode not in ("grid", "box"):
+            raise ValueError(f"Unknown comparison mode {mode}.")
+        hash1, hash2 = self.resolve(reference1), self.resolve(reference2)
+        return self._memoised(("compare", hash1, hash2, mode), lambda: self._compare(hash1, hash2, mode))
+
+    def contains(self, reference1, reference2, mode="grid"):
+        """
+        :return: True if the first policy contains the second.
+        """
+        return self.compare(reference1, reference2, mode)["contained2"]
+
+    def equals(self, reference1, reference2, mode="grid"):
+        """
+        :return: True if the policies are equivalent.
+        """
+        return self.compare(reference1, reference2, mode)["equivalent"]
+
+    def _parse(self, content_hash, path, content, format):
+        cache = PolicyCache.default()
+        if path is None:
+            # Parsers read files, so the content is written to a temporary file with the extension of its format.
+            suffix = "." + format.lstrip(".") if format else ""
+            handle, path = tempfile.mkstemp(suffix=suffix)
+            with os.fdopen(handle, "wb") as f:
+                f.write(content)
+            try:
+                entry = cache.load(path) if cache is not None else PolicyCache.parse(path)
+            finally:
+                os.remove(path)
+        else:
+            entry = cache.load(path) if cache is not None else PolicyCache.parse(path)
+        with self._lock:
+            self._entries[content_hash] = entry
+
+    @staticmethod
+    def _write(normal_policy, format):
+        if format == "text":
+            return str(normal_policy)
+        text = io.StringIO()
+        PolicyWriter.dump(normal_policy, text, format)
+        return text.getvalue()
+
+    def _compare(self, hash1, hash2, mode):
+        values1, policy1, normal_policy1 = self._entries[hash1]
+        values2, policy2, normal_policy2 = self._entries[hash2]
+        # merge_key_multisets changes its first argument, and the value maps are kept for other comparisons.
+        value_map = Utils.merge_key_multisets(dict(values1), values2)
+        overlap, contained1, contained2 = PolicyComparer.compare_normal_policies(normal_policy1, normal_policy2,
+                                                                                 value_map, mode)
+        return {"overlap": len(overlap), "contained1": contained1, "contained2": contained2,
+                "equivalent": contained1 and contained2}
+
+    def _memoised(self, key, function):
+        with self._lock:
+            if key in self._results:
+                Instrumentation.count("memoised_results")
+                self._results.move_to_end(key)
+                return self._results[key][0]
+
+        def compute():
+            result = function()
+            size = sys.getsizeof(result)
+            with self._lock:
+                # The policies may have been unregistered while the result was computed. Keys end with the format or
+                # mode, after the content hashes.
+                if size <= self.max_result_bytes and all(h in self._entries for h in key[1:-1]):
+                    if key in self._results:
+                        self._result_bytes -= self._results[key][1]
+                    self._results[key] = (result, size)
+                    self._result_bytes += size
+                    while len(self._results) > self.max_results or self._result_bytes > self.max_result_bytes:
+                        self._result_bytes -= self._results.popitem(last=False)[1][1]
+            return result
+
+        return self._coalesce(key, compute)
+
+    def _coalesce(self, key, function):
+        # The first request computes the result, and the identical requests that arrive meanwhile wait for it.
+        with self._lock:
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+        if not owner:
+            Instrumentation.count("coalesced_requests")
+            return future.result()
+        try:
+            result = function()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+
+    def _release(self, content_hash):
+        # Called with the lock held.
+        if content_hash in self._ids.values():
+            return
+        self._entries.pop(content_hash, None)
+        for key in [key for key in self._results if content_hash in key[1:]]:
+            self._result_bytes -= self._results.pop(key)[1]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Connections are kept open, and headers and bodies are written separately, so Nagle's algorithm would delay
+    # every answer.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path.strip("/") == "policies":
+            self._reply(200, {"policies": self.server.registry.policies()})
+        else:
+            self._reply(404, {"error": f"Unknown command {self.path}."})
+
+    def do_POST(self):
+        command = self.path.strip("/")
+        Instrumentation.count("server_requests")
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+            self._reply(200, PolicyServer.handle(self.server.registry, command, params, self.server.root))
+        except KeyError as e:
+            self._reply(404, {"error": str(e.args[0]) if e.args else "Not found."})
+        except (ValueError, TypeError, OSError) as e:
+            self._reply(400, {"error": str(e)})
+        except Exception as e:
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHandler(_Handler):
+    # TCP options do not apply to Unix sockets.
+    disable_nagle_algorithm = False
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # HTTP handlers expect the client address to be a (host, port) pair.
+        request, client_address = super().get_request()
+        return request, ("local", 0)
+
+
+class PolicyServer:
+    def __init__(self, address=DEFAULT_ADDRESS, registry=None, root=None):
+        """
+        Initializes a PolicyServer instance.
+
+        :param address: A (host, port) pair, or the path of a Unix socket. A socket left at the path is replaced.
+        :raises FileExistsError: If something other than a socket is at the path of the Unix socket.
+        :param registry: The PolicyRegistry to serve. By default, a new one.
+        :param root: The directory of the files that clients can register by path, which are relative to it. By
+        default, policies can only be registered by content.
+        """
+        self.registry = registry if registry is not None else PolicyRegistry()
+        self.root = root
+        if isinstance(address, str):
+            if PolicyServer._is_socket(address):
+                os.remove(address)
+            elif os.path.lexists(address):
+                raise FileExistsError(f"{address} exists and is not a socket.")
+            self.httpd = _UnixHTTPServer(address, _UnixHandler)
+        else:
+            self.httpd = ThreadingHTTPServer(address, _Handler)
+        self.httpd.registry = self.registry
+        self.httpd.root = root
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        """
+        Stops a server running serve_forever in another thread, and closes its socket.
+        """
+        self.httpd.shutdown()
+        self.close()
+
+    def close(self):
+        self.httpd.server_close()
+        if isinstance(self.address, str) and PolicyServer._is_socket(self.address):
+            os.remove(self.address)
+
+    @staticmethod
+    def _is_socket(path):
+        try:
+            return stat.S_ISSOCK(os.lstat(path).st_mode)
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def handle(registry, command, params, root=None):
+        """
+        Answers a request.
+
+        :param registry: A PolicyRegistry.
+        :param command: One of COMMANDS.
+        :param params: The parameters of the request, as a dictionary.
+        :param root: The directory of the files that can be registered by path, or None if paths are not accepted.
+        :return: The answer, as a dictionary.
+        :raises KeyError: If the command or a policy is unknown.
+        :raises ValueError: If a path is not accepted.
+        """
+        def required(name):
+            if params.get(name) is None:
+                raise ValueError(f"Missing parameter {name}.")
+            return params[name]
+
+        if command == "register":
+            path = params.get("path")
+            if path is not None:
+                path = PolicyServer.resolve_path(root, path)
+            policy_id, content_hash = registry.register(path, params.get("content"), params.get("format"),
+                                                        params.get("id"))
+            return {"id": policy_id, "hash": content_hash}
+        elif command == "unregister":
+            registry.unregister(required("id"))
+            return {}
+        elif command == "policies":
+            return {"policies": registry.policies()}
+        elif command == "normalise":
+            return {"policy": registry.normalise(required("policy"), params.get("format", "text"))}
+        mode = params.get("mode", "grid")
+        if command == "compare":
+            return registry.compare(required("policy1"), required("policy2"), mode)
+        elif command == "contains":
+            return {"contains": registry.contains(required("policy1"), required("policy2"), mode)}
+        elif command == "equals":
+            return {"equals": registry.equals(required("policy1"), required("policy2"), mode)}
+        raise KeyError(f"Unknown command {command}.")
+
+    @staticmethod
+    def resolve_path(root, path):
+        """
+        :param root: The directory of the files that can be registered by path, or None.
+        :param path: The path of a file, relative to root.
+        :return: The real path of the file.
+        :raises ValueError: If paths are not accepted, or the file is not below root (also through symbolic links).
+        """
+        if root is None:
+            raise ValueError("Policies can only be registered by content.")
+        root = os.path.realpath(root)
+        real_path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, real_path]) != root:
+            raise ValueError(f"The path {path} is outside the policy directory.")
+        return real_path
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class PolicyClient:
+    def __init__(self, address=DEFAULT_ADDRESS):
+        """
+        Initializes a PolicyClient instance, which keeps one connection to a PolicyServer.
+
+        :param address: The (host, port) pair, or the Unix socket path, of the server.
+        """
+        self.address = address
+        self._connection = None
+
+    def request(self, command, **params):
+        """
+        Sends a request to the server.
+
+        :param command: One of COMMANDS.
+        :return: The answer, as a dictionary.
+        :raises KeyError: If the command or a policy is unknown.
+        :raises ValueError: If the request is invalid.
+        """
+        body = json.dumps(params).encode("utf-8")
+        for attempt in range(2):
+            if self._connection is None:
+                if isinstance(self.address, str):
+                    self._connection = _UnixHTTPConnection(self.address)
+                else:
+                    self._connection = http.client.HTTPConnection(*self.address)
+            try:
+                self._connection.request("POST", "/" + command, body, {"Content-Type": "application/json"})
+                response = self._connection.getresponse()
+                answer = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # The server closed the connection, which is opened again once.
+                self.close()
+                if attempt == 1:
+                    raise
+        if response.status == 404:
+            raise KeyError(answer["error"])
+        if response.status != 200:
+            raise ValueError(answer["error"])
+        return answer
+
+    def register(self, path=None, content=None, format=None, policy_id=None):
+        answer = self.request("register", path=path, content=content, format=format, id=policy_id)
+        return answer["id"], answer["hash"]
+
+    def normalise(self, policy, format="text"):
+        return self.request("normalise", policy=policy, format=format)["policy"]
+
+    def compare(self, policy1, policy2, mode="grid"):
+        return self.request("compare", policy1=policy1, policy2=policy2, mode=mode)
+
+    def contains(self, policy1, policy2, mode="grid"):
+        return self.request("contains", policy1=policy1, policy2=policy2, mode=mode)["contains"]
+
+    def equals(self, policy1, policy2, mode="grid"):
+        return self.request("equals", policy1=policy1, policy2=policy2, mode=mode)["equals"]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,193 @@
+"""
+Description: Compact snapshots of policies, used to cache them and to send them to other processes. The dictionaries of
+Policy.to_dict refer to shared tables: every distinct term (IRI, literal, number or string) is stored once, and so is
+every constraint and refinable, so the rules of a policy are encoded as lists of small integers. The dictionaries only
+contain JSON types, and PolicySnapshot.dumps writes them as compact JSON after a magic prefix, so snapshots from other
+processes or storage can be loaded without running code.
+
+Contributors:
+
+"""
+import json
+
+from rdflib import BNode, Literal, URIRef
+
+SNAPSHOT_VERSION = 1
+MAGIC = b"ODRLSNAP"
+
+
+class SnapshotEncoder:
+    def __init__(self):
+        """
+        Initializes an empty SnapshotEncoder instance, which assigns table indices to the terms, constraints and
+        refinables of a policy.
+        """
+        self.terms = []
+        self.constraints = []
+        self.refinables = []
+        self.lists = []
+        self._term_indices = dict()
+        self._constraint_indices = dict()
+        # Constraints, refinables and lists of refinables that are shared by several rules (e.g. the rules split from
+        # the same rule) are encoded once. The objects are kept, so their ids are not reused while encoding.
+        self._object_indices = dict()
+        self._objects = []
+
+    def tables(self):
+        return {"terms": self.terms, "constraints": self.constraints, "refinables": self.refinables,
+                "lists": self.lists}
+
+    def term(self, value):
+        """
+        :return: The index of a term in the term table. Terms of different types are never merged, e.g. an IRI and a
+        string, or 1 and 1.0.
+        """
+        try:
+            key = (type(value), value)
+            index = self._term_indices.get(key)
+        except TypeError:
+            key = None
+            index = None
+        if index is None:
+            # The elements of containers are encoded first, so that entries only refer to earlier entries.
+            encoded = self._encode_term(value)
+            index = len(self.terms)
+            self.terms.append(encoded)
+            if key is not None:
+                self._term_indices[key] = index
+        return index
+
+    def _encode_term(self, value):
+        if value is None or type(value) in (str, int, float, bool):
+            return value
+        if isinstance(value, URIRef):
+            return ["iri", str(value)]
+        if isinstance(value, BNode):
+            return ["bnode", str(value)]
+        if isinstance(value, Literal):
+            return ["literal", str(value), None if value.datatype is None else str(value.datatype), value.language]
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return [type(value).__name__, [self.term(v) for v in value]]
+        if isinstance(value, dict):
+            return ["dict", [[self.term(k), self.term(v)] for k, v in value.items()]]
+        raise TypeError(f"Terms of type {type(value).__name__} cannot be encoded.")
+
+    def constraint(self, constraint):
+        """
+        :return: The index of a constraint in the constraint table. Equal arithmetic constraints share an index.
+        """
+        index = self._object_indices.get(id(constraint))
+        if index is None:
+            data = constraint.to_dict(self)
+            key = tuple(data.values()) if "leftOperand" in data else None
+            index = self._constraint_indices.get(key) if key is not None else None
+            if index is None:
+                index = len(self.constraints)
+                self.constraints.append(data)
+                if key is not None:
+                    self._constraint_indices[key] = index
+            self._remember(constraint, index)
+        return index
+
+    def refinable(self, refinable):
+        """
+        :return: The index of a refinable in the refinable table.
+        """
+        index = self._object_indices.get(id(refinable))
+        if index is None:
+            index = len(self.refinables)
+            self.refinables.append(refinable.to_dict(self))
+            self._remember(refinable, index)
+        return index
+
+    def refinable_list(self, refinables):
+        """
+        :return: The index of a list of refinables in the table of lists.
+        """
+        index = self._object_indices.get(id(refinables))
+        if index is None:
+            index = len(self.lists)
+            self.lists.append([self.refinable(refinable) for refinable in refinables])
+            self._remember(refinables, index)
+        return index
+
+    def _remember(self, obj, index):
+        self._object_indices[id(obj)] = index
+        self._objects.append(obj)
+
+
+class SnapshotDecoder:
+    def __init__(self, data):
+        """
+        Initializes a SnapshotDecoder instance with the tables of a snapshot, which are decoded in order: every entry
+        only refers to entries before it.
+
+        :param data: A dictionary with the tables of a SnapshotEncoder.
+        :raises ValueError: If the snapshot has another version.
+        """
+        from Constraint import Constraint
+        from Refinables import Refinable
+
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {data.get('version')}.")
+        self.terms = []
+        for entry in data["terms"]:
+            self.terms.append(self._decode_term(entry))
+        self.constraints = []
+        for entry in data["constraints"]:
+            self.constraints.append(Constraint.from_dict(entry, self))
+        self.refinables = []
+        for entry in data["refinables"]:
+            self.refinables.append(Refinable.from_dict(entry, self))
+        self.lists = [[self.refinables[index] for index in entry] for entry in data["lists"]]
+
+    def term(self, index):
+        return self.terms[index]
+
+    def constraint(self, index):
+        return self.constraints[index]
+
+    def refinable(self, index):
+        return self.refinables[index]
+
+    def refinable_list(self, index):
+        return self.lists[index]
+
+    def _decode_term(self, entry):
+        if not isinstance(entry, list):
+            return entry
+        kind = entry[0]
+        if kind == "iri":
+            return URIRef(entry[1])
+        if kind == "bnode":
+            return BNode(entry[1])
+        if kind == "literal":
+            return Literal(entry[1], datatype=entry[2], lang=entry[3])
+        if kind == "dict":
+            return {self.terms[k]: self.terms[v] for k, v in entry[1]}
+        values = [self.terms[i] for i in entry[1]]
+        return {"list": list, "tuple": tuple, "set": set, "frozenset": frozenset}[kind](values)
+
+
+class PolicySnapshot:
+    @staticmethod
+    def dumps(data):
+        """
+        :param data: A dictionary returned by Policy.to_dict.
+        :return: The binary snapshot of the dictionary.
+        """
+        return MAGIC + json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def loads(snapshot):
+        """
+        :param snapshot: A binary snapshot returned by dumps.
+        :return: The dictionary of the snapshot, to be read by Policy.from_dict.
+        :raises ValueError: If the data is not a snapshot.
+        """
+        if not snapshot.startswith(MAGIC):
+            raise ValueError("Not a policy snapshot.")
+        data = json.loads(snapshot[len(MAGIC):])
+        if not isinstance(data, dict):
+            raise ValueError("Not a policy snapshot.")
+        return data
@@ -0,0 +1,114 @@
+"""
+Description: Streaming serialisation of (normalised) policies as N-Triples or Turtle. Triples are written to a file
+handle as Policy.iter_triples generates them, without building an rdflib Graph, and rules and constraints have IRIs
+derived from their content, so equal policies are written the same way and outputs can be diffed and cached.
+
+Contributors:
+
+"""
+import re
+
+from rdflib import Literal, URIRef
+from rdflib.namespace import RDF
+
+from Constraint import ODRL_IRI
+
+PREFIXES = {"odrl": ODRL_IRI, "rdf": str(RDF)}
+VOCABULARY = tuple(PREFIXES.values())
+# Local names that can be written as prefixed names in Turtle.
+_LOCAL_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_-]*")
+_ESCAPES = str.maketrans({"\\": "\\\\", "\"": "\\\"", "\n": "\\n", "\r": "\\r"})
+
+
+class PolicyWriter:
+    def __init__(self, file, format="nt"):
+        """
+        Initializes a PolicyWriter instance.
+
+        :param file: A text file handle.
+        :param format: 'nt' for N-Triples or 'turtle'.
+        """
+        if format not in ("nt", "turtle"):
+            raise ValueError(f"Unknown format {format}.")
+        self.file = file
+        self.format = format
+        self._terms = dict()
+        self._subject = None
+        if format == "turtle":
+            for prefix, iri in PREFIXES.items():
+                file.write(f"@prefix {prefix}: <{iri}> .\n")
+
+    @staticmethod
+    def dump(policy, file, format="nt"):
+        """
+        Writes the triples of a policy to a file handle.
+
+        :param policy: A Policy.
+        :param file: A text file handle.
+        :param format: 'nt' for N-Triples or 'turtle'.
+        """
+        writer = PolicyWriter(file, format)
+        writer.write(policy)
+        writer.close()
+
+    @staticmethod
+    def save(policy, file_path, format=None):
+        """
+        Same as dump, but writes to a file. The format is guessed from the extension if it is not given.
+        """
+        if format is None:
+            format = "turtle" if file_path.endswith((".ttl", ".turtle")) else "nt"
+        with open(file_path, "w", encoding="utf-8") as f:
+            PolicyWriter.dump(policy, f, format)
+
+    def write(self, policy):
+        for triple in policy.iter_triples():
+            self.write_triple(*triple)
+
+    def write_triple(self, subject, predicate, obj):
+        if self.format == "nt":
+            self.file.write(f"{self._term(subject)} {self._term(predicate)} {self._term(obj)} .\n")
+        elif subject == self._subject:
+            # Consecutive triples with the same subject are written as a predicate list.
+            self.file.write(f" ;\n    {self._term(predicate)} {self._term(obj)}")
+        else:
+            if self._subject is not None:
+                self.file.write(" .\n")
+            self._subject = subject
+            self.file.write(f"{self._term(subject)} {self._term(predicate)} {self._term(obj)}")
+
+    def close(self):
+        """
+        Ends the last statement. The file handle is not closed.
+        """
+        if self._subject is not None:
+            self.file.write(" .\n")
+            self._subject = None
+
+    def _term(self, term):
+        # The ODRL and RDF vocabulary is shared by all rules, so its terms are only formatted once. Other terms, such as
+        # the IRIs of rules and constraints, are mostly written once or twice and are not kept.
+        formatted = self._terms.get(term)
+        if formatted is None:
+            formatted = self._format(term)
+            if isinstance(term, URIRef) and term.startswith(VOCABULARY):
+                self._terms[term] = formatted
+        return formatted
+
+    def _format(self, term):
+        if isinstance(term, Literal):
+            text = "\"" + str(term).translate(_ESCAPES) + "\""
+            if term.language is not None:
+                return text + "@" + term.language
+            if term.datatype is not None:
+                return text + "^^" + self._format(URIRef(term.datatype))
+            return text
+        if isinstance(term, URIRef):
+            if self.format == "turtle":
+                if term == RDF.type:
+                    return "a"
+                for prefix, iri in PREFIXES.items():
+                    if term.startswith(iri) and _LOCAL_NAME.fullmatch(term[len(iri):]):
+                        return f"{prefix}:{term[len(iri):]}"
+            return f"<{term}>"
+        return term.n3()
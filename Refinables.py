@@ -10,6 +10,8 @@ Contributors:
 from Constraint import Constraint
 from Interfaces import RefinableInterface
 
+REFINABLE_PROPERTIES = ("source", "uid", "value", "refinement")
+
 class Refinable(RefinableInterface):
     def __init__(self,  **args):
         """
@@ -29,7 +31,8 @@ class Refinable(RefinableInterface):
             self.refinement = Action(**refinement)
         elif isinstance(refinement, list):
             self.refinement = refinement
-        self.other = args
+        # Properties other than the ones above.
+        self.other = {key: value for key, value in args.items() if key not in REFINABLE_PROPERTIES}
         # self.refinements = refinements if refinements is not None else []
 
     def __str__(self):
@@ -41,6 +44,9 @@ class Refinable(RefinableInterface):
         else:
             return False
 
+    def __hash__(self):
+        return hash(self.value)
+
     def add_refinement(self, constraint: Constraint):
         """
         Adds a refinement to the PartyCollection.
@@ -67,6 +73,35 @@ class Refinable(RefinableInterface):
         from rdflib import URIRef
         return URIRef(self.value)
 
+    def to_dict(self, encoder):
+        """
+        :param encoder: The SnapshotEncoder of the tables the dictionary refers to.
+        :return: A dictionary with the class and the properties that are set, as indices in the tables.
+        """
+        data = {"class": type(self).__name__}
+        for key in ("value", "source", "uid"):
+            if getattr(self, key) is not None:
+                data[key] = encoder.term(getattr(self, key))
+        if self.refinement:
+            data["refinement"] = [encoder.constraint(constraint) for constraint in self.refinement]
+        if self.other:
+            data["other"] = {key: encoder.term(value) for key, value in self.other.items()}
+        return data
+
+    @staticmethod
+    def from_dict(data, decoder):
+        """
+        Builds a refinable from its dictionary form.
+
+        :param data: A dictionary returned by to_dict.
+        :param decoder: The SnapshotDecoder of the tables the dictionary refers to.
+        """
+        args = {key: decoder.term(data[key]) for key in ("value", "source", "uid") if key in data}
+        args["refinement"] = [decoder.constraint(index) for index in data.get("refinement", [])]
+        for key, index in data.get("other", {}).items():
+            args[key] = decoder.term(index)
+        return REFINABLE_CLASSES[data["class"]](**args)
+
 class Action(Refinable):
     def __init__(self, **args):
         """
@@ -112,3 +147,5 @@ class PartyCollection(Refinable):
     def __str__(self):
         return super.__str__(self)
 
+
+REFINABLE_CLASSES = {cls.__name__: cls for cls in (Refinable, Action, AssetCollection, PartyCollection)}
@@ -1,4 +1,10 @@
+import hashlib
+import re
 from datetime import datetime
+from decimal import Decimal
+
+# Library version. It is part of the key of cached policies, so it must change whenever parsing or normalisation does.
+VERSION = "0.7.0"
 
 
 def merge_key_multisets(multiset1, multiset2):
@@ -11,6 +17,18 @@ def merge_key_multisets(multiset1, multiset2):
                 multiset1[key] = multiset2[key]
     return multiset1
 
+def to_hashable(value):
+    """
+    Converts a right operand to a hashable value that preserves equality between operands.
+    """
+    if isinstance(value, list):
+        return list, tuple(to_hashable(v) for v in value)
+    elif isinstance(value, set):
+        return frozenset(to_hashable(v) for v in value)
+    elif isinstance(value, dict):
+        return dict, frozenset((k, to_hashable(v)) for k, v in value.items())
+    return value
+
 def string_to_element(value):
     if value.isnumeric():
         if "." in value:
@@ -22,16 +40,59 @@ def string_to_element(value):
             return str(datetime.fromisoformat(value))
         except ValueError:
             return value
-        
+
+
+XSD_IRI = "http://www.w3.org/2001/XMLSchema#"
+NUMERIC_DATATYPES = frozenset(XSD_IRI + name for name in (
+    "integer", "int", "long", "short", "byte", "nonNegativeInteger", "positiveInteger", "nonPositiveInteger",
+    "negativeInteger", "unsignedLong", "unsignedInt", "unsignedShort", "unsignedByte", "decimal", "double", "float"))
+
+
+def node_to_element(node):
+    """
+    Converts the rdflib node of a right operand to the value of a constraint. Numeric literals are converted to
+    numbers with toPython, and other nodes from their string with string_to_element.
+    """
+    datatype = getattr(node, "datatype", None)
+    if datatype is not None and str(datatype) in NUMERIC_DATATYPES:
+        value = node.toPython()
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+    return string_to_element(str(node))
+
+
+# IRIs are written as URIRefs, and other strings as literals.
+URI_PATTERN = re.compile(r'\b[a-zA-Z][a-zA-Z0-9+.-]*://[^\s<>"\'()]+')
+
+
 def string_to_rdflib_node(value):
     from rdflib import URIRef, Literal
     if isinstance(value, str):
-        import re
         #TODO: Implement datatypes maybe.
-        uri_pattern = re.compile(r'\b[a-zA-Z][a-zA-Z0-9+.-]*://[^\s<>"\'()]+')
-        if uri_pattern.match(value):
+        if URI_PATTERN.match(value):
             return URIRef(value)
         else:
             return Literal(value)
     else:
         return Literal(str(value))
+
+
+def stable_id(key):
+    """
+    :param key: A canonical key, e.g. of a Rule or Constraint.
+    :return: A hexadecimal digest of the key, which unlike its hash is the same in every process.
+    """
+    return hashlib.blake2b(_stable_repr(key).encode(), digest_size=16).hexdigest()
+
+
+def _stable_repr(value):
+    # Sets are sorted, so equal keys have the same representation.
+    if isinstance(value, (set, frozenset)):
+        return "{" + ",".join(sorted(_stable_repr(v) for v in value)) + "}"
+    elif isinstance(value, (tuple, list)):
+        return "(" + ",".join(_stable_repr(v) for v in value) + ")"
+    elif isinstance(value, type):
+        return value.__name__
+    return repr(value)
@@ -0,0 +1,199 @@
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import Utils
+from ContractParser import ContractParser
+from GraphParser import GraphParser
+from PolicyComparer import PolicyComparer
+from PolicyGenerator import PolicyGenerator
+
+# Values of each generator parameter used by the scaling benchmark. Parameters vary one at a time, and the others
+# keep their default values.
+SCALING_PARAMETERS = {
+    "rules": [5, 10, 20, 40],
+    "constraints_per_rule": [1, 2, 3, 4],
+    "left_operands": [1, 2, 3],
+    "constants_per_operand": [2, 4, 8, 16],
+    "depth": [0, 1, 2, 3],
+    "prohibition_ratio": [0.0, 0.25, 0.5],
+}
+
+
+def time_call(function, repeats):
+    """
+    :return: The mean wall time of function() in milliseconds, over the given number of repeats.
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def peak_memory(function):
+    """
+    :return: The peak memory allocated by function(), in kilobytes.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_stages(file1, file2, repeats=1):
+    """
+    Times each stage of the comparison of two policy files.
+
+    :return: A list of tuples (stage, mean milliseconds, peak kilobytes).
+    """
+    parser1 = ContractParser()
+    parser1.load(file1)
+    parser2 = ContractParser()
+    parser2.load(file2)
+    policy = GraphParser(parser1.contract_graph).parse()
+    normal_policy = policy.normalise()
+    value_map = Utils.merge_key_multisets(parser1.get_values_from_constraints(),
+                                          parser2.get_values_from_constraints())
+    stages = [
+        ("load", lambda: ContractParser().load(file1)),
+        ("parse", lambda: GraphParser(parser1.contract_graph, indexed=True).parse()),
+        ("normalise", lambda: policy.normalise()),
+        ("split_intervals", lambda: normal_policy.split_intervals(value_map)),
+        ("compare", lambda: PolicyComparer.compare(file1, file2)),
+    ]
+    return [(stage, time_call(function, repeats), peak_memory(function)) for stage, function in stages]
+
+
+def benchmark_scaling(repeats=1, format="turtle", parameters=None):
+    """
+    Generates pairs of synthetic policies, varying one generator parameter at a time, and times each stage of
+    their comparison.
+
+    :param repeats: The number of runs of each stage.
+    :param format: The serialization of the generated files, 'turtle' or 'json-ld'.
+    :param parameters: A map from generator parameters to lists of values, by default SCALING_PARAMETERS.
+    :return: A generator of dictionaries, one per parameter value and stage.
+    """
+    parameters = parameters if parameters else SCALING_PARAMETERS
+    extension = ".ttl" if format == "turtle" else ".json"
+    with tempfile.TemporaryDirectory() as directory:
+        for parameter, values in parameters.items():
+            for value in values:
+                files = []
+                for seed in (1, 2):
+                    file = os.path.join(directory, f"policy_{seed}{extension}")
+                    PolicyGenerator(**{parameter: value, "seed": seed}).write(file, format)
+                    files.append(file)
+                for stage, milliseconds, kilobytes in benchmark_stages(files[0], files[1], repeats):
+                    yield {"parameter": parameter, "value": value, "stage": stage, "ms": round(milliseconds, 3),
+                           "peak_kb": round(kilobytes, 1)}
+
+
+def benchmark_load(files, repeats=5):
+    """
+    Compares ContractParser.load, which guesses the RDF serialization of each file, against
+    ContractParser.load_any_format, which tries every serialization in turn.
+    """
+    print("file,format,any_format_ms,guessed_format_ms,speedup")
+    total_any = 0
+    total_guessed = 0
+    for file in files:
+        parser = ContractParser()
+        try:
+            any_format_ms = time_call(lambda: parser.load_any_format(file), repeats)
+            guessed_ms = time_call(lambda: parser.load(file), repeats)
+        except ValueError:
+            print(f"{file},,failed,failed,")
+            continue
+        total_any += any_format_ms
+        total_guessed += guessed_ms
+        rdf_format = ContractParser.guess_format(file)[0]
+        print(f"{file},{rdf_format},{any_format_ms:.2f},{guessed_ms:.2f},{any_format_ms / guessed_ms:.1f}")
+    if total_guessed > 0:
+        print(f"total,,{total_any:.2f},{total_guessed:.2f},{total_any / total_guessed:.1f}")
+
+
+def benchmark_parse(repeats=5, parameters=None):
+    """
+    Compares GraphParser.parse with and without the triple index (indexed=True) on generated policies.
+
+    :param repeats: The number of runs of each parser.
+    :param parameters: A list of dictionaries of PolicyGenerator arguments, by default increasingly large policies.
+    """
+    parameters = parameters if parameters else [{"rules": 40}, {"rules": 200, "depth": 2}, {"rules": 1000, "depth": 1}]
+    print("rules,depth,triples,default_ms,indexed_ms,speedup")
+    with tempfile.TemporaryDirectory() as directory:
+        for arguments in parameters:
+            file = os.path.join(directory, "policy.ttl")
+            PolicyGenerator(**arguments).write(file)
+            parser = ContractParser()
+            parser.load(file)
+            default_ms = time_call(lambda: GraphParser(parser.contract_graph).parse(), repeats)
+            indexed_ms = time_call(lambda: GraphParser(parser.contract_graph, indexed=True).parse(), repeats)
+            print(f"{arguments.get('rules', 10)},{arguments.get('depth', 0)},{len(parser.contract_graph)},"
+                  f"{default_ms:.2f},{indexed_ms:.2f},{default_ms / indexed_ms:.1f}")
+
+
+def benchmark_values(repeats=5, parameters=None):
+    """
+    Compares ContractParser.get_values_from_constraints, which reads the constraint triples directly, against the
+    SPARQL query of ContractParser.query_values_from_constraints on generated policies.
+
+    :param repeats: The number of runs of each method.
+    :param parameters: A list of dictionaries of PolicyGenerator arguments, by default increasingly large policies.
+    """
+    parameters = parameters if parameters else [{"rules": 40}, {"rules": 200, "depth": 2}, {"rules": 1000, "depth": 1}]
+    print("rules,triples,sparql_ms,scan_ms,speedup")
+    with tempfile.TemporaryDirectory() as directory:
+        for arguments in parameters:
+            file = os.path.join(directory, "policy.ttl")
+            PolicyGenerator(**arguments).write(file)
+            parser = ContractParser()
+            parser.load(file)
+            sparql_ms = time_call(parser.query_values_from_constraints, repeats)
+            scan_ms = time_call(parser.get_values_from_constraints, repeats)
+            print(f"{arguments.get('rules', 10)},{len(parser.contract_graph)},{sparql_ms:.2f},{scan_ms:.2f},"
+                  f"{sparql_ms / scan_ms:.1f}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    warnings.simplefilter("ignore")
+    if len(args) > 0 and args[0] == 'load':
+        repeats = int(args[1]) if len(args) > 1 else 5
+        benchmark_load(sorted(glob.glob("examples/*")), repeats)
+    elif len(args) > 0 and args[0] == 'parse':
+        repeats = int(args[1]) if len(args) > 1 else 5
+        benchmark_parse(repeats)
+    elif len(args) > 0 and args[0] == 'values':
+        repeats = int(args[1]) if len(args) > 1 else 5
+        benchmark_values(repeats)
+    elif len(args) > 0 and args[0] == 'scaling':
+        as_json = "--json" in args
+        rdf_format = "json-ld" if "--json-ld" in args else "turtle"
+        args = [arg for arg in args if not arg.startswith("--")]
+        repeats = int(args[1]) if len(args) > 1 else 1
+        results = benchmark_scaling(repeats, rdf_format)
+        if as_json:
+            print(json.dumps(list(results), indent=2))
+        else:
+            print("parameter,value,stage,ms,peak_kb", flush=True)
+            for result in results:
+                print(f"{result['parameter']},{result['value']},{result['stage']},{result['ms']},{result['peak_kb']}",
+                      flush=True)
+    else:
+        print("usage: benchmark.py command [options]")
+        print("command is one of 'load', 'parse', 'values', 'scaling'")
+        print("'load [repeats]' times ContractParser.load with and without format detection on the files in examples/.")
+        print("'parse [repeats]' times GraphParser.parse with and without the triple index on generated policies.")
+        print("'values [repeats]' times get_values_from_constraints with and without SPARQL on generated policies.")
+        print("'scaling [repeats] [--json] [--json-ld]' generates synthetic policies with PolicyGenerator, varying one "
+              "parameter at a time, and reports the runtime and peak memory of each stage as CSV, or JSON with --json. "
+              "--json-ld generates JSON-LD files instead of Turtle.")
@@ -1,34 +1,65 @@
+import atexit
+import json
 import sys
 
+import Instrumentation
 import Utils
 from ContractParser import ContractParser
 from GraphParser import GraphParser
+from PolicyCache import PolicyCache
 from PolicyComparer import PolicyComparer
 
 if __name__ == '__main__':
     args = sys.argv[1:]
     out_file = None
+    mode = "grid"
+    if "-m" in args:
+        mode_index = args.index("-m")
+        if len(args) > mode_index + 1:
+            mode = args[mode_index + 1]
+        args = args[0:mode_index] + args[mode_index + 2:]
+    if "--stats" in args:
+        # Dump the stage times and counters of the command as JSON to stderr, when it exits.
+        stats = Instrumentation.PipelineStats()
+        Instrumentation.add_hook(stats)
+        atexit.register(lambda: print(json.dumps(stats.to_dict(), indent=2), file=sys.stderr))
+        args.remove("--stats")
+    if "-c" in args:
+        cache_index = args.index("-c")
+        if len(args) > cache_index + 1:
+            PolicyCache.enable(args[cache_index + 1])
+        args = args[0:cache_index] + args[cache_index + 2:]
     if "-f" in args:
-        args = args[0:args.index("-f")]
-        if len(args) > args.index("-f"):
-            out_args = args[args.index("-f") + 1]
+        out_index = args.index("-f")
+        if len(args) > out_index + 1:
+            out_file = args[out_index + 1]
+        args = args[0:out_index] + args[out_index + 2:]
     if len(args) < 1:
         print("No command specified.")
-        print("usage: command file1 [file2...] [-f out_file] ")
-        print("command is one of 'normalise', 'normalise_prohibitions', 'compare'")
+        print("usage: command file1 [file2...] [-f out_file] [-m grid|box] [-c cache_dir] [--stats]")
+        print("command is one of 'normalise', 'normalise_prohibitions', 'compare', 'compare-matrix', 'serve'")
         print("'normalise' requires exactly one argument. This will normalise simple and logical constraints, but will not split intervals or remove prohibitions. ")
         print("'normalise_prohibitions' requires at least one file. This will normalise, split intervals and remove prohibitions that match permissions.")
         print("'compare' requires exactly 2 arguments. This will compute the overlap between the two policies and two-way containment.")
+        print("'compare-matrix' requires at least 2 arguments. This will compute containment and equivalence between every pair of policies.")
+        print("'serve' takes an optional port or Unix socket path, and an optional directory of policies that clients can register by path. This will answer requests to normalise and compare policies that are kept in memory.")
+        print("'-m box' compares normalised rules as boxes of intervals instead of splitting them into a grid of cells.")
+        print("'-c cache_dir' stores parsed and normalised policies in cache_dir, and reuses them for files whose content did not change.")
+        print("'--stats' prints the time of each stage and counters such as clauses and split cells as JSON to stderr.")
         sys.exit(1)
     if args[0] == 'normalise':
         if len(args) < 2:
             print("No file specified")
             sys.exit(1)
-        contract_parser = ContractParser()
-        contract_parser.load(args[1])
-        graph_parser = GraphParser(contract_parser.contract_graph)
-        policy = graph_parser.parse()
-        normal_policy = policy.normalise()
+        cache = PolicyCache.default()
+        if cache is not None:
+            normal_policy = cache.load(args[1])[2]
+        else:
+            contract_parser = ContractParser()
+            contract_parser.load(args[1])
+            graph_parser = GraphParser(contract_parser.contract_graph)
+            policy = graph_parser.parse()
+            normal_policy = policy.normalise()
         if out_file is None:
             print(normal_policy)
         else:
@@ -39,22 +70,28 @@ if __name__ == '__main__':
                 print(normal_policy)
         sys.exit(0)
     elif args[0] == 'normalise_prohibitions':
-        args = sys.argv[2:]
         if len(args) < 2:
             print("No file(s) specified")
             sys.exit(1)
-        contract_parser = ContractParser()
-        contract_parser.load(args[1])
-        values_per_constraints = contract_parser.get_values_from_constraints()
-        graph_parser = GraphParser(contract_parser.contract_graph)
-        policy = graph_parser.parse()
-        normal_policy = policy.normalise()
+        cache = PolicyCache.default()
+        if cache is not None:
+            values_per_constraints, policy, normal_policy = cache.load(args[1])
+        else:
+            contract_parser = ContractParser()
+            contract_parser.load(args[1])
+            values_per_constraints = contract_parser.get_values_from_constraints()
+            graph_parser = GraphParser(contract_parser.contract_graph)
+            policy = graph_parser.parse()
+            normal_policy = policy.normalise()
         if len(args) > 2:
             for file in args[2:]:
-                contract_parser = ContractParser()
-                contract_parser.load(file)
-                values_per_constraints = Utils.merge_key_multisets(values_per_constraints,
-                                                                   contract_parser.get_values_from_constraints())
+                if cache is not None:
+                    file_values = cache.load(file)[0]
+                else:
+                    contract_parser = ContractParser()
+                    contract_parser.load(file)
+                    file_values = contract_parser.get_values_from_constraints()
+                values_per_constraints = Utils.merge_key_multisets(values_per_constraints, file_values)
             normal_policy = normal_policy.split_intervals(values_per_constraints)
         if out_file is None:
             print(normal_policy)
@@ -69,16 +106,54 @@ if __name__ == '__main__':
         if len(args) < 3:
             print("Not enough arguments")
             sys.exit(1)
-        comparer = PolicyComparer.compare(args[1], args[2])
+        comparer = PolicyComparer.compare(args[1], args[2], mode=mode)
         print(f"Number of overlapping permissions: {len(comparer[0])}")
         print(f"Is (1) contained in (2)? {comparer[1]}")
         print(f"Is (2) contained in (1)? {comparer[2]}")
         print(f"Are (1) and (2) equivalent? {comparer[1] and comparer[2]}")
         sys.exit(0)
+    elif args[0] == 'compare-matrix':
+        if len(args) < 3:
+            print("Not enough arguments")
+            sys.exit(1)
+        files = args[1:]
+        matrix = PolicyComparer.compare_matrix(files, mode=mode)
+        for i, file in enumerate(files):
+            print(f"({i}) {file}")
+        header = " ".join(f"{j:>3}" for j in range(len(files)))
+        print("Is (row) contained in (column)?")
+        print(f"    {header}")
+        for i in range(len(files)):
+            print(f"{i:>3} " + " ".join(f"{'T' if matrix[i][j] else 'F':>3}" for j in range(len(files))))
+        print("Are (row) and (column) equivalent?")
+        print(f"    {header}")
+        for i in range(len(files)):
+            print(f"{i:>3} " + " ".join(f"{'T' if matrix[i][j] and matrix[j][i] else 'F':>3}"
+                                        for j in range(len(files))))
+        sys.exit(0)
+    elif args[0] == 'serve':
+        from PolicyServer import DEFAULT_ADDRESS, PolicyServer
+        address = DEFAULT_ADDRESS
+        if len(args) > 1:
+            address = (DEFAULT_ADDRESS[0], int(args[1])) if args[1].isdigit() else args[1]
+        server = PolicyServer(address, root=args[2] if len(args) > 2 else None)
+        print(f"Serving policies on {server.address}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+        sys.exit(0)
     else:
         print("No valid command specified.")
-    print("usage: command file1 [file2...] [-f out_file] ")
-    print("command is one of 'normalise', 'normalise_prohibitions', 'compare'")
+    print("usage: command file1 [file2...] [-f out_file] [-m grid|box] [-c cache_dir] [--stats]")
+    print("command is one of 'normalise', 'normalise_prohibitions', 'compare', 'compare-matrix', 'serve'")
     print("'normalise' requires exactly one argument. This will normalise simple and logical constraints, but will not split intervals or remove prohibitions. ")
     print("'normalise_prohibitions' requires at least one file. This will normalise, split intervals and remove prohibitions that match permissions.")
     print("'compare' requires exactly 2 arguments. This will compute the overlap between the two policies and two-way containment.")
+    print("'compare-matrix' requires at least 2 arguments. This will compute containment and equivalence between every pair of policies.")
+    print("'serve' takes an optional port or Unix socket path, and an optional directory of policies that clients can register by path. This will answer requests to normalise and compare policies that are kept in memory.")
+    print("'-m box' compares normalised rules as boxes of intervals instead of splitting them into a grid of cells.")
+    print("'-c cache_dir' stores parsed and normalised policies in cache_dir, and reuses them for files whose content did not change.")
+    print("'--stats' prints the time of each stage and counters such as clauses and split cells as JSON to stderr.")
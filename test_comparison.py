@@ -0,0 +1,172 @@
+"""
+Description: Pins the results of comparing the example policies in grid and box mode, and through ComparisonSession,
+and checks that DecisionIndex decides requests to the example policies as PolicyEvaluator does.
+
+Contributors:
+
+"""
+import math
+import os
+import random
+import unittest
+
+from ComparisonSession import ComparisonSession
+from Constraint import Constraint
+from DecisionIndex import DecisionIndex
+from JsonPolicyParser import JsonPolicyParser
+from PolicyComparer import PolicyComparer
+from PolicyEvaluator import PolicyEvaluator
+import Utils
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+# The examples with string constants cannot be compared with the others, and the largest ones
+# (simple_permissions.ttl and simple_permissions+prohibition*.ttl) take seconds to split against each other.
+FILES = ["example_valid.json", "example_valid_2.json", "force_policy2.ttl", "force_request1.ttl", "force_request2.ttl",
+         "simple_permissionsA.ttl", "simple_permissionsAp.ttl", "simple_permissionsB.ttl", "simple_permissionsBp.ttl",
+         "simple_policy_0.ttl", "simple_policy_1.ttl"]
+POLICIES = FILES + ["simple_permissions.ttl", "simple_permissions+prohibition.ttl",
+                    "simple_permissions+prohibition_2.ttl"]
+
+# Grid containment: the character j of the row of file i is T if policy i is contained in policy j.
+GRID_CONTAINED = {
+    "example_valid.json": "TTFFFFFFFFF",
+    "example_valid_2.json": "TTFFFFFFFFF",
+    "force_policy2.ttl": "TTTTTTTTTTT",
+    "force_request1.ttl": "FFFTFFFFFFF",
+    "force_request2.ttl": "FFFFTFFFFFF",
+    "simple_permissionsA.ttl": "FFFFFTFTTFF",
+    "simple_permissionsAp.ttl": "TTTTTTTTTTT",
+    "simple_permissionsB.ttl": "FFFFFTFTTFF",
+    "simple_permissionsBp.ttl": "FFFFFTFTTFF",
+    "simple_policy_0.ttl": "FFFFFFFFFTT",
+    "simple_policy_1.ttl": "FFFFFFFFFTT",
+}
+
+# Pairs (policy i, policy j) on which box containment differs from grid containment, with the box result. The grid
+# splits each constraint of a rule separately and keeps the union of their cells, so a rule with several constraints
+# covers more cells than their conjunction, which the box intersects. E.g. simple_policy_1 constrains its permission
+# to 59 <= hasJurisdiction <= 93, whose cells in the grid are those of hasJurisdiction > 59 or < 93, so it is
+# equivalent to the unconstrained simple_policy_0 in the grid but not as boxes. The prohibitions of
+# simple_permissionsAp likewise cover all its permissions in the grid, so it is contained in every policy.
+BOX_DIFFERENCES = {
+    ("simple_permissionsA.ttl", "simple_permissionsBp.ttl"): False,
+    ("simple_permissionsAp.ttl", "example_valid.json"): False,
+    ("simple_permissionsAp.ttl", "example_valid_2.json"): False,
+    ("simple_permissionsAp.ttl", "force_policy2.ttl"): False,
+    ("simple_permissionsAp.ttl", "force_request1.ttl"): False,
+    ("simple_permissionsAp.ttl", "force_request2.ttl"): False,
+    ("simple_permissionsAp.ttl", "simple_permissionsA.ttl"): False,
+    ("simple_permissionsAp.ttl", "simple_permissionsB.ttl"): False,
+    ("simple_permissionsAp.ttl", "simple_policy_0.ttl"): False,
+    ("simple_permissionsAp.ttl", "simple_policy_1.ttl"): False,
+    ("simple_permissionsB.ttl", "simple_permissionsBp.ttl"): False,
+    ("simple_permissionsBp.ttl", "simple_permissionsA.ttl"): False,
+    ("simple_permissionsBp.ttl", "simple_permissionsAp.ttl"): True,
+    ("simple_permissionsBp.ttl", "simple_permissionsB.ttl"): False,
+    ("simple_policy_0.ttl", "simple_policy_1.ttl"): False,
+}
+
+
+def path(file):
+    return os.path.join(EXAMPLES, file)
+
+
+def grid_contained(file1, file2):
+    return GRID_CONTAINED[file1][FILES.index(file2)] == "T"
+
+
+def conjunctive(normal_policy):
+    # The constraints of each rule as a single conjunction, which the grid splits as the box intersects them.
+    for rule in normal_policy.permission + normal_policy.prohibition:
+        if len(rule.constraint) > 1:
+            rule.constraint = [Constraint.create(operator="and", constraints=rule.constraint)]
+    return normal_policy
+
+
+def requests(policy, value_map, size, seed):
+    # Requests with the constants of the policy, values between and around them, and missing values (NaN), and the
+    # actions, targets and assignees of its rules or others.
+    rng = random.Random(seed)
+    # A left operand that no rule constrains, which also gives the size of the batch.
+    values = {"http://example.com/other": [float(rng.randrange(10)) for _ in range(size)]}
+    for key, constants in value_map.items():
+        candidates = [math.nan, min(constants) - 1, max(constants) + 1]
+        for constant in constants:
+            candidates += [constant, constant + 0.5]
+        values[key] = [float(rng.choice(candidates)) for _ in range(size)]
+    rules = policy.permission + policy.prohibition
+    columns = []
+    for name in ("action", "target", "assignee"):
+        identifiers = sorted({str(item.value) for rule in rules for item in getattr(rule, name)})
+        columns.append([rng.choice(identifiers + ["http://example.com/other"]) for _ in range(size)])
+    return values, columns
+
+
+class ComparisonTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loaded = {file: JsonPolicyParser.parse_file(path(file)) for file in POLICIES}
+
+    def value_map(self, file1, file2):
+        return Utils.merge_key_multisets(dict(self.loaded[file1][0]), self.loaded[file2][0])
+
+    def test_grid(self):
+        for file1 in FILES:
+            for file2 in FILES:
+                with self.subTest(file1=file1, file2=file2):
+                    overlap, contained1, contained2 = PolicyComparer.compare(path(file1), path(file2))
+                    self.assertEqual((contained1, contained2),
+                                     (grid_contained(file1, file2), grid_contained(file2, file1)))
+
+    def test_box(self):
+        for file1 in FILES:
+            for file2 in FILES:
+                with self.subTest(file1=file1, file2=file2):
+                    overlap, contained1, contained2 = PolicyComparer.compare(path(file1), path(file2), mode="box")
+                    self.assertEqual(contained1, BOX_DIFFERENCES.get((file1, file2), grid_contained(file1, file2)))
+                    self.assertEqual(contained2, BOX_DIFFERENCES.get((file2, file1), grid_contained(file2, file1)))
+
+    def test_grid_of_conjunctions_is_box(self):
+        for file1 in FILES:
+            for file2 in FILES:
+                with self.subTest(file1=file1, file2=file2):
+                    normal_policy1 = self.loaded[file1][1].normalise()
+                    normal_policy2 = self.loaded[file2][1].normalise()
+                    box = PolicyComparer.compare_normal_policies(normal_policy1, normal_policy2, {}, "box")
+                    grid = PolicyComparer.compare_normal_policies(conjunctive(normal_policy1),
+                                                                  conjunctive(normal_policy2),
+                                                                  self.value_map(file1, file2))
+                    self.assertEqual(grid[1:], box[1:])
+                    self.assertEqual(len(grid[0]) > 0, len(box[0]) > 0)
+
+    def test_session(self):
+        for file1 in FILES:
+            for file2 in FILES:
+                with self.subTest(file1=file1, file2=file2):
+                    overlap, contained1, contained2 = ComparisonSession.from_files(path(file1), path(file2)).compare()
+                    self.assertEqual((contained1, contained2),
+                                     (grid_contained(file1, file2), grid_contained(file2, file1)))
+                    self.assertEqual({rule.canonical_key() for rule in overlap},
+                                     {rule.canonical_key() for rule in PolicyComparer.compare(path(file1),
+                                                                                              path(file2))[0]})
+
+    def test_decision_index(self):
+        for seed, file in enumerate(POLICIES):
+            with self.subTest(file=file):
+                value_map, policy = self.loaded[file]
+                normal_policy = policy.normalise()
+                evaluator = PolicyEvaluator(normal_policy)
+                index = DecisionIndex.compile(normal_policy, value_map)
+                values, columns = requests(normal_policy, value_map, 200, seed)
+                for checked in ((True, True, True), (True, True, False), (True, False, False), (False, False, False)):
+                    request_columns = [column if check else None for column, check in zip(columns, checked)]
+                    permit, deny = evaluator.evaluate(values, *request_columns)
+                    for i in range(200):
+                        request = {key: column[i] for key, column in values.items()}
+                        identifiers = [None if column is None else column[i] for column in request_columns]
+                        self.assertEqual(index.decide(request, *identifiers), bool(permit[i]))
+                        self.assertEqual(index.denies(request, *identifiers), bool(deny[i]))
+
+
+if __name__ == '__main__':
+    unittest.main()
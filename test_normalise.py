@@ -0,0 +1,45 @@
+"""
+Description: Checks the normalisation of rules whose constraints cannot be satisfied, whose clauses are all pruned.
+
+Contributors:
+
+"""
+import unittest
+
+from Constraint import Constraint, ODRL_IRI
+from Policy import Permission, Policy, Prohibition
+
+COUNT = ODRL_IRI + "count"
+
+
+def count(operator, value):
+    return Constraint.create(leftOperand=COUNT, operator=ODRL_IRI + operator, rightOperand=value)
+
+
+def unsatisfiable():
+    # count = 3 and (count = 1 or count < 2): every clause of the DNF is pruned.
+    return Constraint.create(operator="and", constraints=[
+        count("eq", 3), Constraint.create(operator="or", constraints=[count("eq", 1), count("lt", 2)])])
+
+
+class NormaliseTest(unittest.TestCase):
+    def test_unsatisfiable_rules_have_no_normalised_rules(self):
+        for rule_type in (Permission, Prohibition):
+            with self.subTest(rule_type=rule_type.__name__):
+                self.assertEqual(rule_type(constraint=[unsatisfiable()]).normalise(), [])
+
+    def test_split_intervals_after_pruning(self):
+        policy = Policy(uid=None, type=None,
+                        permission=[Permission(constraint=[unsatisfiable()]), Permission(constraint=[count("gt", 1)])],
+                        prohibition=[Prohibition(constraint=[unsatisfiable()])])
+        normal_policy = policy.normalise()
+        self.assertEqual((len(normal_policy.permission), len(normal_policy.prohibition)), (1, 0))
+        split_policy = normal_policy.split_intervals({COUNT: [1, 2, 3]})
+        self.assertEqual(split_policy.prohibition, [])
+        for permission in split_policy.permission:
+            for constraint in permission.constraint:
+                self.assertEqual(constraint.leftOperand, COUNT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Description: Checks that ComparisonSession gives the same results as a fresh PolicyComparer.compare of its policies
+after rules are added and removed.
+
+Contributors:
+
+"""
+import json
+import os
+import tempfile
+import unittest
+
+from ComparisonSession import ComparisonSession
+from Instrumentation import PipelineStats
+from JsonPolicyParser import JsonPolicyParser
+from Policy import Permission, Policy, Prohibition
+from PolicyComparer import PolicyComparer
+
+ODRL_CONTEXT = "http://www.w3.org/ns/odrl.jsonld"
+COUNT = "http://www.w3.org/ns/odrl/2/count"
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+EXAMPLE_PAIRS = [("simple_permissionsA.ttl", "simple_permissionsB.ttl"),
+                 ("simple_permissionsAp.ttl", "simple_permissionsBp.ttl"),
+                 ("simple_policy_0.ttl", "simple_policy_1.ttl"),
+                 ("force_policy2.ttl", "force_request2.ttl"),
+                 ("example_valid.json", "example_valid_2.json")]
+
+
+def permission(*constraints):
+    return {"target": "http://example.com/asset", "action": "use",
+            "constraint": [{"leftOperand": left_operand, "operator": operator, "rightOperand": right_operand}
+                           for left_operand, operator, right_operand in constraints]}
+
+
+def document(uid, *permissions):
+    return {"@context": ODRL_CONTEXT, "@type": "Set", "uid": uid, "permission": list(permissions)}
+
+
+def compare_policies(policy1, policy2):
+    # A fresh grid comparison, with the constants of both policies.
+    value_map = dict()
+    for policy in (policy1, policy2):
+        for key, values in policy.get_values_from_constraints().items():
+            value_map[key] = sorted(set(value_map.get(key, [])) | set(values))
+    return result_keys(PolicyComparer.compare_normal_policies(policy1.normalise(), policy2.normalise(), value_map))
+
+
+def result_keys(result):
+    overlap, contained1, contained2 = result
+    return {rule.canonical_key() for rule in overlap}, contained1, contained2
+
+
+class ComparisonSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, *documents):
+        files = []
+        for i, doc in enumerate(documents):
+            file = os.path.join(self.directory.name, f"policy_{i}.json")
+            with open(file, "w") as f:
+                json.dump(doc, f)
+            files.append(file)
+        return files
+
+    def fresh_compare(self, document1, document2):
+        return result_keys(PolicyComparer.compare(*self.write(document1, document2)))
+
+    def test_remove_rule_keeps_shared_constants(self):
+        p1 = document("http://example.com/p1", permission(("count", "gt", 0)))
+        first = permission(("count", "gt", 0), ("count", "lt", 5))
+        second = permission(("count", "gteq", 5))
+        p2 = document("http://example.com/p2", first, second)
+        session = ComparisonSession.from_files(*self.write(p1, p2))
+        self.assertEqual(result_keys(session.compare()), self.fresh_compare(p1, p2))
+        self.assertEqual(len(session.compare()[0]), 3)
+
+        removed = session.rule(session.handles(2)[1])
+        session.remove_rule(session.handles(2)[1])
+        self.assertEqual(session.split_points[COUNT], [0, 5])
+        self.assertEqual(result_keys(session.compare()),
+                         self.fresh_compare(p1, document("http://example.com/p2", first)))
+
+        session.add_rule(2, removed)
+        self.assertEqual(result_keys(session.compare()), self.fresh_compare(p1, p2))
+
+    def test_removing_a_constant_only_splits_affected_rules(self):
+        p1 = document("http://example.com/p1", permission(("count", "lt", 3)), permission(("count", "gt", 10)))
+        p2 = document("http://example.com/p2", permission(("count", "lt", 3)))
+        session = ComparisonSession(JsonPolicyParser(p1).parse(), JsonPolicyParser(p2).parse())
+        handle = session.add_rule(2, JsonPolicyParser(document("http://example.com/p3", permission(
+            ("count", "gt", 10), ("count", "lt", 20)))).parse().permission[0])
+        self.assertEqual(session.split_points[COUNT], [3, 10, 20])
+        # Only the rule whose intervals contain 20 is split again: count > 10.
+        with PipelineStats() as stats:
+            session.remove_rule(handle)
+        self.assertEqual(stats.counters["resplit_rules"], 1)
+        self.assertEqual(result_keys(session.compare()), self.fresh_compare(p1, p2))
+
+    def test_invalid_handles_leave_the_session_unchanged(self):
+        p1 = document("http://example.com/p1", permission(("count", "gt", 0)))
+        p2 = document("http://example.com/p2", permission(("count", "gt", 0), ("count", "lt", 5)),
+                      permission(("count", "gteq", 5)))
+        session = ComparisonSession.from_files(*self.write(p1, p2))
+        handles = session.handles(2)
+        with self.assertRaises(KeyError):
+            session.remove_rules([handles[0], max(session.handles(1) + handles) + 1])
+        with self.assertRaises(ValueError):
+            session.remove_rules([handles[1], handles[1]])
+        self.assertEqual(session.handles(2), handles)
+        self.assertEqual(session.split_points[COUNT], [0, 5])
+        self.assertEqual(result_keys(session.compare()), self.fresh_compare(p1, p2))
+
+    def test_examples_after_removing_and_adding_rules(self):
+        for file1, file2 in EXAMPLE_PAIRS:
+            path1 = os.path.join(EXAMPLES, file1)
+            path2 = os.path.join(EXAMPLES, file2)
+            with self.subTest(file1=file1, file2=file2):
+                session = ComparisonSession.from_files(path1, path2)
+                expected = result_keys(PolicyComparer.compare(path1, path2))
+                self.assertEqual(result_keys(session.compare()), expected)
+                policy1 = JsonPolicyParser.parse_file(path1)[1]
+                for handle in session.handles(2):
+                    rule = session.rule(handle)
+                    session.remove_rule(handle)
+                    rules2 = [session.rule(h) for h in session.handles(2)]
+                    policy2 = Policy(uid=None, type=None,
+                                     permission=[r for r in rules2 if isinstance(r, Permission)],
+                                     prohibition=[r for r in rules2 if isinstance(r, Prohibition)])
+                    self.assertEqual(result_keys(session.compare()), compare_policies(policy1, policy2))
+                    session.add_rule(2, rule)
+                    self.assertEqual(result_keys(session.compare()), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Description: Checks that policies round-trip exactly through their dictionary form, snapshots and pickle, including
+operands and refinable properties that are lists, sets or dictionaries.
+
+Contributors:
+
+"""
+import json
+import pickle
+import unittest
+
+from rdflib import Literal, URIRef
+
+from Constraint import ArithmeticConstraint, Constraint, ODRL_IRI, Operator
+from Policy import Permission, Policy, Prohibition
+from Refinables import Action, AssetCollection
+
+EXAMPLE = "http://example.com/"
+
+
+def policy():
+    constraints = [ArithmeticConstraint(EXAMPLE + "purpose", Operator.IS_ANY_OF, ["a", "b"]),
+                   ArithmeticConstraint(EXAMPLE + "region", Operator.IS_NONE_OF, {URIRef(EXAMPLE + "eu"), 3}),
+                   ArithmeticConstraint(EXAMPLE + "pair", Operator.EQ, (1, 2.5)),
+                   ArithmeticConstraint(EXAMPLE + "options", Operator.EQ, {"key": [Literal("v", lang="en")]})]
+    action = Action(value=URIRef(ODRL_IRI + "use"), refinement=[], names=["x", 1], flags={"y": (True, None)})
+    target = AssetCollection(value=URIRef(EXAMPLE + "asset"), tags={"t1", "t2"})
+    return Policy(uid=URIRef(EXAMPLE + "policy"), type=None,
+                  permission=[Permission(action=[action], target=[target], constraint=constraints),
+                              Permission(action=[action], constraint=[
+                                  Constraint.create(operator="or", constraints=constraints[:2])])],
+                  prohibition=[Prohibition(action=[action], target=[target], constraint=constraints[2:])])
+
+
+def rule_terms(rule):
+    return ([(constraint.leftOperand, constraint.operator, constraint.rightOperand) if
+             isinstance(constraint, ArithmeticConstraint) else
+             [(c.leftOperand, c.operator, c.rightOperand) for c in constraint.constraints]
+             for constraint in rule.constraint],
+            [(refinable.value, refinable.other) for refinable in rule.action + rule.target])
+
+
+class SnapshotTest(unittest.TestCase):
+    def assertSamePolicy(self, decoded, original):
+        for rules, original_rules in ((decoded.permission, original.permission),
+                                      (decoded.prohibition, original.prohibition)):
+            self.assertEqual(len(rules), len(original_rules))
+            for rule, original_rule in zip(rules, original_rules):
+                self.assertEqual(rule_terms(rule), rule_terms(original_rule))
+                for constraint, original_constraint in zip(rule.constraint, original_rule.constraint):
+                    if isinstance(constraint, ArithmeticConstraint):
+                        self.assertIs(type(constraint.rightOperand), type(original_constraint.rightOperand))
+
+    def test_dictionary(self):
+        original = policy()
+        data = json.loads(json.dumps(original.to_dict()))
+        self.assertSamePolicy(Policy.from_dict(data), original)
+
+    def test_snapshot(self):
+        original = policy()
+        self.assertSamePolicy(Policy.from_snapshot(original.to_snapshot()), original)
+
+    def test_pickle(self):
+        original = policy()
+        self.assertSamePolicy(pickle.loads(pickle.dumps(original)), original)
+
+    def test_terms_only_refer_to_earlier_terms(self):
+        for index, entry in enumerate(policy().to_dict()["terms"]):
+            if isinstance(entry, list) and entry[0] in ("list", "tuple", "set", "frozenset"):
+                self.assertTrue(all(element < index for element in entry[1]))
+            elif isinstance(entry, list) and entry[0] == "dict":
+                self.assertTrue(all(key < index and value < index for key, value in entry[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()